@@ -0,0 +1,217 @@
+import copy
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple
+
+from change_events import ChangeEvent
+from rows import Row, to_row
+from writes import format_value, key_attribute_of
+
+logger = logging.getLogger(__name__)
+
+# the types an account row is built from, a change of any of them refreshes the
+# affected rows; the variables of the contract query are named after the types
+VIEW_TYPES = ["account", "contract", "bank", "person"]
+
+
+class AccountView(object):
+    """
+    Materialised view of the accounts of the user: every row holds the attributes of
+    the account together with its bank (provider) and owner (customer), so listing
+    the accounts is a read of the view instead of a query joining account, contract,
+    bank and person.
+
+    The view is built by one contract query on first use and kept up to date by the
+    change events: a change of a single account, contract, bank or person only
+    queries the contracts of that thing again, a change of several things of one of
+    those types rebuilds the view. The changes are applied before the next read, so
+    the event bus is never blocked by a query: the changes are recorded under a
+    lock of their own, which is not held during queries.
+    """
+
+    def __init__(
+        self,
+        execute_contract_query: Callable[[Text], List[Dict[Text, Any]]],
+        sort: Callable[[List[Dict[Text, Any]]], List[Dict[Text, Any]]],
+    ):
+        """
+        :param execute_contract_query: function executing a contract query of the
+                                       user, restricted by the given graql clause
+                                       (empty to get all contracts)
+        :param sort: function sorting the account rows (see schema.py)
+        """
+        self.execute_contract_query = execute_contract_query
+        self.sort = sort
+
+        self._rows = None
+        self._contracts = {}
+        self._listing = []
+        self._by_number = {}
+        self._lock = threading.Lock()
+
+        # changes since the last read, they are tracked once the view is built
+        self._pending = []
+        self._stale = False
+        self._tracking = False
+        self._pending_lock = threading.Lock()
+
+    def on_change(self, event: ChangeEvent):
+        """
+        Records the change, it is applied before the next read.
+        """
+        if event.thing_type is not None and event.thing_type not in VIEW_TYPES:
+            return
+
+        with self._pending_lock:
+            if not self._tracking:
+                return
+            if event.thing_type is None or event.key is None:
+                self._stale = True
+                self._pending = []
+            else:
+                self._pending.append(event)
+
+    def _to_account(self, contract: Dict[Text, Any]) -> Row:
+        return to_row(
+            "account",
+            dict(
+                contract["offer"],
+                provider=contract["provider"],
+                customer=contract["customer"],
+            ),
+        )
+
+    def _rebuild(self):
+        contracts = self.execute_contract_query("")
+
+        self._rows = {}
+        self._contracts = {}
+        for contract in contracts:
+            account = self._to_account(contract)
+            self._rows[account["account-number"]] = account
+            self._contracts[contract["identifier"]] = account["account-number"]
+        logger.debug(f"Built the account view of {len(self._rows)} accounts.")
+
+    def _affected(self, event: ChangeEvent) -> List[Text]:
+        """
+        Get the account numbers of the rows that include the changed thing.
+        """
+        key = str(event.key)
+        if event.thing_type == "account":
+            return [key] if key in self._rows else []
+        if event.thing_type == "contract":
+            return [a for c, a in self._contracts.items() if str(c) == key]
+
+        role = "provider" if event.thing_type == "bank" else "customer"
+        attribute = key_attribute_of(event.thing_type)
+        return [
+            a for a, row in self._rows.items() if str(row[role].get(attribute)) == key
+        ]
+
+    def _refresh(self, event: ChangeEvent):
+        attribute = key_attribute_of(event.thing_type)
+        contracts = self.execute_contract_query(
+            f"${event.thing_type} has {attribute} "
+            f"{format_value(attribute, event.key)};"
+        )
+
+        for account_number in self._affected(event):
+            del self._rows[account_number]
+        for identifier in [
+            c for c, a in self._contracts.items() if a not in self._rows
+        ]:
+            del self._contracts[identifier]
+
+        for contract in contracts:
+            account = self._to_account(contract)
+            self._rows[account["account-number"]] = account
+            self._contracts[contract["identifier"]] = account["account-number"]
+
+    def _get_listing(self) -> Tuple[List[Row], Dict[Text, Row]]:
+        """
+        Get the sorted accounts and the accounts by account number, after applying
+        the pending changes.
+        """
+        with self._lock:
+            with self._pending_lock:
+                self._tracking = True
+                pending, stale = self._pending, self._stale
+                self._pending, self._stale = [], False
+
+            if self._rows is not None and not stale and not pending:
+                return self._listing, self._by_number
+
+            try:
+                if self._rows is None or stale:
+                    self._rebuild()
+                else:
+                    for event in pending:
+                        self._refresh(event)
+            except Exception:
+                # the changes are applied by the next read
+                with self._pending_lock:
+                    self._pending = pending + self._pending
+                    self._stale = self._stale or stale
+                raise
+            self._listing = self.sort(list(self._rows.values()))
+            self._by_number = {str(a): row for a, row in self._rows.items()}
+            return self._listing, self._by_number
+
+    def get_entities(
+        self, attributes: Optional[List[Dict[Text, Text]]] = None, limit: int = 10
+    ) -> List[Dict[Text, Any]]:
+        """
+        Get the accounts of the user. Restrict the accounts by the provided
+        attributes, if any attributes are given.
+
+        :param attributes: list of attributes
+        :param limit: maximum number of accounts to return
+
+        :return: list of accounts
+        """
+        accounts, _ = self._get_listing()
+
+        if attributes:
+            accounts = [
+                row
+                for row in accounts
+                if all(
+                    a["key"] in row and str(row[a["key"]]) == str(a["value"])
+                    for a in attributes
+                )
+            ]
+
+        # the callers modify the returned accounts
+        return copy.deepcopy(accounts[:limit])
+
+    def get_attribute_of(
+        self, key_attribute: Text, entity: Text, attribute: Text
+    ) -> List[Any]:
+        """
+        Get the value of the given attribute for the provided account of the user.
+
+        :param key_attribute: key attribute of the account
+        :param entity: value of the key attribute
+        :param attribute: attribute of interest
+
+        :return: the value of the attribute
+        """
+        listing, by_number = self._get_listing()
+
+        if key_attribute == "account-number":
+            accounts = [by_number[str(entity)]] if str(entity) in by_number else []
+        else:
+            accounts = [
+                row
+                for row in listing
+                if key_attribute in row and str(row[key_attribute]) == str(entity)
+            ]
+
+        if len(accounts) != 1 or attribute not in accounts[0]:
+            return []
+
+        value = accounts[0][attribute]
+        # roles are not attributes, the graph database does not return them either
+        if isinstance(value, Row):
+            return []
+        return [value]
@@ -1,13 +1,175 @@
 # -*- coding: utf-8 -*-
-from typing import Text, Dict, Any, List, Union
+import functools
+import os
+from typing import Text, Dict, Any, List, Optional, Union, Callable, Tuple
 
 from rasa_sdk.events import SlotSet
 from rasa_sdk import Action, Tracker
 
+from change_events import ChangeEvent, get_event_bus
 from schema import schema
-from graph_database import GraphDatabase
+from search_index import SEARCH_FIELDS
+from fuzzy_index import FuzzyIndex, build_indexes
+from graph_database import (
+    FallbackKnowledgeBase,
+    GraphDatabase,
+    InMemoryGraph,
+    KnowledgeBase,
+)
+from profiling import profile_action
+from tracing import get_tracer, trace_action, traced
+import startup
 
+_knowledge_base = None
+_fuzzy_indexes = None
 
+
+def _optional_float(name: Text) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def _flag(name: Text) -> bool:
+    return os.environ.get(name, "false").lower() == "true"
+
+
+def _create_fallback(config: Text) -> KnowledgeBase:
+    """
+    Creates the read-only fallback of the graph database.
+
+    :param config: 'snapshot:<path>' to serve from a snapshot (see snapshot.py) or
+                   'csv:<path>' to serve the csv files with an InMemoryGraph
+    """
+    backend, _, path = config.partition(":")
+    if backend == "snapshot":
+        from snapshot import SnapshotGraph
+
+        return SnapshotGraph(path)
+    if backend == "csv":
+        return InMemoryGraph.from_csv(path or "./knowledge_base/data")
+
+    raise ValueError(f"Unknown fallback knowledge base '{config}'.")
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """
+    Get the knowledge base used by the actions. Defaults to the graph database.
+    If the environment variable KNOWLEDGE_BASE_SNAPSHOT points to a snapshot (see
+    snapshot.py), the actions serve from the snapshot instead.
+
+    The graph database is configured by the environment variables
+      GRAKN_URI                    comma separated uris of the primary grakn server
+                                   and its read replicas
+      KNOWLEDGE_BASE_TIMEOUT       deadline of every query in seconds
+      KNOWLEDGE_BASE_HEDGE_AFTER   seconds after which a query is sent a second time
+      KNOWLEDGE_BASE_CACHE_SIZE    maximum number of cached query results, they are
+                                   invalidated by the change events published by
+                                   the writes (see change_events.py)
+      KNOWLEDGE_BASE_ACCOUNT_VIEW  true to list the accounts from a materialised
+                                   view (see account_view.py)
+      KNOWLEDGE_BASE_SEARCH_INDEX  transaction search index written by
+                                   knowledge_base/migrate.py (see search_index.py)
+      KNOWLEDGE_BASE_ROLLUPS       transaction rollups written by rollups.py
+      KNOWLEDGE_BASE_COLD_STORE    directory of the archived transactions (see
+                                   cold_store.py)
+      KNOWLEDGE_BASE_SHARDS        json file of the shards the customers are
+                                   partitioned into (see sharding.py)
+      KNOWLEDGE_BASE_FALLBACK      read-only knowledge base serving the requests if
+                                   the graph database is slow or down, either
+                                   snapshot:<path> or csv:<path>
+    """
+    global _knowledge_base
+
+    if _knowledge_base is None:
+        snapshot_path = os.environ.get("KNOWLEDGE_BASE_SNAPSHOT")
+        if snapshot_path:
+            from snapshot import SnapshotGraph
+
+            _knowledge_base = SnapshotGraph(snapshot_path)
+        else:
+            options = dict(
+                timeout=_optional_float("KNOWLEDGE_BASE_TIMEOUT"),
+                hedge_after=_optional_float("KNOWLEDGE_BASE_HEDGE_AFTER"),
+                cache_size=int(os.environ.get("KNOWLEDGE_BASE_CACHE_SIZE", 0)),
+                account_view=_flag("KNOWLEDGE_BASE_ACCOUNT_VIEW"),
+                search_index=os.environ.get("KNOWLEDGE_BASE_SEARCH_INDEX"),
+                rollups=os.environ.get("KNOWLEDGE_BASE_ROLLUPS"),
+                cold_store=os.environ.get("KNOWLEDGE_BASE_COLD_STORE"),
+            )
+
+            shards = os.environ.get("KNOWLEDGE_BASE_SHARDS")
+            if shards:
+                from sharding import ShardedGraphDatabase, ShardRouter
+
+                _knowledge_base = ShardedGraphDatabase(
+                    ShardRouter.from_config(shards), **options
+                )
+            else:
+                _knowledge_base = GraphDatabase(
+                    os.environ.get("GRAKN_URI", "localhost:48555").split(","), **options
+                )
+
+            fallback = os.environ.get("KNOWLEDGE_BASE_FALLBACK")
+            if fallback:
+                _knowledge_base = FallbackKnowledgeBase(
+                    _knowledge_base, _create_fallback(fallback)
+                )
+    return _knowledge_base
+
+
+def set_knowledge_base(knowledge_base: KnowledgeBase):
+    """
+    Exchange the knowledge base used by the actions, e.g. with an InMemoryGraph.
+
+    :param knowledge_base: the knowledge base
+    """
+    global _knowledge_base, _fuzzy_indexes
+
+    _knowledge_base = knowledge_base
+    _fuzzy_indexes = None
+
+
+def _invalidate_fuzzy_indexes(event: ChangeEvent):
+    global _fuzzy_indexes
+
+    if event.thing_type in [None, "bank", "person"]:
+        _fuzzy_indexes = None
+
+
+def get_fuzzy_index(entity_type: Text) -> Optional[FuzzyIndex]:
+    """
+    Get the index of entity names for the given entity type. The indexes are built
+    from the knowledge base on first use and rebuilt after banks or people changed.
+
+    :param entity_type: entity type
+    :return: the index or None if names of that type are not indexed
+    """
+    global _fuzzy_indexes
+
+    if _fuzzy_indexes is None:
+        _fuzzy_indexes = build_indexes(get_knowledge_base())
+    return _fuzzy_indexes.get(entity_type)
+
+
+@traced()
+def resolve_entity_name(entity_type: Text, name: Text) -> Text:
+    """
+    Resolves a name detected by the NER, which might be misspelled, to the value of
+    the key attribute of the entity, e.g. 'Deutsch Bank' to 'Deutsche Bank'. This
+    avoids querying the knowledge base for entities that do not exist.
+
+    :param entity_type: entity type
+    :param name: name of the entity
+    :return: the key of the entity or the unchanged name if it cannot be resolved
+    """
+    index = get_fuzzy_index(entity_type)
+    if index is None:
+        return name
+
+    return index.lookup(name) or name
+
+
+@traced()
 def resolve_mention(tracker: Tracker) -> Text:
     """
     Resolves a mention of an entity, such as first, to the actual entity.
@@ -18,18 +180,20 @@ def resolve_mention(tracker: Tracker) -> Text:
     :param tracker: tracker
     :return: name of the actually entity
     """
-    graph_database = GraphDatabase()
+    graph_database = get_knowledge_base()
 
     mention = tracker.get_slot("mention")
     listed_items = tracker.get_slot("listed_items")
 
     if mention is not None and listed_items is not None:
-        idx = int(graph_database.map("mention-mapping", mention))
+        idx = graph_database.map("mention-mapping", mention)
 
-        if type(idx) is int and idx < len(listed_items):
-            return listed_items[idx]
+        # unknown mentions are not part of the mapping table
+        if idx is not None and int(idx) < len(listed_items):
+            return listed_items[int(idx)]
 
 
+@traced()
 def get_entity_type(tracker: Tracker) -> Text:
     """
     Get the entity type mentioned by the user. As the user may speak of an
@@ -39,11 +203,12 @@ def get_entity_type(tracker: Tracker) -> Text:
     :param tracker: tracker
     :return: entity type (same type as used in the knowledge base)
     """
-    graph_database = GraphDatabase()
+    graph_database = get_knowledge_base()
     entity_type = tracker.get_slot("entity_type")
     return graph_database.map("entity-type-mapping", entity_type)
 
 
+@traced()
 def get_attribute(tracker: Tracker) -> Text:
     """
     Get the attribute mentioned by the user. As the user may use a synonym for
@@ -53,11 +218,12 @@ def get_attribute(tracker: Tracker) -> Text:
     :param tracker: tracker
     :return: attribute (same type as used in the knowledge base)
     """
-    graph_database = GraphDatabase()
+    graph_database = get_knowledge_base()
     attribute = tracker.get_slot("attribute")
     return graph_database.map("attribute-mapping", attribute)
 
 
+@traced()
 def get_entity_name(tracker: Tracker, entity_type: Text):
     """
     Get the name of the entity the user referred to. Either the NER detected the
@@ -79,7 +245,7 @@ def get_entity_name(tracker: Tracker, entity_type: Text):
     # user named the entity
     entity_name = tracker.get_slot(entity_type)
     if entity_name:
-        return entity_name
+        return resolve_entity_name(entity_type, entity_name)
 
     # user referred to an entity by its attributes
     listed_items = tracker.get_slot("listed_items")
@@ -87,7 +253,7 @@ def get_entity_name(tracker: Tracker, entity_type: Text):
 
     if listed_items and attributes:
         # filter the listed_items by the set attributes
-        graph_database = GraphDatabase()
+        graph_database = get_knowledge_base()
         for entity in listed_items:
             key_attr = schema[entity_type]["key"]
             result = graph_database.validate_entity(
@@ -121,6 +287,50 @@ def reset_attribute_slots(slots, entity_type, tracker):
     return slots
 
 
+def _compile_accessor(key: Text) -> Callable[[Dict[Text, Any]], Text]:
+    """
+    Compiles an accessor that returns the formatted value of the (dotted) key.
+
+    :param key: the key, e.g. 'provider.name'
+    :return: function that converts an entity to the formatted value
+    """
+    path = key.split(".")
+
+    if "balance" in key or "amount" in key:
+        formatter = lambda v: f"{str(v)} €"
+    elif "date" in key:
+        formatter = lambda v: v.strftime("%d.%m.%Y (%H:%M:%S)")
+    else:
+        formatter = str
+
+    def accessor(entity):
+        for k in path:
+            entity = entity[k]
+        return formatter(entity)
+
+    return accessor
+
+
+@functools.lru_cache(maxsize=None)
+def compile_representation(
+    entity_keys: Tuple[Text, ...]
+) -> Callable[[Dict[Text, Any]], Text]:
+    """
+    Compiles a function that converts an entity to a string by concatenating the
+    values of the provided entity keys. The keys are parsed only once per set of
+    keys, e.g. per entity type.
+
+    :param entity_keys: the name of the key attributes
+    :return: function that converts an entity to a string
+    """
+    accessors = [_compile_accessor(key) for key in entity_keys]
+
+    def representation(entity):
+        return ", ".join([accessor(entity) for accessor in accessors])
+
+    return representation
+
+
 def to_str(entity: Dict[Text, Any], entity_keys: Union[Text, List[Text]]) -> Text:
     """
     Converts an entity to a string by concatenating the values of the provided
@@ -133,19 +343,7 @@ def to_str(entity: Dict[Text, Any], entity_keys: Union[Text, List[Text]]) -> Tex
     if isinstance(entity_keys, str):
         entity_keys = [entity_keys]
 
-    v_list = []
-    for key in entity_keys:
-        _e = entity
-        for k in key.split("."):
-            _e = _e[k]
-
-        if "balance" in key or "amount" in key:
-            v_list.append(f"{str(_e)} €")
-        elif "date" in key:
-            v_list.append(_e.strftime("%d.%m.%Y (%H:%M:%S)"))
-        else:
-            v_list.append(str(_e))
-    return ", ".join(v_list)
+    return compile_representation(tuple(entity_keys))(entity)
 
 
 class ActionQueryEntities(Action):
@@ -155,8 +353,10 @@ class ActionQueryEntities(Action):
     def name(self):
         return "action_query_entities"
 
+    @trace_action
+    @profile_action
     def run(self, dispatcher, tracker, domain):
-        graph_database = GraphDatabase()
+        graph_database = get_knowledge_base()
 
         # first need to know the entity type we are looking for
         entity_type = get_entity_type(tracker)
@@ -169,7 +369,19 @@ class ActionQueryEntities(Action):
         attributes = get_attributes_of_entity(entity_type, tracker)
 
         # query knowledge base
-        entities = graph_database.get_entities(entity_type, attributes)
+        # transactions are searched by their reference and category, so that
+        # partial mentions such as 'pasta' find 'Pasta Bar'
+        if (
+            entity_type == "transaction"
+            and attributes
+            and all(a["key"] in SEARCH_FIELDS for a in attributes)
+        ):
+            entities = graph_database.search_transactions(
+                " ".join(str(a["value"]) for a in attributes),
+                tracker.get_slot("account"),
+            )
+        else:
+            entities = graph_database.get_entities(entity_type, attributes)
 
         # filter out transactions that do not belong the set account (if any)
         if entity_type == "transaction":
@@ -184,29 +396,34 @@ class ActionQueryEntities(Action):
 
         # utter a response that contains all found entities
         # use the 'representation' attributes to print an entity
-        entity_representation = schema[entity_type]["representation"]
+        # the entities are already sorted by the knowledge base, the listed order
+        # and the order of 'listed_items' are the same
+        entity_representation = compile_representation(
+            tuple(schema[entity_type]["representation"])
+        )
+        entity_key = compile_representation((schema[entity_type]["key"],))
 
         dispatcher.utter_message(
             "Found the following '{}' entities:".format(entity_type)
         )
-        sorted_entities = sorted([to_str(e, entity_representation) for e in entities])
-        for i, e in enumerate(sorted_entities):
-            dispatcher.utter_message(f"{i + 1}: {e}")
+        with get_tracer().span("format_entities", count=len(entities)):
+            listed_items = []
+            for i, e in enumerate(entities):
+                dispatcher.utter_message(f"{i + 1}: {entity_representation(e)}")
+                listed_items.append(entity_key(e))
 
         # set slots
         # set the entities slot in order to resolve references to one of the found
         # entites later on
-        entity_key = schema[entity_type]["key"]
-
         slots = [
             SlotSet("entity_type", entity_type),
-            SlotSet("listed_items", list(map(lambda x: to_str(x, entity_key), entities))),
+            SlotSet("listed_items", listed_items),
         ]
 
         # if only one entity was found, that the slot of that entity type to the
         # found entity
         if len(entities) == 1:
-            slots.append(SlotSet(entity_type, to_str(entities[0], entity_key)))
+            slots.append(SlotSet(entity_type, listed_items[0]))
 
         reset_attribute_slots(slots, entity_type, tracker)
 
@@ -238,8 +455,10 @@ class ActionQueryAttribute(Action):
     def name(self):
         return "action_query_attribute"
 
+    @trace_action
+    @profile_action
     def run(self, dispatcher, tracker, domain):
-        graph_database = GraphDatabase()
+        graph_database = get_knowledge_base()
 
         # get entity type of entity
         entity_type = get_entity_type(tracker)
@@ -285,8 +504,10 @@ class ActionCompareEntities(Action):
     def name(self):
         return "action_compare_entities"
 
+    @trace_action
+    @profile_action
     def run(self, dispatcher, tracker, domain):
-        graph = GraphDatabase()
+        graph = get_knowledge_base()
 
         # get entities to compare and their entity type
         listed_items = tracker.get_slot("listed_items")
@@ -322,6 +543,8 @@ class ActionResolveEntity(Action):
     def name(self):
         return "action_resolve_entity"
 
+    @trace_action
+    @profile_action
     def run(self, dispatcher, tracker, domain):
         entity_type = tracker.get_slot("entity_type")
         listed_items = tracker.get_slot("listed_items")
@@ -340,8 +563,27 @@ class ActionResolveEntity(Action):
         # Check if NER recognized entity directly
         # (e.g. bank name was mentioned and recognized as 'bank')
         value = tracker.get_slot(entity_type)
+        if value is not None:
+            value = resolve_entity_name(entity_type, value)
         if value is not None and value in listed_items:
             return [SlotSet(entity_type, value), SlotSet("mention", None)]
 
         dispatcher.utter_template("utter_rephrase", tracker)
         return [SlotSet(entity_type, None), SlotSet("mention", None)]
+
+
+def _warm_up_tasks() -> Dict[Text, Callable]:
+    """
+    Tasks run on startup of the action server (see startup.py): opening the
+    connection, loading the mapping tables, building the fuzzy indexes and
+    running the query of the most frequent conversation, i.e. listing the banks.
+    """
+    return {
+        "knowledge_base": lambda: get_knowledge_base().warm_up(),
+        "fuzzy_indexes": lambda: get_fuzzy_index("bank"),
+        "list_banks": lambda: get_knowledge_base().get_entities("bank", []),
+    }
+
+
+get_event_bus().subscribe(_invalidate_fuzzy_indexes)
+startup.start(_warm_up_tasks)
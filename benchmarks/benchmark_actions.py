@@ -0,0 +1,138 @@
+import argparse
+import tempfile
+from typing import Any, Dict, List, Text
+
+from rasa_sdk import Tracker
+from rasa_sdk.executor import CollectingDispatcher
+
+import actions
+from benchmarks.utils import generate_data, measure, print_results
+from graph_database import GraphDatabase, InMemoryGraph
+
+# (name, action, slots) triples that resemble the conversations in data/stories.md
+SCENARIOS = [
+    ("list banks", actions.ActionQueryEntities(), {"entity_type": "banks"}),
+    ("list accounts", actions.ActionQueryEntities(), {"entity_type": "accounts"}),
+    ("list cards", actions.ActionQueryEntities(), {"entity_type": "cards"}),
+    (
+        "list transactions",
+        actions.ActionQueryEntities(),
+        {"entity_type": "transactions"},
+    ),
+    (
+        "attribute of named bank",
+        actions.ActionQueryAttribute(),
+        {"entity_type": "bank", "bank": "N26", "attribute": "HQ"},
+    ),
+    (
+        "attribute of mentioned bank",
+        actions.ActionQueryAttribute(),
+        {
+            "entity_type": "bank",
+            "mention": "first",
+            "listed_items": ["N26", "bunq", "DKB"],
+            "attribute": "country",
+        },
+    ),
+    (
+        "compare banks",
+        actions.ActionCompareEntities(),
+        {
+            "entity_type": "banks",
+            "listed_items": ["N26", "bunq", "DKB"],
+            "attribute": "free accounts",
+        },
+    ),
+    (
+        "resolve mentioned bank",
+        actions.ActionResolveEntity(),
+        {
+            "entity_type": "bank",
+            "mention": "second",
+            "listed_items": ["N26", "bunq", "DKB"],
+        },
+    ),
+]
+
+
+def create_tracker(slots: Dict[Text, Any]) -> Tracker:
+    return Tracker("benchmark", slots, {}, [], False, None, None, None)
+
+
+def benchmark_actions(iterations: int, **labels: Any) -> List[Dict[Text, Any]]:
+    """
+    Runs every scenario end-to-end against the knowledge base currently set in
+    actions.py.
+
+    :param iterations: number of measured runs per scenario
+    :param labels: labels of the results, e.g. backend and data size
+
+    :return: benchmark results
+    """
+    results = []
+
+    for name, action, slots in SCENARIOS:
+        tracker = create_tracker(slots)
+        results.append(
+            measure(
+                f"{action.name()}: {name}",
+                lambda: action.run(CollectingDispatcher(), tracker, {}),
+                iterations,
+                **labels,
+            )
+        )
+
+    return results
+
+
+def run(
+    backend: Text,
+    sizes: List[int],
+    iterations: int,
+    uri: Text,
+    keyspace: Text,
+    output: Text = None,
+):
+    results = []
+
+    if backend == "grakn":
+        actions.set_knowledge_base(GraphDatabase(uri, keyspace))
+        results += benchmark_actions(iterations, backend=backend, size="-")
+    else:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as data_path:
+                generate_data(data_path, size)
+                actions.set_knowledge_base(InMemoryGraph.from_csv(data_path))
+                results += benchmark_actions(iterations, backend=backend, size=size)
+
+    print_results(results, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the actions end-to-end with a synthetic tracker."
+    )
+    parser.add_argument(
+        "--backend", choices=["in-memory", "grakn"], default="in-memory"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10**4, 10**5],
+        help="number of transactions (in-memory backend only)",
+    )
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--uri", default="localhost:48555")
+    parser.add_argument("--keyspace", default="banking")
+    parser.add_argument("--output", help="append results as json lines to this file")
+    args = parser.parse_args()
+
+    run(
+        args.backend,
+        args.sizes,
+        args.iterations,
+        args.uri,
+        args.keyspace,
+        args.output,
+    )
@@ -0,0 +1,140 @@
+import argparse
+import tempfile
+from typing import Any, Dict, List, Text
+
+from benchmarks.utils import generate_data, measure, print_results
+from graph_database import GraphDatabase, InMemoryGraph, KnowledgeBase
+from schema import schema
+
+
+def benchmark_knowledge_base(
+    knowledge_base: KnowledgeBase, iterations: int, **labels: Any
+) -> List[Dict[Text, Any]]:
+    """
+    Measures every method of the knowledge base.
+
+    :param knowledge_base: the knowledge base
+    :param iterations: number of measured calls per method
+    :param labels: labels of the results, e.g. backend and data size
+
+    :return: benchmark results
+    """
+    results = []
+
+    for entity_type in ["bank", "person", "account", "card", "transaction"]:
+        results.append(
+            measure(
+                f"get_entities({entity_type})",
+                lambda: knowledge_base.get_entities(entity_type, []),
+                iterations,
+                **labels,
+            )
+        )
+
+    # look up an existing entity of every type with a key attribute
+    for entity_type in ["bank", "account", "card"]:
+        entities = knowledge_base.get_entities(entity_type, [])
+        if not entities:
+            continue
+
+        key = schema[entity_type]["key"]
+        name = str(entities[0][key])
+        attribute = schema[entity_type]["attributes"][0]
+
+        results.append(
+            measure(
+                f"get_attribute_of({entity_type})",
+                lambda: knowledge_base.get_attribute_of(
+                    entity_type, key, name, attribute
+                ),
+                iterations,
+                **labels,
+            )
+        )
+        results.append(
+            measure(
+                f"validate_entity({entity_type})",
+                lambda: knowledge_base.validate_entity(
+                    entity_type,
+                    name,
+                    key,
+                    [{"key": attribute, "value": entities[0][attribute]}],
+                ),
+                iterations,
+                **labels,
+            )
+        )
+
+    for mapping_type, mapping_key in [
+        ("entity-type-mapping", "banks"),
+        ("attribute-mapping", "HQ"),
+        ("mention-mapping", "first"),
+    ]:
+        results.append(
+            measure(
+                f"map({mapping_type})",
+                lambda: knowledge_base.map(mapping_type, mapping_key),
+                iterations,
+                **labels,
+            )
+        )
+
+    return results
+
+
+def run(
+    backend: Text,
+    sizes: List[int],
+    iterations: int,
+    uri: Text,
+    keyspace: Text,
+    output: Text = None,
+):
+    results = []
+
+    if backend == "grakn":
+        # the keyspace needs to be loaded beforehand, e.g. with
+        # python knowledge_base/migrate.py --data-path <generated data>
+        results += benchmark_knowledge_base(
+            GraphDatabase(uri, keyspace), iterations, backend=backend, size="-"
+        )
+    else:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as data_path:
+                generate_data(data_path, size)
+                knowledge_base = InMemoryGraph.from_csv(data_path)
+                results += benchmark_knowledge_base(
+                    knowledge_base, iterations, backend=backend, size=size
+                )
+
+    print_results(results, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the methods of a knowledge base."
+    )
+    parser.add_argument(
+        "--backend", choices=["in-memory", "grakn"], default="in-memory"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10**4, 10**5],
+        help="number of transactions (in-memory backend only)",
+    )
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--uri", default="localhost:48555")
+    parser.add_argument("--keyspace", default="banking")
+    parser.add_argument("--output", help="append results as json lines to this file")
+    args = parser.parse_args()
+
+    run(
+        args.backend,
+        args.sizes,
+        args.iterations,
+        args.uri,
+        args.keyspace,
+        args.output,
+    )
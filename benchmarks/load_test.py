@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+import aiohttp
+import yaml
+
+from benchmarks.utils import percentile
+
+ENTITY_REGEX = re.compile(r"\[([^\]]+)\]\(([^)]+)\)")
+
+
+def load_nlu_examples(
+    nlu_file: Text,
+) -> Dict[Text, List[Tuple[Text, Dict[Text, Text]]]]:
+    """
+    Reads the training examples per intent from a markdown nlu file.
+
+    :param nlu_file: nlu file, e.g. data/nlu.md
+
+    :return: (text, entities) pairs per intent
+    """
+    examples = defaultdict(list)
+    intent = None
+
+    with open(nlu_file, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("## "):
+                header = line[3:]
+                intent = header[7:] if header.startswith("intent:") else None
+            elif intent and line.startswith("- "):
+                entities = {}
+                for value, entity in ENTITY_REGEX.findall(line):
+                    entities[entity.split(":")[0]] = value
+                text = ENTITY_REGEX.sub(lambda m: m.group(1), line[2:])
+                examples[intent].append((text, entities))
+
+    return examples
+
+
+def load_conversations(stories_file: Text) -> List[List[Tuple[Text, List[Text]]]]:
+    """
+    Reads the conversations from a markdown stories file. Only the custom actions,
+    i.e. the ones the action server runs, are kept.
+
+    :param stories_file: stories file, e.g. data/stories.md
+
+    :return: list of conversations, every turn is a pair of intent and actions
+    """
+    conversations = []
+
+    with open(stories_file, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("## "):
+                conversations.append([])
+            elif line.startswith("* "):
+                conversations[-1].append((line[2:].strip(), []))
+            elif line.startswith("- action_") and conversations[-1]:
+                conversations[-1][-1][1].append(line[2:].strip())
+
+    return [c for c in conversations if any(actions for _, actions in c)]
+
+
+class LoadTest(object):
+    """
+    Replays conversations against the webhook of an action server. Conversations
+    are started at a fixed rate (open loop), at most `concurrency` conversations
+    are in progress at the same time.
+    """
+
+    def __init__(
+        self,
+        url: Text,
+        conversations: List[List[Tuple[Text, List[Text]]]],
+        examples: Dict[Text, List[Tuple[Text, Dict[Text, Text]]]],
+        domain: Dict[Text, Any],
+        concurrency: int = 10,
+        rate: Optional[float] = None,
+        timeout: float = 10.0,
+        seed: int = 42,
+    ):
+        self.url = url
+        self.conversations = conversations
+        self.examples = examples
+        self.domain = domain
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def _action_call(
+        self, sender_id: Text, action: Text, slots: Dict[Text, Any], message
+    ) -> Dict[Text, Any]:
+        text, entities = message
+        return {
+            "next_action": action,
+            "sender_id": sender_id,
+            "tracker": {
+                "sender_id": sender_id,
+                "slots": slots,
+                "latest_message": {
+                    "text": text,
+                    "entities": [
+                        {"entity": k, "value": v} for k, v in entities.items()
+                    ],
+                },
+                "events": [],
+                "paused": False,
+                "followup_action": None,
+                "active_form": {},
+                "latest_action_name": "action_listen",
+            },
+            "domain": self.domain,
+        }
+
+    async def _run_action(self, session, action: Text, action_call) -> List[Dict]:
+        start = time.perf_counter()
+        try:
+            async with session.post(self.url, json=action_call) as response:
+                body = await response.json(content_type=None)
+                if response.status != 200:
+                    self.errors[action] += 1
+                    return []
+                return body.get("events", [])
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.errors[action] += 1
+            return []
+        finally:
+            self.latencies[action].append((time.perf_counter() - start) * 1000)
+
+    async def _run_conversation(self, session, conversation):
+        sender_id = uuid.uuid4().hex
+        slots = {}
+
+        for intent, actions in conversation:
+            if not self.examples.get(intent):
+                continue
+
+            message = self.rng.choice(self.examples[intent])
+            # the entities are stored in the slots of the same name
+            slots.update(message[1])
+
+            for action in actions:
+                action_call = self._action_call(sender_id, action, slots, message)
+                for event in await self._run_action(session, action, action_call):
+                    if event.get("event") == "slot":
+                        slots[event["name"]] = event["value"]
+
+    async def run(self, num_conversations: int) -> float:
+        """
+        Replays the given number of randomly chosen conversations.
+
+        :param num_conversations: number of conversations
+
+        :return: duration of the load test in seconds
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+        async def run_conversation(session, conversation):
+            try:
+                await self._run_conversation(session, conversation)
+            finally:
+                semaphore.release()
+
+        start = time.perf_counter()
+        async with aiohttp.ClientSession(
+            timeout=timeout, connector=connector
+        ) as session:
+            tasks = []
+            for i in range(num_conversations):
+                if self.rate:
+                    delay = start + i / self.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await semaphore.acquire()
+                conversation = self.rng.choice(self.conversations)
+                tasks.append(
+                    asyncio.ensure_future(run_conversation(session, conversation))
+                )
+            await asyncio.gather(*tasks)
+
+        return time.perf_counter() - start
+
+    def report(self, duration: float):
+        print(
+            f"{'action':<28}{'requests':>10}{'errors':>8}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        )
+
+        all_latencies = []
+        for action, latencies in sorted(self.latencies.items()):
+            all_latencies += latencies
+            print(
+                f"{action:<28}{len(latencies):>10}{self.errors[action]:>8}"
+                f"{len(latencies) / duration:>10.1f}"
+                + "".join(f"{percentile(latencies, p):>10.2f}" for p in [50, 95, 99])
+            )
+
+        if all_latencies:
+            errors = sum(self.errors.values())
+            print(
+                f"{'total':<28}{len(all_latencies):>10}{errors:>8}"
+                f"{len(all_latencies) / duration:>10.1f}"
+                + "".join(
+                    f"{percentile(all_latencies, p):>10.2f}" for p in [50, 95, 99]
+                )
+            )
+            print(f"error rate: {errors / len(all_latencies):.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay conversations against the webhook of an action server."
+    )
+    parser.add_argument("--url", default="http://localhost:5055/webhook")
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=10,
+        help="maximum number of conversations in progress",
+    )
+    parser.add_argument(
+        "--rate", type=float, help="conversations started per second (default: max)"
+    )
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--stories", default="data/stories.md")
+    parser.add_argument("--nlu", default="data/nlu.md")
+    parser.add_argument("--domain", default="domain.yml")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with open(args.domain, encoding="utf-8") as f:
+        domain = yaml.safe_load(f)
+
+    load_test = LoadTest(
+        args.url,
+        load_conversations(args.stories),
+        load_nlu_examples(args.nlu),
+        domain,
+        args.concurrency,
+        args.rate,
+        args.timeout,
+        args.seed,
+    )
+    duration = asyncio.get_event_loop().run_until_complete(
+        load_test.run(args.conversations)
+    )
+    load_test.report(duration)
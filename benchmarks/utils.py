@@ -0,0 +1,101 @@
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Text
+
+from knowledge_base.generate import generate
+
+
+def percentile(values: List[float], percentile: float) -> float:
+    """
+    Nearest-rank percentile of the given values.
+    """
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+def generate_data(data_path: Text, num_transactions: int):
+    """
+    Generates the benchmark data. The number of people and accounts grows with the
+    number of transactions.
+
+    :param data_path: directory to write the csv files to
+    :param num_transactions: number of transactions
+    """
+    num_accounts = max(26, num_transactions // 100)
+    generate(data_path, max(20, num_accounts // 2), num_accounts, num_transactions)
+
+
+def measure(
+    name: Text,
+    f: Callable[[], Any],
+    iterations: int = 100,
+    warmup: int = 5,
+    **labels: Any,
+) -> Dict[Text, Any]:
+    """
+    Calls the given function repeatedly and measures its latency.
+
+    :param name: name of the benchmark
+    :param f: function to benchmark, called without arguments
+    :param iterations: number of measured calls
+    :param warmup: number of calls before measuring
+    :param labels: additional labels of the result, e.g. the data size
+
+    :return: throughput (calls per second) and latency percentiles in ms
+    """
+    for _ in range(warmup):
+        f()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        f()
+        latencies.append((time.perf_counter() - t) * 1000)
+    total = time.perf_counter() - start
+
+    result = {"name": name}
+    result.update(labels)
+    result.update(
+        {
+            "iterations": iterations,
+            "throughput": iterations / total,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        }
+    )
+    return result
+
+
+def print_results(results: List[Dict[Text, Any]], output: Optional[Text] = None):
+    """
+    Prints the results as a table. If an output file is given, the results are
+    additionally written to it as json lines, so that runs can be compared.
+
+    :param results: benchmark results as returned by measure
+    :param output: optional file name
+    """
+    labels = [
+        k
+        for k in results[0].keys()
+        if k not in ["name", "iterations", "throughput", "p50", "p95", "p99"]
+    ]
+
+    header = f"{'benchmark':<44}"
+    header += "".join(f"{label:>14}" for label in labels)
+    header += f"{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+
+    for r in results:
+        line = f"{r['name']:<44}"
+        line += "".join(f"{str(r.get(label)):>14}" for label in labels)
+        line += f"{r['throughput']:>12.1f}"
+        line += "".join(f"{r[p]:>10.3f}" for p in ["p50", "p95", "p99"])
+        print(line)
+
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, List, Optional, Text
+
+logger = logging.getLogger(__name__)
+
+# Configures the bus change events are published to. Supported values:
+#   local                in-process only (default)
+#   file:<path>          append events as json lines to <path> and follow the
+#                        events of other processes, e.g. on a shared volume
+EVENTS_ENV = "KNOWLEDGE_BASE_EVENTS"
+
+
+class ChangeEvent(
+    namedtuple("ChangeEvent", ["thing_type", "key", "attributes", "origin"])
+):
+    """
+    Something was written to the knowledge base.
+
+    thing_type: the changed entity or relation type, None if unknown (everything
+                might have changed)
+    key: value of the key attribute of the changed thing, None if several things
+         of the type changed
+    attributes: names of the changed attributes, empty if unknown
+    origin: id of the knowledge base that wrote the change, which has applied it
+            already, None if unknown
+    """
+
+    __slots__ = ()
+
+    def __new__(
+        cls,
+        thing_type: Optional[Text] = None,
+        key: Optional[Any] = None,
+        attributes: Optional[List[Text]] = None,
+        origin: Optional[Text] = None,
+    ):
+        return super().__new__(cls, thing_type, key, tuple(attributes or ()), origin)
+
+    def to_json(self) -> Text:
+        return json.dumps(
+            {
+                "thing_type": self.thing_type,
+                "key": self.key,
+                "attributes": list(self.attributes),
+                "origin": self.origin,
+            },
+            default=str,
+        )
+
+    @classmethod
+    def from_json(cls, line: Text) -> "ChangeEvent":
+        event = json.loads(line)
+        return cls(
+            event["thing_type"], event["key"], event["attributes"], event.get("origin")
+        )
+
+
+class EventBus(object):
+    def publish(self, event: ChangeEvent):
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def subscribe(self, callback: Callable[[ChangeEvent], None]):
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def unsubscribe(self, callback: Callable[[ChangeEvent], None]):
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def close(self):
+        pass
+
+    def _dispatch(self, callbacks: List[Callable], event: ChangeEvent):
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.exception(f"Failed to handle {event}: {e}")
+
+
+class LocalEventBus(EventBus):
+    """
+    Delivers the events to the subscribers of the same process.
+    """
+
+    def __init__(self):
+        self.callbacks = []
+
+    def publish(self, event: ChangeEvent):
+        self._dispatch(self.callbacks, event)
+
+    def subscribe(self, callback: Callable[[ChangeEvent], None]):
+        self.callbacks.append(callback)
+
+    def unsubscribe(self, callback: Callable[[ChangeEvent], None]):
+        # events being dispatched keep the previous list
+        self.callbacks = [c for c in self.callbacks if c != callback]
+
+
+class FileEventBus(EventBus):
+    """
+    Appends the events as json lines to a file. Subscribers follow the file, so
+    they receive the events of all processes writing to it, including their own.
+    """
+
+    def __init__(self, path: Text, poll_interval: float = 0.2):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.callbacks = []
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def publish(self, event: ChangeEvent):
+        line = event.to_json() + "\n"
+        with self._lock:
+            # appending a single short line is atomic, even across processes
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def subscribe(self, callback: Callable[[ChangeEvent], None]):
+        self.callbacks.append(callback)
+
+        if self._thread is None:
+            # only events published from now on are delivered
+            open(self.path, "a").close()
+            offset = os.path.getsize(self.path)
+            self._start(offset)
+            # threads do not survive a fork, e.g. of pre-forked workers (see
+            # prefork.py), the child follows the file from where it is forked
+            os.register_at_fork(after_in_child=self._restart)
+
+    def unsubscribe(self, callback: Callable[[ChangeEvent], None]):
+        # events being dispatched keep the previous list
+        self.callbacks = [c for c in self.callbacks if c != callback]
+
+    def _start(self, offset: int):
+        self._thread = threading.Thread(
+            target=self._follow, args=(offset,), name="event-bus", daemon=True
+        )
+        self._thread.start()
+
+    def _restart(self):
+        self._lock = threading.Lock()
+        if not self._stopped.is_set():
+            self._start(os.path.getsize(self.path))
+
+    def _follow(self, offset: int):
+        # the last line might be incomplete, it is kept until the rest arrives
+        pending = b""
+        while not self._stopped.is_set():
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+                offset = f.tell()
+
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    event = ChangeEvent.from_json(line.decode("utf-8"))
+                    self._dispatch(self.callbacks, event)
+
+            if not data:
+                time.sleep(self.poll_interval)
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_event_bus = None
+
+
+def _create_event_bus(config: Optional[Text]) -> EventBus:
+    if not config or config == "local":
+        return LocalEventBus()
+    if config.startswith("file:"):
+        return FileEventBus(config[len("file:") :])
+
+    raise ValueError(f"Unknown event bus '{config}'.")
+
+
+def get_event_bus() -> EventBus:
+    """
+    Get the event bus of the process. The bus is configured by the environment
+    variable KNOWLEDGE_BASE_EVENTS.
+    """
+    global _event_bus
+
+    if _event_bus is None:
+        _event_bus = _create_event_bus(os.environ.get(EVENTS_ENV))
+    return _event_bus
+
+
+def publish(
+    thing_type: Optional[Text] = None,
+    key: Optional[Any] = None,
+    attributes: Optional[List[Text]] = None,
+):
+    """
+    Publishes a change event to the event bus of the process.
+    """
+    get_event_bus().publish(ChangeEvent(thing_type, key, attributes))
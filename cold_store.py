@@ -0,0 +1,390 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Set, Text
+
+import numpy as np
+
+from change_events import ChangeEvent
+from rollups import period_of
+from rows import Row, row_class
+from schema import attribute_types
+
+logger = logging.getLogger(__name__)
+
+COLD_STORE_VERSION = 1
+
+# the columns of an archived transaction, role players are stored by account number
+COLUMNS = [
+    "identifier",
+    "amount",
+    "execution-date",
+    "reference",
+    "category",
+    "account-of-creator",
+    "account-of-receiver",
+]
+ROLES = ["account-of-creator", "account-of-receiver"]
+
+
+def _account_number(account: Any) -> Text:
+    # role players are rows, the csv files reference them by their key
+    if isinstance(account, Mapping):
+        return str(account["account-number"])
+    return str(account)
+
+
+def _to_array(name: Text, values: List[Any]) -> np.ndarray:
+    datatype = "string" if name in ROLES else attribute_types.get(name, "string")
+
+    if datatype == "date":
+        return np.array(values, dtype="datetime64[us]")
+    if datatype == "double":
+        return np.asarray(values, dtype=np.float64)
+    if datatype == "long":
+        return np.asarray(values, dtype=np.int64)
+    return np.array([str(v) for v in values], dtype=str)
+
+
+class ColdStore(object):
+    """
+    Columnar store of archived transactions, partitioned by the month of their
+    execution date. Every partition is a directory of numpy arrays, strings are
+    dictionary encoded. The store records the cutoff of the archival: all
+    transactions older than the cutoff are in the store, all newer ones in the
+    graph database. A read goes through the partitions from the latest month on
+    and stops once enough transactions are found, so only the months needed are
+    read.
+    """
+
+    def __init__(self, path: Text):
+        """
+        :param path: directory of the store
+        """
+        self.path = path
+
+        self._manifest = None
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def _manifest_path(self) -> Text:
+        return os.path.join(self.path, "manifest.json")
+
+    def _get_manifest(self) -> Dict[Text, Any]:
+        if self._manifest is None:
+            if os.path.exists(self._manifest_path()):
+                with open(self._manifest_path(), encoding="utf-8") as f:
+                    manifest = json.load(f)
+                if manifest["version"] != COLD_STORE_VERSION:
+                    raise ValueError(
+                        f"Unsupported cold store version {manifest['version']}."
+                    )
+            else:
+                manifest = {
+                    "version": COLD_STORE_VERSION,
+                    "cutoff": None,
+                    "partitions": {},
+                }
+            self._manifest = manifest
+            self._partitions = {}
+        return self._manifest
+
+    @property
+    def cutoff(self) -> Optional[Text]:
+        """
+        The transactions executed before the cutoff are archived (iso date), None if
+        nothing is archived.
+        """
+        with self._lock:
+            return self._get_manifest()["cutoff"]
+
+    def on_change(self, event: ChangeEvent):
+        """
+        Reloads the manifest after an archival, which changes many transactions.
+        """
+        if event.thing_type in [None, "transaction"] and event.key is None:
+            with self._lock:
+                self._manifest = None
+
+    def _load_partition(self, month: Text) -> Dict[Text, Any]:
+        if month not in self._partitions:
+            directory = os.path.join(self.path, month)
+
+            def load(file_name):
+                return np.load(
+                    os.path.join(directory, file_name + ".npy"),
+                    mmap_mode="r",
+                    allow_pickle=False,
+                )
+
+            columns = {}
+            for name in COLUMNS:
+                if os.path.exists(os.path.join(directory, name + ".codes.npy")):
+                    columns[name] = (load(name + ".codes"), load(name + ".values"))
+                else:
+                    columns[name] = load(name)
+            self._partitions[month] = columns
+        return self._partitions[month]
+
+    def _read_partition(self, month: Text) -> Dict[Text, np.ndarray]:
+        """
+        Get the decoded columns of the partition.
+        """
+        columns = {}
+        for name, column in self._load_partition(month).items():
+            if isinstance(column, tuple):
+                codes, values = column
+                columns[name] = np.asarray(values)[codes]
+            else:
+                columns[name] = np.asarray(column)
+        return columns
+
+    def _write_partition(self, month: Text, columns: Dict[Text, np.ndarray]):
+        directory = os.path.join(self.path, month)
+        os.makedirs(directory + ".tmp", exist_ok=True)
+
+        def save(file_name, array):
+            np.save(
+                os.path.join(directory + ".tmp", file_name + ".npy"),
+                array,
+                allow_pickle=False,
+            )
+
+        for name, array in columns.items():
+            if array.dtype.kind == "U":
+                values, codes = np.unique(array, return_inverse=True)
+                save(name + ".codes", codes.astype(np.int32))
+                save(name + ".values", values)
+            else:
+                save(name, array)
+
+        # readers keep the memory maps of the files they opened
+        if os.path.exists(directory):
+            os.replace(directory, directory + ".old")
+        os.replace(directory + ".tmp", directory)
+        shutil.rmtree(directory + ".old", ignore_errors=True)
+
+    def archive(self, transactions: List[Dict[Text, Any]], cutoff: datetime.datetime):
+        """
+        Adds the transactions to the partitions of their months. Transactions that
+        are archived already are replaced, so an interrupted archival can be
+        repeated.
+
+        :param transactions: the transactions as returned by a knowledge base, all
+                             executed before the cutoff
+        :param cutoff: the cutoff of the archival
+        """
+        by_month = {}
+        for transaction in transactions:
+            month = period_of(transaction["execution-date"], "month")
+            by_month.setdefault(month, []).append(transaction)
+
+        with self._lock:
+            self._manifest = None
+            manifest = self._get_manifest()
+            os.makedirs(self.path, exist_ok=True)
+
+            for month, rows in sorted(by_month.items()):
+                columns = {
+                    name: _to_array(
+                        name,
+                        [
+                            _account_number(r[name]) if name in ROLES else r[name]
+                            for r in rows
+                        ],
+                    )
+                    for name in COLUMNS
+                }
+
+                if month in manifest["partitions"]:
+                    existing = self._read_partition(month)
+                    keep = ~np.isin(existing["identifier"], columns["identifier"])
+                    columns = {
+                        name: np.concatenate([existing[name][keep], columns[name]])
+                        for name in COLUMNS
+                    }
+
+                self._write_partition(month, columns)
+                manifest["partitions"][month] = {"rows": len(columns["identifier"])}
+
+            cutoff = cutoff.isoformat()
+            if manifest["cutoff"] is None or manifest["cutoff"] < cutoff:
+                manifest["cutoff"] = cutoff
+
+            with open(self._manifest_path() + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(self._manifest_path() + ".tmp", self._manifest_path())
+
+            self._manifest = None
+
+    def _matches(
+        self, columns: Dict[Text, Any], name: Text, value: Any, rows: int
+    ) -> np.ndarray:
+        """
+        Get a boolean mask of the rows of the partition having the given value.
+        """
+        if name not in columns:
+            return np.zeros(rows, dtype=bool)
+
+        column = columns[name]
+        if isinstance(column, tuple):
+            codes, values = column
+            code = np.searchsorted(values, str(value))
+            if code == len(values) or values[code] != str(value):
+                return np.zeros(rows, dtype=bool)
+            return np.asarray(codes) == code
+
+        try:
+            if column.dtype.kind == "M":
+                value = np.datetime64(value, "us")
+            else:
+                value = column.dtype.type(value)
+        except ValueError:
+            return np.zeros(rows, dtype=bool)
+        return np.asarray(column) == value
+
+    def _to_transaction(self, columns: Dict[Text, Any], row: int) -> Row:
+        transaction = row_class("transaction")()
+        for name, column in columns.items():
+            if isinstance(column, tuple):
+                codes, values = column
+                value = str(values[codes[row]])
+            elif column.dtype.kind == "M":
+                value = column[row].astype("datetime64[us]").item()
+            else:
+                value = column[row].item()
+
+            if name in ROLES:
+                value = row_class("account")({"account-number": value})
+            transaction[name] = value
+        return transaction
+
+    def get_transactions(
+        self,
+        accounts: Optional[Set[Text]] = None,
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Get archived transactions, latest first. The role players of an archived
+        transaction only hold their account number.
+
+        :param accounts: account numbers, only transactions created by these
+                         accounts are returned (default: all accounts)
+        :param attributes: attributes the transactions need to have
+        :param limit: maximum number of transactions to return (default: all)
+
+        :return: list of transactions
+        """
+        with self._lock:
+            months = sorted(self._get_manifest()["partitions"], reverse=True)
+
+            for a in attributes or []:
+                if a["key"] == "execution-date":
+                    # only the partition of the date can hold the transaction
+                    months = [m for m in months if m == period_of(a["value"], "month")]
+
+            transactions = []
+            for month in months:
+                if limit is not None and len(transactions) >= limit:
+                    break
+
+                columns = self._load_partition(month)
+                rows = len(columns["identifier"])
+                mask = np.ones(rows, dtype=bool)
+                if accounts is not None:
+                    codes, values = columns["account-of-creator"]
+                    mask &= np.isin(
+                        codes, np.flatnonzero(np.isin(values, list(accounts)))
+                    )
+                for a in attributes or []:
+                    mask &= self._matches(columns, a["key"], a["value"], rows)
+
+                selected = np.flatnonzero(mask)
+                # latest first, ties keep the order of the partition
+                dates = np.asarray(columns["execution-date"])[selected]
+                selected = selected[np.argsort(-dates.view(np.int64), kind="stable")]
+                transactions += [self._to_transaction(columns, r) for r in selected]
+
+            return transactions[:limit]
+
+
+def archive_transactions(
+    graph_database, store: ColdStore, older_than: datetime.timedelta
+) -> int:
+    """
+    Moves the transactions executed before now - older_than from the graph
+    database to the cold store. The transactions are written to the store before
+    they are deleted from the graph database.
+
+    :param graph_database: the graph database (see graph_database.py)
+    :param store: the cold store
+    :param older_than: minimum age of the archived transactions
+
+    :return: the number of archived transactions
+    """
+    from writes import delete_query, format_value
+
+    cutoff = datetime.datetime.combine(
+        datetime.date.today() - older_than, datetime.time()
+    )
+    transactions = graph_database._execute_transaction_query(
+        f"$transaction has execution-date < "
+        f"{format_value('execution-date', cutoff)};"
+    )
+    store.archive(transactions, cutoff)
+
+    batch_size = 500
+    futures = []
+    for start in range(0, len(transactions), batch_size):
+        queries = [
+            delete_query("transaction", t["identifier"])
+            for t in transactions[start : start + batch_size]
+        ]
+        # the action servers reload the cold store and drop their cached results
+        futures.append(graph_database._submit(queries, ChangeEvent("transaction")))
+    for future in futures:
+        future.result()
+
+    return len(transactions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move old transactions from Grakn to the cold store."
+    )
+    parser.add_argument("path", help="directory of the cold store")
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=365,
+        help="archive the transactions executed more than this many days ago",
+    )
+    parser.add_argument(
+        "--uri",
+        default=os.environ.get("GRAKN_URI", "localhost:48555").split(",")[0],
+        help="uri of the primary grakn server",
+    )
+    parser.add_argument("--keyspace", default="banking")
+    args = parser.parse_args()
+
+    from graph_database import GraphDatabase
+
+    start = time.time()
+    graph_database = GraphDatabase(args.uri, args.keyspace)
+    archived = archive_transactions(
+        graph_database,
+        ColdStore(args.path),
+        datetime.timedelta(days=args.older_than_days),
+    )
+    graph_database.close()
+    print(
+        f"Archived {archived} transactions into [{args.path}] "
+        f"in {time.time() - start:.1f}s."
+    )
@@ -0,0 +1,183 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Text
+
+from schema import schema
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(name: Text) -> Text:
+    return " ".join(name.casefold().split())
+
+
+def trigrams(name: Text) -> List[Text]:
+    padded = f"  {name} "
+    return [padded[i : i + 3] for i in range(len(padded) - 2)]
+
+
+def bounded_edit_distance(a: Text, b: Text, max_distance: int) -> Optional[int]:
+    """
+    Levenshtein distance of the two strings, if it is at most max_distance.
+
+    :return: the distance or None if it exceeds max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > max_distance:
+            return None
+        previous = current
+
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+class FuzzyIndex(object):
+    """
+    Trigram index over the names of entities. A noisy name, e.g. a misspelled bank
+    name detected by the NER, is resolved to the key of the closest name within a
+    bounded edit distance.
+    """
+
+    def __init__(self, max_distance: int = 2):
+        self.max_distance = max_distance
+        self.names = []
+        # the keys of the entities of each name, several if the name is ambiguous
+        self.keys = []
+        self.exact = {}
+        self.indices = {}
+        self.postings = defaultdict(list)
+
+    def add(self, name: Text, key: Text):
+        """
+        Adds a name of the entity with the given key.
+
+        :param name: name of the entity
+        :param key: value of the key attribute of the entity
+        """
+        name = normalize(name)
+        if not name:
+            return
+
+        if name in self.exact:
+            # the same name refers to different entities, it is ambiguous
+            if self.exact[name] != key:
+                self.exact[name] = None
+            self.keys[self.indices[name]].add(key)
+            return
+
+        self.exact[name] = key
+        idx = len(self.names)
+        self.indices[name] = idx
+        self.names.append(name)
+        self.keys.append({key})
+        for trigram in set(trigrams(name)):
+            self.postings[trigram].append(idx)
+
+    def lookup(self, name: Text) -> Optional[Text]:
+        """
+        Resolves the name to the key of an entity.
+
+        :param name: the (possibly misspelled) name
+        :return: key of the entity or None if no or more than one entity is close,
+                 e.g. if the closest name is shared by several entities
+        """
+        name = normalize(name)
+
+        if name in self.exact:
+            return self.exact[name]
+
+        # short names are not corrected, too many of them are within reach
+        max_distance = min(self.max_distance, len(name) // 4)
+        if max_distance == 0:
+            return None
+
+        # every edit changes at most three trigrams
+        query = set(trigrams(name))
+        min_shared = len(query) - 3 * max_distance
+        shared = defaultdict(int)
+        for trigram in query:
+            for idx in self.postings.get(trigram, []):
+                shared[idx] += 1
+
+        best_distance = max_distance + 1
+        best_keys = set()
+        for idx, count in shared.items():
+            if count < min_shared:
+                continue
+            distance = bounded_edit_distance(name, self.names[idx], max_distance)
+            if distance is None or distance > best_distance:
+                continue
+            if distance < best_distance:
+                best_distance = distance
+                best_keys = set()
+            best_keys |= self.keys[idx]
+
+        if len(best_keys) == 1:
+            return best_keys.pop()
+        return None
+
+    def __len__(self):
+        return len(self.names)
+
+
+def build_index(entity_type: Text, entities: Iterable[Dict], max_distance: int = 2):
+    """
+    Builds the index for the given entities. The key and the representation
+    attributes (see schema.py) are indexed, the representation attributes both
+    individually and combined, e.g. 'Mitchell', 'Gillis' and 'Mitchell Gillis'.
+
+    :param entity_type: entity type
+    :param entities: entities of that type
+    :param max_distance: maximum edit distance of a match
+
+    :return: the index
+    """
+    key_attribute = schema[entity_type]["key"]
+    representation = [
+        a for a in schema[entity_type]["representation"] if "." not in a
+    ]
+
+    index = FuzzyIndex(max_distance)
+    for entity in entities:
+        key = str(entity[key_attribute])
+        index.add(key, key)
+        values = [str(entity[a]) for a in representation if a in entity]
+        index.add(" ".join(values), key)
+        for value in values:
+            index.add(value, key)
+
+    return index
+
+
+def build_indexes(
+    knowledge_base, entity_types: Iterable[Text] = ("bank", "person")
+) -> Dict[Text, FuzzyIndex]:
+    """
+    Builds an index per entity type from the entities in the knowledge base, i.e.
+    from the same data as knowledge_base/lookup_tables.py.
+
+    :param knowledge_base: the knowledge base
+    :param entity_types: entity types to index
+
+    :return: index per entity type
+    """
+    indexes = {}
+    for entity_type in entity_types:
+        entities = knowledge_base.get_entities(entity_type, [], limit=None)
+        indexes[entity_type] = build_index(entity_type, entities)
+        logger.debug(
+            f"Indexed {len(indexes[entity_type])} names of type '{entity_type}'."
+        )
+    return indexes
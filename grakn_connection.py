@@ -0,0 +1,331 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Hashable, List, Sequence, Text, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# grpc status codes of failed connections, other errors (e.g. invalid queries) do
+# not say anything about the health of the server
+CONNECTION_STATUS_CODES = {"UNAVAILABLE", "DEADLINE_EXCEEDED"}
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    Checks if the error, or an error it was raised from, is a failed connection to
+    the grakn server. The grakn client raises grpc errors or wraps them.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, ConnectionError):
+            return True
+
+        code = getattr(error, "code", None)
+        if callable(code):
+            try:
+                status = code()
+            except Exception:
+                status = None
+            if getattr(status, "name", None) in CONNECTION_STATUS_CODES:
+                return True
+
+        causes = [error.__cause__, error.__context__]
+        causes += [a for a in error.args if isinstance(a, BaseException)]
+        error = next((c for c in causes if c is not None), None)
+    return False
+
+
+def _close(*closeables: Any):
+    for closeable in closeables:
+        try:
+            if closeable is not None:
+                closeable.close()
+        except Exception as e:
+            logger.debug(f"Failed to close {closeable}: {e}")
+
+
+class Endpoint(object):
+    """
+    A grakn server. The client is imported and connected on first use, the session
+    of the keyspace is shared by all transactions. A session that is closed or
+    broken is replaced right away, but it is only closed once its last transaction
+    has finished.
+    """
+
+    def __init__(self, uri: Text, keyspace: Text):
+        self.uri = uri
+        self.keyspace = keyspace
+
+        # number of transactions in progress
+        self.outstanding = 0
+        # number of failed transactions in a row
+        self.failures = 0
+        # the endpoint does not receive reads until then (time.monotonic())
+        self.ejected_until = 0.0
+
+        self._client = None
+        self._session = None
+        # number of transactions per session
+        self._users = Counter()
+        # sessions that are replaced, with their clients, closed once unused
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._session is None:
+            from grakn.client import GraknClient
+
+            self._client = GraknClient(uri=self.uri)
+            self._session = self._client.session(keyspace=self.keyspace)
+        return self._session
+
+    def session(self):
+        with self._lock:
+            return self._open()
+
+    def acquire_session(self):
+        """
+        Get the session for a new transaction, see release_session.
+        """
+        with self._lock:
+            session = self._open()
+            self._users[session] += 1
+            return session
+
+    def release_session(self, session, broken: bool = False):
+        """
+        Called when a transaction of the session finished.
+
+        :param session: the session
+        :param broken: the connection failed, new transactions use a new session
+        """
+        with self._lock:
+            self._users[session] -= 1
+            if broken:
+                self._retire(session)
+            unused = session in self._retired and self._users[session] <= 0
+            if unused:
+                client = self._retired.pop(session)
+                del self._users[session]
+
+        if unused:
+            _close(session, client)
+
+    def _retire(self, session):
+        if session is not None and session is self._session:
+            self._retired[session] = self._client
+            self._session, self._client = None, None
+
+    def close(self):
+        """
+        Closes the session and the client once their transactions have finished.
+        The next transaction opens new ones.
+        """
+        with self._lock:
+            session = self._session
+            self._retire(session)
+            unused = session is not None and self._users[session] <= 0
+            if unused:
+                client = self._retired.pop(session)
+                self._users.pop(session, None)
+
+        if unused:
+            _close(session, client)
+
+    def __repr__(self):
+        return f"Endpoint({self.uri}/{self.keyspace})"
+
+
+class EndpointPool(object):
+    """
+    A primary grakn server and its read replicas. Read transactions are balanced
+    across all healthy endpoints by least outstanding requests, write transactions
+    always go to the primary. An endpoint that failed max_failures times in a row
+    is ejected for eject_after seconds, then it receives reads again.
+    """
+
+    def __init__(
+        self,
+        uris: Union[Text, Sequence[Text]],
+        keyspace: Text,
+        max_failures: int = 3,
+        eject_after: float = 30.0,
+    ):
+        """
+        :param uris: uri of the primary followed by the uris of the replicas
+        :param keyspace: keyspace
+        :param max_failures: failures in a row after which an endpoint is ejected
+        :param eject_after: seconds an ejected endpoint does not receive reads
+        """
+        if isinstance(uris, str):
+            uris = [uris]
+        if not uris:
+            raise ValueError("At least one uri is required.")
+
+        self.endpoints = [Endpoint(uri, keyspace) for uri in uris]
+        self.max_failures = max_failures
+        self.eject_after = eject_after
+
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def _acquire(self) -> Endpoint:
+        with self._lock:
+            now = time.monotonic()
+            healthy = [e for e in self.endpoints if e.ejected_until <= now]
+            if healthy:
+                endpoint = min(healthy, key=lambda e: e.outstanding)
+            else:
+                # all endpoints are ejected, try the one that returns first
+                endpoint = min(self.endpoints, key=lambda e: e.ejected_until)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, failed: bool, write: bool):
+        """
+        Counts the failure of a read towards the ejection of the endpoint. Writes
+        go to the primary regardless, their failures do not eject it from reads.
+        """
+        eject = False
+        with self._lock:
+            endpoint.outstanding -= 1
+            if write:
+                return
+            if not failed:
+                endpoint.failures = 0
+                return
+
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                endpoint.failures = 0
+                endpoint.ejected_until = time.monotonic() + self.eject_after
+                eject = True
+
+        if eject:
+            logger.warning(
+                f"Ejected {endpoint} for {self.eject_after}s after "
+                f"{self.max_failures} failures in a row."
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self, endpoint: Endpoint, write: bool):
+        """
+        Opens a transaction on the endpoint. Only failed connections count as
+        failures of the endpoint, errors of the query or of the caller are raised
+        without touching its health.
+        """
+        session = None
+        failed = False
+        try:
+            session = endpoint.acquire_session()
+            transaction = session.transaction()
+            with transaction.write() if write else transaction.read() as tx:
+                yield tx
+        except Exception as e:
+            failed = is_connection_error(e)
+            raise
+        finally:
+            if session is not None:
+                # the session is broken, e.g. after a restart of the server
+                endpoint.release_session(session, broken=failed)
+            self._release(endpoint, failed, write)
+
+    def read_transaction(self):
+        """
+        Opens a read transaction on the endpoint with the fewest outstanding requests.
+        """
+        return self._transaction(self._acquire(), write=False)
+
+    def write_transaction(self):
+        """
+        Opens a write transaction on the primary.
+        """
+        with self._lock:
+            self.primary.outstanding += 1
+        return self._transaction(self.primary, write=True)
+
+    def open(self):
+        """
+        Opens the sessions of all endpoints.
+        """
+        for endpoint in self.endpoints:
+            endpoint.session()
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.close()
+
+    def health(self) -> List[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "uri": e.uri,
+                "outstanding": e.outstanding,
+                "ejected": e.ejected_until > now,
+            }
+            for e in self.endpoints
+        ]
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls: the first caller of a key executes the
+    call, callers arriving while it is in flight wait for it and share its result
+    (or its exception). Nothing is cached, the next call after the execution
+    finished executes again.
+    """
+
+    class _Call(object):
+        __slots__ = ("done", "result", "error", "waiters")
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, f: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Executes f, unless a call with the same key is in flight.
+
+        :param key: key of the call
+        :param f: the call
+
+        :return: the result and whether it is shared with other callers; a shared
+                 result must not be modified
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = f()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, call.waiters > 0
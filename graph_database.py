@@ -1,11 +1,91 @@
+import contextvars
+import copy
+import csv
+import datetime
+import functools
 import logging
-from typing import List, Dict, Any, Optional, Text
-
-from grakn.client import GraknClient
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+    List,
+    Dict,
+    Any,
+    Optional,
+    Set,
+    Text,
+    Callable,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from account_view import AccountView
+from change_events import ChangeEvent, EventBus, get_event_bus
+from cold_store import ColdStore
+from grakn_connection import EndpointPool, SingleFlight
+from query_cache import QueryCache, Tag
+from rollups import RollupTable, TransactionRollups
+from rows import Row, row_class, to_row
+from schema import attribute_types, mapping_types, relations, schema
+from search_index import TransactionIndex, TransactionSearch
+from tracing import traced
+from traversal import end_type, parse_path, traversal_query
+from writes import (
+    GroupCommitWriter,
+    delete_query,
+    insert_entity_query,
+    insert_relation_query,
+    key_attribute_of,
+    update_attribute_queries,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_value(attribute: Text, value: Text) -> Any:
+    """
+    Converts a value read from a csv file to the datatype of the attribute, so that
+    it matches the value returned by the graph database.
+    """
+    datatype = attribute_types.get(attribute)
+
+    if datatype == "date":
+        return datetime.datetime.fromisoformat(value)
+    if datatype == "double":
+        return float(value)
+    if datatype == "long":
+        return int(value)
+    if datatype == "boolean":
+        return value == "true"
+    return value
+
+
+def _has_value(attribute: Text, value: Any, expected: Any) -> bool:
+    """
+    Compares the value of an attribute with the value of a filter. Filter values
+    are strings (e.g. extracted by the NLU), they are parsed to the datatype of the
+    attribute if the value is not a string, as done by SnapshotGraph.
+    """
+    if isinstance(expected, str) and not isinstance(value, str):
+        try:
+            expected = _parse_value(attribute, expected)
+        except ValueError:
+            return False
+    return value == expected
+
+
+class KnowledgeBaseTimeout(Exception):
+    """
+    Raised if a query of the knowledge base did not finish within its deadline.
+    """
+
+    pass
+
+
 class KnowledgeBase(object):
 
     def get_entities(
@@ -33,6 +113,90 @@ class KnowledgeBase(object):
 
         raise NotImplementedError("Method is not implemented.")
 
+    def warm_up(self):
+        """
+        Prepares the knowledge base for serving, e.g. opens connections and fills
+        caches. Called once when the action server starts.
+        """
+        pass
+
+    def insert_entity(self, entity_type: Text, attributes: Dict[Text, Any]) -> Future:
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def insert_relation(
+        self,
+        relation_type: Text,
+        role_players: Dict[Text, Any],
+        attributes: Dict[Text, Any],
+    ) -> Future:
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def update_attribute(
+        self, thing_type: Text, key: Any, attribute: Text, value: Any
+    ) -> Future:
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def delete(self, thing_type: Text, key: Any) -> Future:
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def search_transactions(
+        self, text: Text, account: Optional[Text] = None, limit: int = 10
+    ) -> List[Dict[Text, Any]]:
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def get_transaction_rollups(
+        self,
+        granularity: Text = "month",
+        account: Optional[Text] = None,
+        category: Optional[Text] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> List[Dict[Text, Any]]:
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def traverse(
+        self,
+        start_type: Text,
+        key: Any,
+        path: List[Text],
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+    ) -> List[Dict[Text, Any]]:
+
+        raise NotImplementedError("Method is not implemented.")
+
+    def _sort_entities(
+        self, entity_type: Text, entities: List[Dict[Text, Any]]
+    ) -> List[Dict[Text, Any]]:
+        """
+        Sorts the entities by the sort attribute of the entity type (see schema.py).
+        Listings are sorted before they are limited, so that every backend returns
+        the same entities in the same order.
+
+        :param entity_type: entity type
+        :param entities: entities
+
+        :return: sorted entities
+        """
+        if entity_type not in schema or "sort_by" not in schema[entity_type]:
+            return entities
+
+        path = schema[entity_type]["sort_by"].split(".")
+        descending = schema[entity_type].get("sort_descending", False)
+
+        def sort_key(entity):
+            for k in path:
+                entity = entity.get(k) if entity is not None else None
+            # entities without the attribute come last in both directions
+            return (entity is None) != descending, entity
+
+        return sorted(entities, key=sort_key, reverse=descending)
+
 
 class GraphDatabase(KnowledgeBase):
     """
@@ -40,49 +204,232 @@ class GraphDatabase(KnowledgeBase):
     sure to have the graph database set up and the grakn server running.
     """
 
-    def __init__(self, uri: Text = "localhost:48555", keyspace: Text = "banking"):
+    def __init__(
+        self,
+        uri: Union[Text, Sequence[Text]] = "localhost:48555",
+        keyspace: Text = "banking",
+        me: Text = "mitchell.gillis@t-online.de",
+        timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        max_workers: int = 16,
+        cache_size: int = 0,
+        event_bus: Optional[EventBus] = None,
+        account_view: bool = False,
+        search_index: Optional[Text] = None,
+        rollups: Optional[Text] = None,
+        cold_store: Optional[Text] = None,
+    ):
+        """
+        :param uri: uri of the grakn server or a list of uris, the first one is the
+                    primary, the others are read replicas; reads are balanced across
+                    all of them, writes go to the primary
+        :param keyspace: keyspace of the knowledge base
+        :param me: email of the user, accounts, cards and transactions are
+                   restricted to the ones related to the user
+        :param timeout: deadline of every query in seconds, a KnowledgeBaseTimeout
+                        is raised if it is exceeded (default: no deadline)
+        :param hedge_after: seconds after which a second attempt of a query is
+                            started, the first answer wins (default: no hedging)
+        :param max_workers: maximum number of queries running at the same time
+                            if a deadline or hedging is used, further queries
+                            raise a KnowledgeBaseTimeout right away
+        :param cache_size: maximum number of cached query results, results are
+                           invalidated by the change events of the event bus
+                           (default: no cache)
+        :param event_bus: bus the writes are published to and the changes are
+                          received from (default: the bus of the process, see
+                          change_events.py)
+        :param account_view: list the accounts of the user from a materialised
+                             view that is maintained by the change events (see
+                             account_view.py)
+        :param search_index: file of the transaction search index written by
+                             knowledge_base/migrate.py (default: the index is
+                             built from the graph database on the first search)
+        :param rollups: file of the transaction rollups written by rollups.py
+                        (default: the rollups are computed from the transactions of
+                        the user on first use)
+        :param cold_store: directory of the archived transactions written by
+                           cold_store.py, listings of transactions read through to
+                           it if the graph database has too few transactions
+                           (default: no archive)
+        """
         self.uri = uri
         self.keyspace = keyspace
-        self.me = "mitchell.gillis@t-online.de"
+        self.me = me
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+
+        self.endpoints = EndpointPool(uri, keyspace)
+        self._single_flight = SingleFlight()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._mapping_tables = {}
+        self._cache = QueryCache(cache_size) if cache_size else None
+        self._account_view = None
+        if account_view:
+            self._account_view = AccountView(
+                self._execute_contract_query,
+                lambda accounts: self._sort_entities("account", accounts),
+            )
+        self._transaction_search = TransactionSearch(
+            self._execute_transaction_query, search_index
+        )
+        self._rollups = TransactionRollups(self._get_rollup_transactions, rollups)
+        self._cold_store = ColdStore(cold_store) if cold_store else None
+        self.event_bus = event_bus or get_event_bus()
+        # the own writes are applied by the writer (see _submit), the events
+        # published for them are skipped
+        self._origin = uuid.uuid4().hex
+        self.event_bus.subscribe(self._on_published)
+        self._executor = None
+        if timeout is not None or hedge_after is not None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="grakn-query"
+            )
+            # attempts abandoned at their deadline keep running, they must not
+            # queue up behind a hung server
+            self._workers = threading.BoundedSemaphore(max_workers)
+
+    def close(self):
+        """
+        Commits the queued writes and closes the sessions of all endpoints. The
+        next query opens new ones.
+        """
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        self.event_bus.unsubscribe(self._on_published)
+        self.endpoints.close()
 
-    def _thing_to_dict(self, thing):
+    def _read_transaction(self):
+        return self.endpoints.read_transaction()
+
+    def _write_transaction(self):
+        return self.endpoints.write_transaction()
+
+    def _execute(self, query: Text, collect: Callable) -> Any:
         """
-        Converts a thing (a grakn object) to a dict for easy retrieval of the thing's
-        attributes.
+        Executes the query in a read transaction and collects the answers. Identical
+        queries that are in flight at the same time are executed once. If a
+        deadline is set, the query runs in a worker thread and the caller gives up
+        once the deadline has passed. If hedging is enabled, a second attempt is
+        started when the first one did not answer within hedge_after seconds.
+
+        :param query: graql query
+        :param collect: function converting the answer iterator into the result
+
+        :return: the result of the first attempt that succeeded
         """
-        entity = {"id": thing.id, "type": thing.type().label()}
+
+        # concurrent callers of the same query share one execution, every caller
+        # gets its own copy of the result as the callers modify it
+        key = (" ".join(query.split()), collect.__qualname__)
+        result, shared = self._single_flight.do(
+            key, lambda: self._execute_with_deadline(query, collect)
+        )
+        return copy.deepcopy(result) if shared else result
+
+    def _execute_with_deadline(self, query: Text, collect: Callable) -> Any:
+        def attempt():
+            with self._read_transaction() as tx:
+                logger.debug("Executing Graql Query: " + query)
+                return collect(tx.query(query))
+
+        if self._executor is None:
+            return attempt()
+
+        def run_attempt():
+            try:
+                return attempt()
+            finally:
+                self._workers.release()
+
+        def submit() -> Optional[Future]:
+            if not self._workers.acquire(blocking=False):
+                return None
+            # copy the context, so that the spans of the query belong to the
+            # caller's trace
+            return self._executor.submit(contextvars.copy_context().run, run_attempt)
+
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+
+        def remaining(limit: Optional[float] = None) -> Optional[float]:
+            if deadline is None:
+                return limit
+            left = max(0.0, deadline - time.monotonic())
+            return left if limit is None else min(left, limit)
+
+        first = submit()
+        if first is None:
+            raise KnowledgeBaseTimeout(
+                f"All query workers are busy, e.g. waiting for a hung server: {query}"
+            )
+        pending = {first}
+        hedged = self.hedge_after is None
+        error = None
+
+        while pending:
+            timeout = remaining(None if hedged else self.hedge_after)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+
+            if remaining() == 0:
+                if not pending:
+                    break
+                raise KnowledgeBaseTimeout(
+                    f"Query did not finish within {self.timeout}s: {query}"
+                )
+
+            if not hedged and (not done or not pending):
+                # the first attempt is slow or failed, start the second attempt
+                hedged = True
+                second = submit()
+                if second is not None:
+                    logger.debug(f"Hedging Graql Query: {query}")
+                    pending.add(second)
+
+        raise error
+
+    def _thing_to_row(self, thing) -> Row:
+        """
+        Converts a thing (a grakn object) to a row (see rows.py) for easy retrieval
+        of the thing's attributes.
+        """
+        row = row_class(thing.type().label())()
+        row["id"] = thing.id
         for each in thing.attributes():
-            entity[each.type().label()] = each.value()
-        return entity
+            row[each.type().label()] = each.value()
+        return row
 
+    @traced("grakn.entity_query")
     def _execute_entity_query(self, query: Text) -> List[Dict[Text, Any]]:
         """
         Executes a query that returns a list of entities with all their attributes.
         """
-        with GraknClient(uri=self.uri) as client:
-            with client.session(keyspace=self.keyspace) as session:
-                with session.transaction().read() as tx:
-                    logger.debug("Executing Graql Query: " + query)
-                    result_iter = tx.query(query)
-                    concepts = result_iter.collect_concepts()
-                    entities = []
-                    for c in concepts:
-                        entities.append(self._thing_to_dict(c))
-                    return entities
 
+        def collect(result_iter):
+            return [self._thing_to_row(c) for c in result_iter.collect_concepts()]
+
+        return self._execute(query, collect)
+
+    @traced("grakn.attribute_query")
     def _execute_attribute_query(self, query: Text) -> List[Any]:
         """
         Executes a query that returns the value(s) an entity has for a specific
         attribute.
         """
-        with GraknClient(uri=self.uri) as client:
-            with client.session(keyspace=self.keyspace) as session:
-                with session.transaction().read() as tx:
-                    print("Executing Graql Query: " + query)
-                    result_iter = tx.query(query)
-                    concepts = result_iter.collect_concepts()
-                    return [c.value() for c in concepts]
 
+        def collect(result_iter):
+            return [c.value() for c in result_iter.collect_concepts()]
+
+        return self._execute(query, collect)
+
+    @traced("grakn.relation_query")
     def _execute_relation_query(
         self, query: Text, relation_name: Text
     ) -> List[Dict[Text, Any]]:
@@ -90,29 +437,27 @@ class GraphDatabase(KnowledgeBase):
         Execute a query that queries for a relation. All attributes of the relation and
         all entities participating in the relation are part of the result.
         """
-        with GraknClient(uri=self.uri) as client:
-            with client.session(keyspace=self.keyspace) as session:
-                with session.transaction().read() as tx:
-                    print("Executing Graql Query: " + query)
-                    result_iter = tx.query(query)
 
-                    relations = []
+        def collect(result_iter):
+            relations = []
+
+            for concept in result_iter:
+                relation_entity = concept.map().get(relation_name)
+                relation = self._thing_to_row(relation_entity)
 
-                    for concept in result_iter:
-                        relation_entity = concept.map().get(relation_name)
-                        relation = self._thing_to_dict(relation_entity)
+                for (
+                    role_entity,
+                    entity_set,
+                ) in relation_entity.role_players_map().items():
+                    role_label = role_entity.label()
+                    thing = entity_set.pop()
+                    relation[role_label] = self._thing_to_row(thing)
 
-                        for (
-                            role_entity,
-                            entity_set,
-                        ) in relation_entity.role_players_map().items():
-                            role_label = role_entity.label()
-                            thing = entity_set.pop()
-                            relation[role_label] = self._thing_to_dict(thing)
+                relations.append(relation)
 
-                        relations.append(relation)
+            return relations
 
-                    return relations
+        return self._execute(query, collect)
 
     def _get_me_clause(self, entity_type: Text) -> Text:
         """
@@ -154,19 +499,9 @@ class GraphDatabase(KnowledgeBase):
 
         return clause
 
-    def get_attribute_of(
+    def _get_attribute_of(
         self, entity_type: Text, key_attribute: Text, entity: Text, attribute: Text
     ) -> List[Any]:
-        """
-        Get the value of the given attribute for the provided entity.
-
-        :param entity_type: entity type
-        :param key_attribute: key attribute of entity
-        :param entity: name of the entity
-        :param attribute: attribute of interest
-
-        :return: the value of the attribute
-        """
         me_clause = self._get_me_clause(entity_type)
 
         return self._execute_attribute_query(
@@ -180,15 +515,43 @@ class GraphDatabase(KnowledgeBase):
             """
         )
 
+    def _execute_transaction_query(self, clause: Text) -> List[Dict[Text, Any]]:
+        """
+        Query the transactions of all accounts together with the accounts of the
+        creator and the receiver.
+
+        :param clause: graql clause restricting the transactions, e.g.
+                       '$transaction has identifier 9;'
+
+        :return: list of transactions
+        """
+        return self._execute_relation_query(
+            f"match "
+            f"$transaction(account-of-receiver: $receiver, "
+            f"account-of-creator: $creator) isa transaction; "
+            f"{clause} "
+            f"get $transaction;",
+            "transaction",
+        )
+
     def _get_transaction_entities(
-        self, attributes: Optional[List[Dict[Text, Text]]] = None
+        self,
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+        limit: Optional[int] = None,
     ) -> List[Dict[Text, Any]]:
         """
         Query the graph database for transactions. Restrict the transactions
         by the provided attributes, if any attributes are given.
         As transaction is a relation, query also the related account entities.
+        If fewer than limit transactions of one of my accounts are found, the
+        listing is continued with the archived transactions of that account (see
+        cold_store.py): the callers restrict the transactions to an account
+        afterwards, e.g. by the account slot.
 
         :param attributes: list of attributes
+        :param limit: minimum number of transactions per account to return if
+                      there are enough (default: the transactions in the graph
+                      database only)
 
         :return: list of transactions
         """
@@ -196,7 +559,7 @@ class GraphDatabase(KnowledgeBase):
         attribute_clause = self._get_attribute_clause(attributes)
         me_clause = self._get_me_clause("transaction")
 
-        return self._execute_relation_query(
+        transactions = self._execute_relation_query(
             f"match "
             f"{me_clause} "
             f"$transaction(account-of-receiver: $x, account-of-creator: $account) "
@@ -204,6 +567,29 @@ class GraphDatabase(KnowledgeBase):
             f"get $transaction;",
             "transaction",
         )
+        transactions = self._sort_entities("transaction", transactions)
+
+        if self._cold_store is not None and limit:
+            # the archived transactions are older than the ones in the graph
+            # database; a transaction is in both while it is being archived
+            identifiers = {str(t["identifier"]) for t in transactions}
+            created = Counter(
+                str(t["account-of-creator"]["account-number"]) for t in transactions
+            )
+            archived = []
+            for account in self._get_my_account_numbers():
+                missing = limit - created[str(account)]
+                if missing > 0:
+                    archived += [
+                        t
+                        for t in self._cold_store.get_transactions(
+                            {str(account)}, attributes, limit
+                        )
+                        if str(t["identifier"]) not in identifiers
+                    ][:missing]
+            transactions += self._sort_entities("transaction", archived)
+
+        return transactions
 
     def _get_card_entities(
         self, attributes: Optional[List[Dict[Text, Text]]] = None, limit: int = 5
@@ -221,14 +607,32 @@ class GraphDatabase(KnowledgeBase):
         attribute_clause = self._get_attribute_clause(attributes)
         me_clause = self._get_me_clause("card")
 
-        return self._execute_entity_query(
+        cards = self._execute_entity_query(
             f"match "
             f"{me_clause} "
             f"$represented-by(bank-account: $account, bank-card: $card) "
             f"isa represented-by;"
             f"$card isa card{attribute_clause}; "
             f"get $card;"
-        )[:limit]
+        )
+
+        return self._sort_entities("card", cards)[:limit]
+
+    def _execute_contract_query(self, clause: Text) -> List[Dict[Text, Any]]:
+        """
+        Query the contracts of the user together with their account, bank and
+        person.
+
+        :param clause: graql clause restricting the contracts, e.g.
+                       '$bank has name "N26";'
+
+        :return: list of contracts
+        """
+        me_clause = self._get_me_clause("contract")
+
+        return self._execute_relation_query(
+            f"match {me_clause} {clause} get $contract;", "contract"
+        )
 
     def _get_account_entities(
         self, attributes: Optional[List[Dict[Text, Text]]] = None, limit: int = 5
@@ -256,34 +660,26 @@ class GraphDatabase(KnowledgeBase):
                 get $contract;
             """,
             "contract",
-        )[:limit]
+        )
 
+        # accounts are listed together with their bank and owner
+        accounts = []
         for entity in entities:
-            for k, v in entity["offer"].items():
-                entity[k] = v
-            entity.pop("offer")
+            account = entity["offer"]
+            account["provider"] = entity["provider"]
+            account["customer"] = entity["customer"]
+            accounts.append(account)
 
-        return entities
+        return self._sort_entities("account", accounts)[:limit]
 
-    def get_entities(
+    def _get_entities(
         self,
         entity_type: Text,
         attributes: Optional[List[Dict[Text, Text]]] = None,
         limit: int = 10,
     ) -> List[Dict[Text, Any]]:
-        """
-        Query the graph database for entities of the given type. Restrict the entities
-        by the provided attributes, if any attributes are given.
-
-        :param entity_type: the entity type
-        :param attributes: list of attributes
-        :param limit: maximum number of entities to return
-
-        :return: list of entities
-        """
-
         if entity_type == "transaction":
-            return self._get_transaction_entities(attributes)
+            return self._get_transaction_entities(attributes, limit)
         if entity_type == "account":
             return self._get_account_entities(attributes, limit)
         if entity_type == "card":
@@ -292,13 +688,16 @@ class GraphDatabase(KnowledgeBase):
         me_clause = self._get_me_clause(entity_type)
         attribute_clause = self._get_attribute_clause(attributes)
 
-        return self._execute_entity_query(
+        entities = self._execute_entity_query(
             f"match "
             f"{me_clause} "
             f"${entity_type} isa {entity_type}{attribute_clause}; "
             f"get ${entity_type};"
-        )[:limit]
+        )
 
+        return self._sort_entities(entity_type, entities)[:limit]
+
+    @traced("knowledge_base.map")
     def map(self, mapping_type: Text, mapping_key: Text) -> Text:
         """
         Query the given mapping table for the provided key.
@@ -309,20 +708,178 @@ class GraphDatabase(KnowledgeBase):
         :return: the mapping value
         """
 
-        value = self._execute_attribute_query(
+        return self._get_mapping_table(mapping_type).get(mapping_key)
+
+    def _get_mapping_table(self, mapping_type: Text) -> Dict[Text, Text]:
+        """
+        Get the given mapping table. The mapping tables are small and do not
+        change while the action server runs, they are loaded once.
+
+        :param mapping_type: the name of the mapping table
+
+        :return: the mapping values by key
+        """
+        if mapping_type not in self._mapping_tables:
+            self._mapping_tables[mapping_type] = self._load_mapping_table(mapping_type)
+        return self._mapping_tables[mapping_type]
+
+    @traced("grakn.mapping_query")
+    def _load_mapping_table(self, mapping_type: Text) -> Dict[Text, Text]:
+        query = (
             f"match "
             f"$mapping isa {mapping_type}, "
-            f"has mapping-key '{mapping_key}', "
+            f"has mapping-key $k, "
             f"has mapping-value $v;"
-            f"get $v;"
+            f"get $k, $v;"
+        )
+
+        def collect(result_iter):
+            return {
+                answer.map().get("k").value(): answer.map().get("v").value()
+                for answer in result_iter
+            }
+
+        return self._execute(query, collect)
+
+    def warm_up(self):
+        """
+        Opens the session and loads the mapping tables, the account view and the
+        transaction search index, so that the first requests do not pay for it.
+        """
+        self.endpoints.open()
+        with ThreadPoolExecutor(max_workers=len(mapping_types)) as executor:
+            list(executor.map(self._get_mapping_table, mapping_types))
+        if self._account_view is not None:
+            self._account_view.get_entities(limit=0)
+        self._transaction_search.search("")
+
+    def _validate_entity(
+        self, entity_type, entity, key_attribute, attributes
+    ) -> Dict[Text, Any]:
+        attribute_clause = self._get_attribute_clause(attributes)
+
+        value = self._execute_entity_query(
+            f"match "
+            f"${entity_type} isa {entity_type}{attribute_clause}, "
+            f"has {key_attribute} '{entity}'; "
+            f"get ${entity_type};"
         )
 
         if value and len(value) == 1:
             return value[0]
 
+    def _dependencies(self, entity_type: Text) -> List[Text]:
+        """
+        Get the types a query for entities of the given type reads, e.g. the role
+        players of a relation and the types of the me clause.
+        """
+        types = [entity_type] + list(relations.get(entity_type, {}).values())
+        if self._get_me_clause(entity_type):
+            types += ["person", "contract", "account", "bank"]
+        if entity_type == "card":
+            types += ["represented-by"]
+        return list(dict.fromkeys(types))
+
+    def _cached(self, key: Tuple, tags: List[Tag], query: Callable[[], Any]) -> Any:
+        """
+        Get the result of the query from the cache or execute the query and cache
+        its result. The result is invalidated by change events of the tagged things.
+        """
+        if self._cache is None:
+            return query()
+
+        cached, result = self._cache.get(key)
+        if not cached:
+            generation = self._cache.generation
+            result = query()
+            self._cache.put(key, result, tags, generation)
+        return result
+
+    def _on_published(self, event: ChangeEvent):
+        if event.origin != self._origin:
+            self._on_change(event)
+
+    def _on_change(self, event: ChangeEvent):
+        """
+        Invalidates the cached results and mapping tables affected by the change and
+        updates the account view.
+        """
+        if event.thing_type is None:
+            self._mapping_tables = {}
+        else:
+            self._mapping_tables.pop(event.thing_type, None)
+
+        if self._cache is not None:
+            removed = self._cache.invalidate(event)
+            logger.debug(f"Invalidated {removed} cached results after {event}.")
+
+        if self._account_view is not None:
+            self._account_view.on_change(event)
+        self._transaction_search.on_change(event)
+        self._rollups.on_change(event)
+        if self._cold_store is not None:
+            self._cold_store.on_change(event)
+
+    @traced("knowledge_base.get_attribute_of")
+    def get_attribute_of(
+        self, entity_type: Text, key_attribute: Text, entity: Text, attribute: Text
+    ) -> List[Any]:
+        """
+        Get the value of the given attribute for the provided entity.
+
+        :param entity_type: entity type
+        :param key_attribute: key attribute of entity
+        :param entity: name of the entity
+        :param attribute: attribute of interest
+
+        :return: the value of the attribute
+        """
+        if entity_type == "account" and self._account_view is not None:
+            return self._account_view.get_attribute_of(key_attribute, entity, attribute)
+
+        tags = [(entity_type, str(entity))]
+        tags += [(t, None) for t in self._dependencies(entity_type)[1:]]
+
+        return self._cached(
+            ("get_attribute_of", entity_type, key_attribute, str(entity), attribute),
+            tags,
+            lambda: self._get_attribute_of(
+                entity_type, key_attribute, entity, attribute
+            ),
+        )
+
+    @traced("knowledge_base.get_entities")
+    def get_entities(
+        self,
+        entity_type: Text,
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+        limit: int = 10,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Query the graph database for entities of the given type. Restrict the entities
+        by the provided attributes, if any attributes are given.
+
+        :param entity_type: the entity type
+        :param attributes: list of attributes
+        :param limit: maximum number of entities to return
+
+        :return: list of entities
+        """
+        if entity_type == "account" and self._account_view is not None:
+            return self._account_view.get_entities(attributes, limit)
+
+        attribute_key = tuple((a["key"], str(a["value"])) for a in attributes or [])
+
+        return self._cached(
+            ("get_entities", entity_type, attribute_key, limit),
+            [(t, None) for t in self._dependencies(entity_type)],
+            lambda: self._get_entities(entity_type, attributes, limit),
+        )
+
+    @traced("knowledge_base.validate_entity")
     def validate_entity(
         self, entity_type, entity, key_attribute, attributes
-    ) -> Dict[Text, Any]:
+    ) -> Optional[Dict[Text, Any]]:
         """
         Validates if the given entity has all provided attribute values.
 
@@ -333,17 +890,275 @@ class GraphDatabase(KnowledgeBase):
 
         :return: the found entity
         """
-        attribute_clause = self._get_attribute_clause(attributes)
+        attribute_key = tuple((a["key"], str(a["value"])) for a in attributes or [])
+
+        return self._cached(
+            ("validate_entity", entity_type, str(entity), key_attribute, attribute_key),
+            [(entity_type, str(entity))],
+            lambda: self._validate_entity(
+                entity_type, entity, key_attribute, attributes
+            ),
+        )
 
-        value = self._execute_entity_query(
-            f"match "
-            f"${entity_type} isa {entity_type}{attribute_clause}, "
-            f"has {key_attribute} '{entity}'; "
-            f"get ${entity_type};"
+    def _get_my_account_numbers(self) -> List[Text]:
+        me_clause = self._get_me_clause("account")
+
+        return self._cached(
+            ("my_account_numbers",),
+            [(t, None) for t in self._dependencies("account")],
+            lambda: self._execute_attribute_query(
+                f"match {me_clause} $account has account-number $a; get $a;"
+            ),
         )
 
-        if value and len(value) == 1:
-            return value[0]
+    @traced("knowledge_base.search_transactions")
+    def search_transactions(
+        self, text: Text, account: Optional[Text] = None, limit: int = 10
+    ) -> List[Dict[Text, Any]]:
+        """
+        Search my transactions by their reference and category (see
+        search_index.py), e.g. 'pasta bar' finds the transactions with the
+        reference 'Pasta Bar'.
+
+        :param text: the search text
+        :param account: account number, only transactions created by this account
+                        are returned (default: all my accounts)
+        :param limit: maximum number of transactions to return
+
+        :return: the matching transactions, latest first
+        """
+        accounts = set(self._get_my_account_numbers())
+        if account is not None:
+            accounts &= {str(account)}
+
+        identifiers = self._transaction_search.search(text, accounts, limit)
+        if not identifiers:
+            return []
+
+        if len(identifiers) == 1:
+            clause = f"$transaction has identifier {int(identifiers[0])};"
+        else:
+            clause = "$transaction has identifier $i; " + (
+                " or ".join(f"{{$i == {int(i)};}}" for i in identifiers) + ";"
+            )
+        transactions = {
+            str(t["identifier"]): t for t in self._execute_transaction_query(clause)
+        }
+
+        return [transactions[i] for i in identifiers if i in transactions]
+
+    def _get_rollup_transactions(
+        self, identifier: Optional[Any] = None
+    ) -> List[Dict[Text, Any]]:
+        if identifier is None:
+            transactions = self._get_transaction_entities()
+            if self._cold_store is not None:
+                # a transaction is in both while it is being archived
+                identifiers = {str(t["identifier"]) for t in transactions}
+                transactions += [
+                    t
+                    for t in self._cold_store.get_transactions(
+                        set(self._get_my_account_numbers())
+                    )
+                    if str(t["identifier"]) not in identifiers
+                ]
+            return transactions
+        return self._execute_transaction_query(
+            f"$transaction has identifier {int(identifier)};"
+        )
+
+    @traced("knowledge_base.get_transaction_rollups")
+    def get_transaction_rollups(
+        self,
+        granularity: Text = "month",
+        account: Optional[Text] = None,
+        category: Optional[Text] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Get the sum, count, minimum and maximum of the amounts of my transactions
+        per account, category and day or month (see rollups.py).
+
+        :param granularity: 'day' or 'month'
+        :param account: account number, only the buckets of this account are
+                        returned (default: all my accounts)
+        :param category: only buckets of this category (default: all categories)
+        :param start: first day or month, e.g. '2019-11' (default: no limit)
+        :param end: last day or month, inclusive (default: no limit)
+
+        :return: the buckets ordered by period, account and category
+        """
+        accounts = set(self._get_my_account_numbers())
+        if account is not None:
+            accounts &= {str(account)}
+
+        return self._rollups.query(
+            accounts,
+            granularity=granularity,
+            category=category,
+            start=start,
+            end=end,
+        )
+
+    def _get_start_clause(self, start_type: Text) -> Text:
+        """
+        Construct the clause restricting the first thing of a traversal to the
+        things related to me.
+        """
+        clause = self._get_me_clause(start_type)
+        if start_type == "card":
+            clause += (
+                "$represented-by(bank-account: $account, bank-card: $card) "
+                "isa represented-by;"
+            )
+        elif start_type == "represented-by":
+            clause += "$represented-by(bank-account: $account) isa represented-by;"
+        elif start_type == "transaction":
+            clause += "$transaction(account-of-creator: $account) isa transaction;"
+        return clause
+
+    @traced("knowledge_base.traverse")
+    def traverse(
+        self,
+        start_type: Text,
+        key: Any,
+        path: List[Text],
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Walks from a thing along a path of relation roles, e.g. from a card to the
+        bank of its account, in a single graql query.
+
+        :param start_type: type of the first thing, e.g. 'card'
+        :param key: value of the key attribute of the first thing
+        :param path: steps over relation roles (see traversal.py), e.g.
+                     ['represented-by.bank-card.bank-account',
+                      'contract.offer.provider'] from a card to its bank
+        :param attributes: attributes the things at the end need to have
+
+        :return: the things at the end of the path
+        """
+        steps = parse_path(start_type, path)
+        thing_type = end_type(start_type, steps)
+        query = traversal_query(
+            start_type, key, steps, attributes, self._get_start_clause(start_type)
+        )
+
+        if thing_type in relations:
+            # the role players of a relation are part of the result
+            variable = f"hop{len(steps)}" if steps else start_type
+            things = self._execute_relation_query(query, variable)
+        else:
+            things = self._execute_entity_query(query)
+
+        return self._sort_entities(thing_type, things)
+
+    def _submit(
+        self, queries: List[Text], event: ChangeEvent, must_insert: bool = False
+    ) -> Future:
+        """
+        Queues the queries for the group-commit writer (see writes.py), which is
+        started on the first write. The writes go to the primary.
+        """
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = GroupCommitWriter(self._write_transaction)
+
+        # the writer drops the results cached by this instance before the future is
+        # resolved, so the caller reads its own write; the other action servers
+        # receive the change event once it is committed, this instance skips it
+        event = event._replace(origin=self._origin)
+        future = self._writer.submit(
+            queries, must_insert, functools.partial(self._on_change, event)
+        )
+        future.add_done_callback(functools.partial(self._publish_committed, event))
+        return future
+
+    def _publish_committed(self, event: ChangeEvent, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            self.event_bus.publish(event)
+
+    @traced("knowledge_base.insert_entity")
+    def insert_entity(self, entity_type: Text, attributes: Dict[Text, Any]) -> Future:
+        """
+        Inserts an entity.
+
+        :param entity_type: entity type
+        :param attributes: attributes of the entity, including its key attribute
+
+        :return: future that is resolved once the entity is committed
+        """
+        return self._submit(
+            [insert_entity_query(entity_type, attributes)],
+            ChangeEvent(
+                entity_type,
+                attributes.get(key_attribute_of(entity_type)),
+                list(attributes.keys()),
+            ),
+        )
+
+    @traced("knowledge_base.insert_relation")
+    def insert_relation(
+        self,
+        relation_type: Text,
+        role_players: Dict[Text, Any],
+        attributes: Dict[Text, Any],
+    ) -> Future:
+        """
+        Inserts a relation between existing entities, e.g. a new transaction.
+
+        :param relation_type: relation type
+        :param role_players: key of the entity playing the role by role
+        :param attributes: attributes of the relation, including its identifier
+
+        :return: future that is resolved once the relation is committed, it fails
+                 with NothingInserted (see writes.py) if a role player does not
+                 exist
+        """
+        return self._submit(
+            [insert_relation_query(relation_type, role_players, attributes)],
+            ChangeEvent(
+                relation_type,
+                attributes.get(key_attribute_of(relation_type)),
+                list(attributes.keys()),
+            ),
+            must_insert=True,
+        )
+
+    @traced("knowledge_base.update_attribute")
+    def update_attribute(
+        self, thing_type: Text, key: Any, attribute: Text, value: Any
+    ) -> Future:
+        """
+        Replaces the value of an attribute of an entity or relation.
+
+        :param thing_type: entity or relation type
+        :param key: value of the key attribute
+        :param attribute: the attribute
+        :param value: the new value
+
+        :return: future that is resolved once the update is committed
+        """
+        return self._submit(
+            update_attribute_queries(thing_type, key, attribute, value),
+            ChangeEvent(thing_type, key, [attribute]),
+        )
+
+    @traced("knowledge_base.delete")
+    def delete(self, thing_type: Text, key: Any) -> Future:
+        """
+        Deletes an entity or relation.
+
+        :param thing_type: entity or relation type
+        :param key: value of the key attribute
+
+        :return: future that is resolved once the deletion is committed
+        """
+        return self._submit(
+            [delete_query(thing_type, key)], ChangeEvent(thing_type, key)
+        )
 
 
 class InMemoryGraph(KnowledgeBase):
@@ -354,7 +1169,32 @@ class InMemoryGraph(KnowledgeBase):
     knowledge about banks.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        graph: Optional[Dict[Text, List[Dict[Text, Any]]]] = None,
+        mappings: Optional[Dict[Text, Dict[Text, Text]]] = None,
+        me: Optional[Text] = None,
+    ):
+        """
+        :param graph: entities and relations by type, defaults to a few banks
+        :param mappings: mapping tables by mapping type
+        :param me: email of the user; if set, accounts, cards and transactions are
+                   restricted to the ones related to the user (as in GraphDatabase)
+        """
+        self.me = me
+        self._my_accounts = None
+        self._my_cards = None
+        self._transaction_index = None
+        self._rollup_table = None
+        self._things_by_key = None
+        self._relations_by_role = None
+
+        if graph is not None:
+            # listings keep this order, so that they do not need to be sorted per query
+            self.graph = {t: self._sort_entities(t, e) for t, e in graph.items()}
+            self.mappings = mappings or {}
+            return
+
         self.graph = {
             "bank": [
                 {
@@ -413,7 +1253,126 @@ class InMemoryGraph(KnowledgeBase):
             "free accounts": "free-accounts",
         }
         self.entity_type_mapping = {"banks": "bank", "bank": "bank"}
+        self.graph["bank"] = self._sort_entities("bank", self.graph["bank"])
+        self.mappings = mappings or {
+            "attribute-mapping": self.attribute_mapping,
+            "entity-type-mapping": self.entity_type_mapping,
+        }
 
+    @classmethod
+    def from_csv(
+        cls,
+        data_path: Text = "./knowledge_base/data",
+        me: Optional[Text] = "mitchell.gillis@t-online.de",
+    ) -> "InMemoryGraph":
+        """
+        Loads the csv files used by knowledge_base/migrate.py into memory. Relations
+        hold the entities playing a role in them, in the same shape as the results
+        of GraphDatabase.
+
+        :param data_path: directory containing the csv files
+        :param me: email of the user
+
+        :return: the in-memory graph
+        """
+
+        def read(file_name, entity_type=None):
+            with open(os.path.join(data_path, file_name + ".csv")) as data:
+                rows = [
+                    {k: _parse_value(k, v) for k, v in row.items()}
+                    for row in csv.DictReader(data, skipinitialspace=True)
+                ]
+            if entity_type is None:
+                return rows
+            return [to_row(entity_type, row) for row in rows]
+
+        graph = {
+            entity_type: read(entity_type, entity_type)
+            for entity_type in ["bank", "person", "account", "card"]
+        }
+
+        banks = {e["name"]: e for e in graph["bank"]}
+        people = {e["email"]: e for e in graph["person"]}
+        accounts = {e["account-number"]: e for e in graph["account"]}
+        cards = {e["card-number"]: e for e in graph["card"]}
+
+        graph["contract"] = [
+            to_row(
+                "contract",
+                {
+                    "identifier": row["identifier"],
+                    "sign-date": row["sign-date"],
+                    "provider": banks[row["provider"]],
+                    "customer": people[row["customer"]],
+                    "offer": accounts[row["offer"]],
+                },
+            )
+            for row in read("contract")
+        ]
+        graph["represented-by"] = [
+            to_row(
+                "represented-by",
+                {
+                    "identifier": row["identifier"],
+                    "bank-account": accounts[row["bank-account"]],
+                    "bank-card": cards[_parse_value("card-number", row["bank-card"])],
+                },
+            )
+            for row in read("represented-by")
+        ]
+        transactions = read("transaction", "transaction")
+        for transaction in transactions:
+            for role in ["account-of-receiver", "account-of-creator"]:
+                transaction[role] = accounts[transaction[role]]
+        graph["transaction"] = transactions
+
+        # accounts are listed together with their bank and owner
+        graph["account"] = [
+            to_row(
+                "account",
+                dict(c["offer"], provider=c["provider"], customer=c["customer"]),
+            )
+            for c in graph["contract"]
+        ]
+
+        mappings = {}
+        for mapping_type in mapping_types:
+            rows = read(mapping_type.replace("-", "_"))
+            mappings[mapping_type] = {
+                row["mapping-key"]: row["mapping-value"] for row in rows
+            }
+
+        return cls(graph, mappings, me)
+
+    def _load_my_things(self):
+        if self._my_accounts is None:
+            self._my_accounts = {
+                c["offer"]["account-number"]
+                for c in self.graph.get("contract", [])
+                if c["customer"]["email"] == self.me
+            }
+            self._my_cards = {
+                r["bank-card"]["card-number"]
+                for r in self.graph.get("represented-by", [])
+                if r["bank-account"]["account-number"] in self._my_accounts
+            }
+
+    def _related_to_me(self, entity_type: Text, entity: Dict[Text, Any]) -> bool:
+        """
+        Checks whether the entity is related to me, i.e. an account I own, a card
+        of one of my accounts, or a transaction created by one of my accounts.
+        """
+        self._load_my_things()
+
+        if entity_type == "account":
+            return entity["account-number"] in self._my_accounts
+        if entity_type == "card":
+            return entity["card-number"] in self._my_cards
+        if entity_type == "transaction":
+            return entity["account-of-creator"]["account-number"] in self._my_accounts
+        return True
+
+    @traced("knowledge_base.get_entities")
     def get_entities(
         self,
         entity_type: Text,
@@ -435,20 +1394,29 @@ class InMemoryGraph(KnowledgeBase):
 
         entities = self.graph[entity_type]
 
+        # only list, for example, accounts that are related to me
+        if self.me is not None and entity_type not in ["person", "bank"]:
+            entities = [e for e in entities if self._related_to_me(entity_type, e)]
+
         # filter entities by attributes
         if attributes:
             entities = list(
                 filter(
-                    lambda e: [e[a["key"]] == a["value"] for a in attributes].count(
-                        False
-                    )
-                    == 0,
+                    lambda e: all(
+                        _has_value(a["key"], e.get(a["key"]), a["value"])
+                        for a in attributes
+                    ),
                     entities,
                 )
             )
 
+        # transactions are not limited, see GraphDatabase.get_entities
+        if entity_type == "transaction":
+            return entities
+
         return entities[:limit]
 
+    @traced("knowledge_base.get_attribute_of")
     def get_attribute_of(
         self, entity_type: Text, key_attribute: Text, entity: Text, attribute: Text
     ) -> List[Any]:
@@ -467,15 +1435,22 @@ class InMemoryGraph(KnowledgeBase):
 
         entities = self.graph[entity_type]
 
+        if self.me is not None and entity_type not in ["person", "bank"]:
+            entities = [e for e in entities if self._related_to_me(entity_type, e)]
+
         entity_of_interest = list(
-            filter(lambda e: e[key_attribute] == entity, entities)
+            filter(lambda e: str(e[key_attribute]) == str(entity), entities)
         )
 
         if not entity_of_interest or len(entity_of_interest) > 1:
             return []
 
+        if attribute not in entity_of_interest[0]:
+            return []
+
         return [entity_of_interest[0][attribute]]
 
+    @traced("knowledge_base.validate_entity")
     def validate_entity(
         self, entity_type, entity, key_attribute, attributes
     ) -> Optional[Dict[Text, Any]]:
@@ -495,7 +1470,7 @@ class InMemoryGraph(KnowledgeBase):
         entities = self.graph[entity_type]
 
         entity_of_interest = list(
-            filter(lambda e: e[key_attribute] == entity, entities)
+            filter(lambda e: str(e[key_attribute]) == str(entity), entities)
         )
 
         if not entity_of_interest or len(entity_of_interest) > 1:
@@ -504,11 +1479,171 @@ class InMemoryGraph(KnowledgeBase):
         entity_of_interest = entity_of_interest[0]
 
         for a in attributes:
-            if entity_of_interest[a["key"]] != a["value"]:
+            if not _has_value(a["key"], entity_of_interest.get(a["key"]), a["value"]):
                 return None
 
         return entity_of_interest
 
+    @traced("knowledge_base.search_transactions")
+    def search_transactions(
+        self, text: Text, account: Optional[Text] = None, limit: int = 10
+    ) -> List[Dict[Text, Any]]:
+        """
+        Search the transactions by their reference and category (see
+        search_index.py).
+
+        :param text: the search text
+        :param account: account number, only transactions created by this account
+                        are returned (default: all accounts)
+        :param limit: maximum number of transactions to return
+
+        :return: the matching transactions, latest first
+        """
+        transactions = self.graph.get("transaction", [])
+        if self._transaction_index is None:
+            self._transaction_index = TransactionIndex.from_transactions(transactions)
+            self._transactions = {str(t["identifier"]): t for t in transactions}
+
+        identifiers = self._transaction_index.search(
+            text, self._my_account_numbers(account), limit
+        )
+        return [self._transactions[i] for i in identifiers]
+
+    def _build_traversal_indexes(self):
+        """
+        Indexes the things by their key and the relations by the keys of their
+        role players, so that a traversal walks the indexes instead of scanning.
+        """
+        if self._things_by_key is not None:
+            return
+
+        things_by_key = {}
+        for thing_type in list(schema.keys()) + list(relations.keys()):
+            if thing_type not in self.graph:
+                continue
+            key_attribute = key_attribute_of(thing_type)
+            things_by_key[thing_type] = {
+                str(t[key_attribute]): t for t in self.graph[thing_type]
+            }
+
+        relations_by_role = {}
+        for relation, roles in relations.items():
+            for role, player_type in roles.items():
+                key_attribute = key_attribute_of(player_type)
+                index = relations_by_role[(relation, role)] = {}
+                for r in self.graph.get(relation, []):
+                    index.setdefault(str(r[role][key_attribute]), []).append(r)
+
+        self._relations_by_role = relations_by_role
+        self._things_by_key = things_by_key
+
+    @traced("knowledge_base.traverse")
+    def traverse(
+        self,
+        start_type: Text,
+        key: Any,
+        path: List[Text],
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Walks from a thing along a path of relation roles, e.g. from a card to the
+        bank of its account, using indexes of the relations by role player.
+
+        :param start_type: type of the first thing, e.g. 'card'
+        :param key: value of the key attribute of the first thing
+        :param path: steps over relation roles (see traversal.py)
+        :param attributes: attributes the things at the end need to have
+
+        :return: the things at the end of the path
+        """
+        steps = parse_path(start_type, path)
+        self._build_traversal_indexes()
+
+        start = self._things_by_key.get(start_type, {}).get(str(key))
+        if start is None:
+            return []
+        if (
+            self.me is not None
+            and start_type not in ["person", "bank"]
+            and not self._related_to_me(start_type, start)
+        ):
+            return []
+
+        things = [start]
+        thing_type = start_type
+        for step in steps:
+            if step.kind == "enter":
+                index = self._relations_by_role[(step.relation, step.role)]
+                key_attribute = key_attribute_of(thing_type)
+                things = [
+                    r for t in things for r in index.get(str(t[key_attribute]), [])
+                ]
+                thing_type = step.relation
+            else:
+                things = [t[step.role] for t in things]
+                thing_type = relations[step.relation][step.role]
+
+        # a thing is reached once, even if several paths lead to it
+        key_attribute = key_attribute_of(thing_type)
+        things = list({str(t[key_attribute]): t for t in things}.values())
+
+        if attributes:
+            things = [
+                t
+                for t in things
+                if all(
+                    _has_value(a["key"], t.get(a["key"]), a["value"])
+                    for a in attributes
+                )
+            ]
+
+        return self._sort_entities(thing_type, things)
+
+    def _my_account_numbers(self, account: Optional[Text]) -> Optional[Set[Text]]:
+        accounts = None
+        if self.me is not None:
+            self._load_my_things()
+            accounts = set(self._my_accounts)
+        if account is not None:
+            accounts = {str(account)} if accounts is None else accounts & {str(account)}
+        return accounts
+
+    @traced("knowledge_base.get_transaction_rollups")
+    def get_transaction_rollups(
+        self,
+        granularity: Text = "month",
+        account: Optional[Text] = None,
+        category: Optional[Text] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Get the sum, count, minimum and maximum of the amounts of the transactions
+        per account, category and day or month (see rollups.py).
+
+        :param granularity: 'day' or 'month'
+        :param account: account number, only the buckets of this account are
+                        returned (default: all accounts)
+        :param category: only buckets of this category (default: all categories)
+        :param start: first day or month, e.g. '2019-11' (default: no limit)
+        :param end: last day or month, inclusive (default: no limit)
+
+        :return: the buckets ordered by period, account and category
+        """
+        if self._rollup_table is None:
+            self._rollup_table = RollupTable.from_transactions(
+                self.graph.get("transaction", [])
+            )
+
+        return self._rollup_table.query(
+            self._my_account_numbers(account),
+            granularity=granularity,
+            category=category,
+            start=start,
+            end=end,
+        )
+
+    @traced("knowledge_base.map")
     def map(self, mapping_type: Text, mapping_key: Text) -> Text:
         """
         Query the given mapping table for the provided key.
@@ -519,14 +1654,119 @@ class InMemoryGraph(KnowledgeBase):
         :return: the mapping value
         """
 
-        if (
-            mapping_type == "attribute-mapping"
-            and mapping_key in self.attribute_mapping
-        ):
-            return self.attribute_mapping[mapping_key]
+        return self.mappings.get(mapping_type, {}).get(mapping_key)
 
-        if (
-            mapping_type == "entity-type-mapping"
-            and mapping_key in self.entity_type_mapping
-        ):
-            return self.entity_type_mapping[mapping_key]
+
+class FallbackKnowledgeBase(KnowledgeBase):
+    """
+    Serves from a primary knowledge base, e.g. the graph database, and falls back to
+    a local read-only one, e.g. an InMemoryGraph or a SnapshotGraph, if the primary
+    fails or misses its deadline. After a failure the primary is skipped for
+    retry_after seconds, so that requests do not keep waiting for a backend that
+    is down. The fallback is read-only, writes always go to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: KnowledgeBase,
+        fallback: KnowledgeBase,
+        retry_after: float = 30.0,
+    ):
+        self.primary = primary
+        self.fallback = fallback
+        self.retry_after = retry_after
+        self._skip_primary_until = 0.0
+
+    def _call(self, method: Text, *args, **kwargs):
+        if time.monotonic() >= self._skip_primary_until:
+            try:
+                return getattr(self.primary, method)(*args, **kwargs)
+            except Exception as e:
+                logger.warning(
+                    f"Primary knowledge base failed ({e!r}), serving from the "
+                    f"fallback for the next {self.retry_after}s."
+                )
+                self._skip_primary_until = time.monotonic() + self.retry_after
+
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def get_entities(
+        self,
+        entity_type: Text,
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+        limit: int = 10,
+    ) -> List[Dict[Text, Any]]:
+        return self._call("get_entities", entity_type, attributes, limit)
+
+    def get_attribute_of(
+        self, entity_type: Text, key_attribute: Text, entity: Text, attribute: Text
+    ) -> List[Any]:
+        return self._call(
+            "get_attribute_of", entity_type, key_attribute, entity, attribute
+        )
+
+    def validate_entity(
+        self, entity_type, entity, key_attribute, attributes
+    ) -> Optional[Dict[Text, Any]]:
+        return self._call(
+            "validate_entity", entity_type, entity, key_attribute, attributes
+        )
+
+    def map(self, mapping_type: Text, mapping_key: Text) -> Text:
+        return self._call("map", mapping_type, mapping_key)
+
+    def search_transactions(
+        self, text: Text, account: Optional[Text] = None, limit: int = 10
+    ) -> List[Dict[Text, Any]]:
+        return self._call("search_transactions", text, account, limit)
+
+    def get_transaction_rollups(
+        self,
+        granularity: Text = "month",
+        account: Optional[Text] = None,
+        category: Optional[Text] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> List[Dict[Text, Any]]:
+        return self._call(
+            "get_transaction_rollups", granularity, account, category, start, end
+        )
+
+    def traverse(
+        self,
+        start_type: Text,
+        key: Any,
+        path: List[Text],
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+    ) -> List[Dict[Text, Any]]:
+        return self._call("traverse", start_type, key, path, attributes)
+
+    def warm_up(self):
+        """
+        Warms up both knowledge bases. The action server is ready even if the
+        primary is not reachable, as the fallback can serve the requests.
+        """
+        self.fallback.warm_up()
+        try:
+            self.primary.warm_up()
+        except Exception as e:
+            logger.warning(f"Failed to warm up the primary knowledge base: {e!r}")
+
+    def insert_entity(self, entity_type: Text, attributes: Dict[Text, Any]) -> Future:
+        return self.primary.insert_entity(entity_type, attributes)
+
+    def insert_relation(
+        self,
+        relation_type: Text,
+        role_players: Dict[Text, Any],
+        attributes: Dict[Text, Any],
+    ) -> Future:
+        return self.primary.insert_relation(relation_type, role_players, attributes)
+
+    def update_attribute(
+        self, thing_type: Text, key: Any, attribute: Text, value: Any
+    ) -> Future:
+        return self.primary.update_attribute(thing_type, key, attribute, value)
+
+    def delete(self, thing_type: Text, key: Any) -> Future:
+        return self.primary.delete(thing_type, key)
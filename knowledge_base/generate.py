@@ -0,0 +1,318 @@
+import argparse
+import csv
+import os
+import shutil
+import time
+
+import numpy as np
+
+# microseconds since epoch of 2015-01-01 and 2021-01-01
+START_DATE = np.datetime64("2015-01-01T00:00:00", "us").astype(np.int64)
+END_DATE = np.datetime64("2021-01-01T00:00:00", "us").astype(np.int64)
+
+DAY = 24 * 60 * 60 * 10 ** 6
+
+EMAIL_DOMAINS = np.array(
+    ["gmail.com", "googlemail.com", "t-online.de", "web.de", "gmx.de", "yahoo.com"]
+)
+CITIES = np.array(
+    ["Berlin", "Hamburg", "Munich", "Cologne", "Frankfurt", "Stuttgart", "Dresden"]
+)
+ACCOUNT_TYPES = np.array(["credit", "savings", "checking"])
+
+
+def read_csv(file_name):
+    with open(file_name) as data:
+        return list(csv.DictReader(data, skipinitialspace=True))
+
+
+def write_csv(file_name, header, columns, chunk_size=10 ** 6):
+    """
+    Writes the given columns to a csv file. The columns are converted to strings
+    chunk by chunk, so that memory stays bounded for millions of rows.
+    """
+    num_rows = len(columns[0])
+
+    with open(file_name, "w", encoding="utf-8") as f:
+        f.write(",".join(header))
+        for start in range(0, num_rows, chunk_size):
+            chunk = [
+                np.asarray(c[start : start + chunk_size]).astype(str).tolist()
+                for c in columns
+            ]
+            f.write("\n")
+            f.write("\n".join(map(",".join, zip(*chunk))))
+
+    print(f"Wrote {num_rows} rows to [{file_name}].")
+
+
+def concat(*parts):
+    """
+    Element-wise concatenation of string arrays (and scalars).
+    """
+    result = np.asarray(parts[0]).astype(str)
+    for part in parts[1:]:
+        result = np.char.add(result, np.asarray(part).astype(str))
+    return result
+
+
+def format_dates(microseconds):
+    return np.asarray(microseconds, dtype=np.int64).astype("datetime64[us]").astype(str)
+
+
+def format_cents(cents):
+    return concat(cents // 100, ".", np.char.zfill((cents % 100).astype(str), 2))
+
+
+def unique_numbers(rng, size, digits):
+    """
+    Draws unique numbers with the given number of digits (at most 18).
+    """
+    low = 10 ** (digits - 1)
+    return rng.choice(10 ** digits - low, size=size, replace=False) + low
+
+
+def generate(
+    target_path,
+    num_people=20,
+    num_accounts=26,
+    num_transactions=2000,
+    num_banks=7,
+    source_path="./knowledge_base/data",
+    skew=1.2,
+    seed=42,
+):
+    """
+    Generates csv files that are consistent with knowledge_base/schema.gql and can
+    be loaded by knowledge_base/migrate.py.
+    The people and banks of the source data are kept (and extended by synthetic
+    ones), so that the NLU data and the lookup tables stay valid. Every person
+    holds at least one account, every account has one contract and one card, and
+    the number of transactions per account follows a heavy-tailed distribution.
+
+    :param target_path: directory to write the csv files to
+    :param num_people: number of people (at least the number of source people)
+    :param num_accounts: number of accounts (at least the number of people)
+    :param num_transactions: number of transactions
+    :param num_banks: number of banks (at least the number of source banks)
+    :param source_path: directory containing the original csv files
+    :param skew: shape of the pareto distribution of transactions per account,
+                 smaller values lead to a stronger skew
+    :param seed: random seed
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(target_path, exist_ok=True)
+
+    for mapping in ["attribute_mapping", "entity_type_mapping", "mention_mapping"]:
+        shutil.copy(
+            os.path.join(source_path, mapping + ".csv"),
+            os.path.join(target_path, mapping + ".csv"),
+        )
+
+    # banks
+    banks = read_csv(os.path.join(source_path, "bank.csv"))
+    bank_header = list(banks[0].keys())
+    bank_columns = [np.array([b[h] for b in banks]) for h in bank_header]
+    num_synthetic = max(0, num_banks - len(banks))
+    if num_synthetic:
+        template = rng.integers(0, len(banks), num_synthetic)
+        bank_columns = [np.concatenate([c, c[template]]) for c in bank_columns]
+        bank_columns[0][len(banks) :] = concat(
+            "Bank ", np.arange(len(banks) + 1, num_banks + 1)
+        )
+    bank_names = bank_columns[0]
+    write_csv(os.path.join(target_path, "bank.csv"), bank_header, bank_columns)
+
+    # people
+    people = read_csv(os.path.join(source_path, "person.csv"))
+    first_names = np.array([p["first-name"] for p in people])
+    last_names = np.array([p["last-name"] for p in people])
+    num_people = max(num_people, len(people))
+    num_synthetic = num_people - len(people)
+
+    synthetic_first = first_names[rng.integers(0, len(people), num_synthetic)]
+    synthetic_last = last_names[rng.integers(0, len(people), num_synthetic)]
+    # np.char.replace fails on empty arrays
+    synthetic_last_plain = (
+        np.char.replace(synthetic_last, " ", "") if num_synthetic else synthetic_last
+    )
+    person_columns = {
+        "first-name": np.concatenate([first_names, synthetic_first]),
+        "last-name": np.concatenate([last_names, synthetic_last]),
+        "gender": np.concatenate(
+            [
+                [p["gender"] for p in people],
+                np.array(["female", "male"])[rng.integers(0, 2, num_synthetic)],
+            ]
+        ),
+        "phone-number": np.concatenate(
+            [
+                [p["phone-number"] for p in people],
+                concat(
+                    rng.integers(100, 1000, num_synthetic),
+                    "-",
+                    rng.integers(100, 1000, num_synthetic),
+                    "-",
+                    rng.integers(1000, 10000, num_synthetic),
+                ),
+            ]
+        ),
+        "city": np.concatenate(
+            [
+                [p["city"] for p in people],
+                CITIES[rng.integers(0, len(CITIES), num_synthetic)],
+            ]
+        ),
+        "email": np.concatenate(
+            [
+                [p["email"] for p in people],
+                # the running number keeps the synthetic emails unique
+                concat(
+                    np.char.lower(synthetic_first),
+                    ".",
+                    np.char.lower(synthetic_last_plain),
+                    np.arange(len(people), num_people),
+                    "@",
+                    EMAIL_DOMAINS[rng.integers(0, len(EMAIL_DOMAINS), num_synthetic)],
+                ),
+            ]
+        ),
+    }
+    write_csv(
+        os.path.join(target_path, "person.csv"),
+        list(person_columns.keys()),
+        list(person_columns.values()),
+    )
+
+    # accounts, every person holds at least one account
+    num_accounts = max(num_accounts, num_people)
+    customers = rng.integers(0, num_people, num_accounts)
+    customers[:num_people] = np.arange(num_people)
+    providers = rng.integers(0, len(bank_names), num_accounts)
+
+    account_numbers = concat(
+        "DE",
+        rng.integers(10, 100, num_accounts),
+        unique_numbers(rng, num_accounts, 18),
+    )
+    opening_dates = rng.integers(START_DATE, END_DATE - 30 * DAY, num_accounts)
+    write_csv(
+        os.path.join(target_path, "account.csv"),
+        ["balance", "account-number", "opening-date", "account-type"],
+        [
+            format_cents(rng.integers(0, 10 ** 7, num_accounts)),
+            account_numbers,
+            format_dates(opening_dates),
+            ACCOUNT_TYPES[rng.integers(0, len(ACCOUNT_TYPES), num_accounts)],
+        ],
+    )
+
+    identifiers = np.arange(1, num_accounts + 1)
+    write_csv(
+        os.path.join(target_path, "contract.csv"),
+        ["identifier", "sign-date", "provider", "customer", "offer"],
+        [
+            identifiers,
+            format_dates(opening_dates - rng.integers(0, 7 * DAY, num_accounts)),
+            bank_names[providers],
+            person_columns["email"][customers],
+            account_numbers,
+        ],
+    )
+
+    # one card per account
+    card_numbers = unique_numbers(rng, num_accounts, 11)
+    created_dates = opening_dates + rng.integers(0, 7 * DAY, num_accounts)
+    write_csv(
+        os.path.join(target_path, "card.csv"),
+        ["card-number", "name-on-card", "created-date", "expiry-date"],
+        [
+            card_numbers,
+            concat(
+                person_columns["first-name"][customers],
+                " ",
+                person_columns["last-name"][customers],
+            ),
+            format_dates(created_dates),
+            format_dates(created_dates + 3650 * DAY),
+        ],
+    )
+    write_csv(
+        os.path.join(target_path, "represented-by.csv"),
+        ["identifier", "bank-account", "bank-card"],
+        [identifiers, account_numbers, card_numbers],
+    )
+
+    # transactions, the number of transactions per account is heavy-tailed
+    weights = rng.pareto(skew, num_accounts) + 1
+    creators = rng.choice(num_accounts, num_transactions, p=weights / weights.sum())
+    # the receiver is any account but the creator
+    receivers = (
+        creators + rng.integers(1, max(num_accounts, 2), num_transactions)
+    ) % num_accounts
+
+    templates = read_csv(os.path.join(source_path, "transaction.csv"))
+    references = np.array([t["reference"] for t in templates])
+    categories = np.array([t["category"] for t in templates])
+    template = rng.integers(0, len(templates), num_transactions)
+
+    execution_dates = rng.integers(
+        opening_dates[creators], END_DATE, dtype=np.int64
+    )
+    amounts = np.maximum(
+        1, np.round(rng.lognormal(8.5, 1.2, num_transactions))
+    ).astype(np.int64)
+
+    write_csv(
+        os.path.join(target_path, "transaction.csv"),
+        [
+            "identifier",
+            "amount",
+            "execution-date",
+            "reference",
+            "category",
+            "account-of-receiver",
+            "account-of-creator",
+        ],
+        [
+            np.arange(1, num_transactions + 1),
+            format_cents(amounts),
+            format_dates(execution_dates),
+            references[template],
+            categories[template],
+            account_numbers[receivers],
+            account_numbers[creators],
+        ],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic csv files for the banking knowledge base."
+    )
+    parser.add_argument("target", help="directory to write the csv files to")
+    parser.add_argument("--people", type=int, default=1000)
+    parser.add_argument("--accounts", type=int, default=2500)
+    parser.add_argument("--transactions", type=int, default=10 ** 5)
+    parser.add_argument("--banks", type=int, default=7)
+    parser.add_argument("--skew", type=float, default=1.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--source-path",
+        default="./knowledge_base/data",
+        help="directory containing the original csv files",
+    )
+    args = parser.parse_args()
+
+    start = time.time()
+    generate(
+        args.target,
+        args.people,
+        args.accounts,
+        args.transactions,
+        args.banks,
+        args.source_path,
+        args.skew,
+        args.seed,
+    )
+    print(f"Generated the data in {time.time() - start:.1f}s.")
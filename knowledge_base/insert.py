@@ -1,17 +1,35 @@
+import os
+import sys
+
 from grakn.client import GraknClient
 
+# the modules of the action server live in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from change_events import publish
+
+# writes go to the primary, i.e. the first of the comma separated uris
+URI = os.environ.get("GRAKN_URI", "localhost:48555").split(",")[0]
+
 
-def insert(graql_insert_query):
-    with GraknClient(uri="localhost:48555") as client:
+def insert(graql_insert_query, thing_type=None, key=None):
+    """
+    Executes the query and publishes a change event (see change_events.py), so
+    that the action servers invalidate their caches. Without the type of the
+    inserted thing, all cached results are invalidated.
+    """
+    with GraknClient(uri=URI) as client:
         with client.session(keyspace="banking") as session:
             with session.transaction().write() as transaction:
                 transaction.query(graql_insert_query)
                 transaction.commit()
 
+    publish(thing_type, key)
+
 
 if __name__ == "__main__":
     graql_insert_query = """
     insert $b isa bank, has name 'KfW', has country 'Germany', has headquarters 'Frankfurt am Main';
     """
 
-    insert(graql_insert_query)
+    insert(graql_insert_query, "bank", "KfW")
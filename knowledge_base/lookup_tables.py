@@ -3,7 +3,7 @@ from grakn.client import GraknClient
 
 
 KEYSPACE = "banking"
-URI = "localhost:48555"
+URI = os.environ.get("GRAKN_URI", "localhost:48555").split(",")[0]
 
 
 def execute_entity_query(query):
@@ -1,25 +1,120 @@
 from grakn.client import GraknClient
+import argparse
 import csv
+import os
+import sys
 
+# the modules of the action server live in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def build_banking_graph(inputs):
-        with GraknClient(uri="localhost:48555") as client:
-            with client.session(keyspace="banking") as session:
-                for input in inputs:
-                    print("Loading from [" + input["data_path"] + "] into Grakn ...")
-                    load_data_into_grakn(input, session)
+from change_events import publish
+from schema import relations
+from search_index import TransactionIndex
+from writes import key_attribute_of
 
+# the entity types playing roles in relations, their concept ids are kept while
+# loading, so that the relations are inserted by id
+ROLE_PLAYER_TYPES = sorted({t for roles in relations.values() for t in roles.values()})
 
-def load_data_into_grakn(input, session):
-    items = parse_data_to_dictionaries(input)
 
+def build_banking_graph(inputs, uri="localhost:48555", keyspace="banking"):
+        with GraknClient(uri=uri) as client:
+            with client.session(keyspace=keyspace) as session:
+                concept_ids = {}
+                for input in inputs:
+                    print("Loading from [" + input["data_path"] + "] into Grakn ...")
+                    load_data_into_grakn(input, session, concept_ids)
+                    # many things of the type changed, the key is unknown
+                    publish(thing_type_of(input))
+
+
+def thing_type_of(input):
+    name = os.path.basename(input["data_path"]).split(" ")[0]
+    return name.replace("_", "-")
+
+
+def load_data_into_grakn(input, session, concept_ids):
+    """
+    Inserts the items of the input. The concept ids of inserted role players are
+    added to concept_ids, relations are inserted by the ids of their role players
+    instead of matching them by their keys. Relations whose role players are
+    missing are reported and skipped.
+
+    :param input: the input
+    :param session: the grakn session
+    :param concept_ids: (entity type, key) -> concept id of the loaded entities
+    """
+    if "items" in input:
+        items = input["items"]
+    else:
+        items = parse_data_to_dictionaries(input)
+
+    thing_type = thing_type_of(input)
+    roles = relations.get(thing_type)
+    if roles:
+        for player_type in set(roles.values()):
+            if not any(t == player_type for t, _ in concept_ids):
+                # the role players were loaded before, e.g. by an earlier run
+                concept_ids.update(resolve_concept_ids(session, player_type))
+
+    inserted = 0
+    missing = []
     for item in items:
-        with session.transaction().write() as transaction:
+        if roles:
+            # the columns of a relation are named after the roles
+            ids = {
+                role: concept_ids.get((player_type, str(item[role])))
+                for role, player_type in roles.items()
+            }
+            absent = [role for role, concept_id in ids.items() if concept_id is None]
+            if absent:
+                missing.append((item, absent))
+                continue
+            graql_insert_query = input["template"](item, ids)
+        else:
             graql_insert_query = input["template"](item)
-            transaction.query(graql_insert_query)
-            transaction.commit()
 
-    print(f"Inserted {str(len(items))} items from [{input['data_path']}] into Grakn.")
+        with session.transaction().write() as transaction:
+            answers = list(transaction.query(graql_insert_query))
+            transaction.commit()
+        inserted += 1
+
+        if thing_type in ROLE_PLAYER_TYPES:
+            key_attribute = key_attribute_of(thing_type)
+            for answer in answers:
+                concept_ids[(thing_type, str(item[key_attribute]))] = (
+                    answer.map().get(thing_type).id
+                )
+
+    print(f"Inserted {str(inserted)} items from [{input['data_path']}] into Grakn.")
+    if missing:
+        print(
+            f"Skipped {len(missing)} items from [{input['data_path']}] with missing "
+            f"role players:"
+        )
+        for item, absent in missing:
+            print("  " + ", ".join(f"{role} {item[role]}" for role in absent))
+
+
+def resolve_concept_ids(session, entity_type):
+    """
+    Get the concept ids of all entities of the type with one query.
+
+    :param session: the grakn session
+    :param entity_type: the entity type
+
+    :return: (entity type, key) -> concept id
+    """
+    key_attribute = key_attribute_of(entity_type)
+    concept_ids = {}
+    with session.transaction().read() as transaction:
+        answers = transaction.query(
+            f"match $x isa {entity_type}, has {key_attribute} $k; get;"
+        )
+        for answer in answers:
+            key = str(answer.map().get("k").value())
+            concept_ids[(entity_type, key)] = answer.map().get("x").id
+    return concept_ids
 
 
 def bank_template(bank):
@@ -63,6 +158,13 @@ def account_template(account):
     return graql_insert_query
 
 
+def account_stub_template(account):
+    graql_insert_query = "insert $account isa account"
+    graql_insert_query += ', has account-number "' + account["account-number"] + '"'
+    graql_insert_query += ";"
+    return graql_insert_query
+
+
 def card_template(card):
     graql_insert_query = "insert $card isa card"
     graql_insert_query += ', has name-on-card "' + card["name-on-card"] + '"'
@@ -97,16 +199,10 @@ def mention_mapping_template(mapping):
     return graql_insert_query
 
 
-def contract_template(contract):
-    graql_insert_query = (
-        'match $bank isa bank, has name "' + contract["provider"] + '"; '
-    )
-    graql_insert_query += (
-        ' $customer isa person, has email "' + contract["customer"] + '"; '
-    )
-    graql_insert_query += (
-        ' $account isa account, has account-number "' + contract["offer"] + '"; '
-    )
+def contract_template(contract, ids):
+    graql_insert_query = "match $bank id " + ids["provider"] + "; "
+    graql_insert_query += " $customer id " + ids["customer"] + "; "
+    graql_insert_query += " $account id " + ids["offer"] + "; "
     graql_insert_query += " insert $contract(provider: $bank, customer: $customer, offer: $account) isa contract; "
     graql_insert_query += "$contract has identifier " + str(contract["identifier"]) + "; "
     graql_insert_query += "$contract has sign-date " + contract["sign-date"] + "; "
@@ -114,31 +210,19 @@ def contract_template(contract):
     return graql_insert_query
 
 
-def represented_by_template(represented_by):
-    graql_insert_query = (
-        'match $account isa account, has account-number "'
-        + represented_by["bank-account"]
-        + '";'
-    )
-    graql_insert_query += (
-        " $card isa card, has card-number " + represented_by["bank-card"] + "; "
-    )
+def represented_by_template(represented_by, ids):
+    graql_insert_query = "match $account id " + ids["bank-account"] + ";"
+    graql_insert_query += " $card id " + ids["bank-card"] + "; "
     graql_insert_query += " insert $representation(bank-card: $card, bank-account: $account) isa represented-by; "
     graql_insert_query += "$representation has identifier " + represented_by["identifier"] + "; "
     return graql_insert_query
 
 
-def transaction_template(transaction):
+def transaction_template(transaction, ids):
     graql_insert_query = (
-        " match $account-of-receiver isa account, has account-number '"
-        + transaction["account-of-receiver"]
-        + "';"
-    )
-    graql_insert_query += (
-        " $account-of-creator isa account, has account-number '"
-        + transaction["account-of-creator"]
-        + "';"
+        " match $account-of-receiver id " + ids["account-of-receiver"] + ";"
     )
+    graql_insert_query += " $account-of-creator id " + ids["account-of-creator"] + ";"
     graql_insert_query += (
         "insert $transaction(account-of-receiver: $account-of-receiver, account-of-creator: $account-of-creator) isa transaction; "
         + "$transaction has identifier "
@@ -169,33 +253,171 @@ def parse_data_to_dictionaries(input):
     return items
 
 
+def write_search_index(inputs, path):
+    """
+    Writes the search index of the transactions (see search_index.py), so that the
+    action server does not need to build it from Grakn.
+
+    :param inputs: the inputs of all data
+    :param path: file of the index
+    """
+    for input in inputs:
+        if thing_type_of(input) == "transaction":
+            if "items" in input:
+                items = input["items"]
+            else:
+                items = parse_data_to_dictionaries(input)
+            TransactionIndex.from_transactions(items).save(path)
+            print(f"Indexed {len(items)} transactions into [{path}].")
+
+
+def partition_inputs(inputs, router):
+    """
+    Partitions the data by customer (see sharding.py). The shared keyspace gets the
+    banks, the people and the mapping tables. Every shard gets the banks, its
+    customers, their accounts, cards and contracts and the transactions created by
+    their accounts. Accounts of other shards that receive a transaction are added
+    as stubs that only have an account number.
+
+    :param inputs: the inputs of all data
+    :param router: the router assigning customers to shards
+
+    :return: the inputs (including the items to load) per shard
+    """
+    data = {}
+    for input in inputs:
+        data[os.path.basename(input["data_path"])] = (
+            input,
+            parse_data_to_dictionaries(input),
+        )
+
+    shared = [
+        "bank",
+        "person",
+        "attribute_mapping",
+        "mention_mapping",
+        "entity_type_mapping",
+    ]
+    partitions = {
+        router.shared: [
+            dict(input, items=items)
+            for name, (input, items) in data.items()
+            if name in shared
+        ]
+    }
+
+    shard_of_account = {
+        contract["offer"]: router.shard_of(contract["customer"])
+        for contract in data["contract"][1]
+    }
+
+    for shard in router.shards:
+        accounts = {a for a, s in shard_of_account.items() if s == shard}
+        cards = {
+            r["bank-card"]
+            for r in data["represented-by"][1]
+            if r["bank-account"] in accounts
+        }
+        keep = {
+            "bank": lambda item: True,
+            "person": lambda item: router.shard_of(item["email"]) == shard,
+            "account": lambda item: item["account-number"] in accounts,
+            "card": lambda item: item["card-number"] in cards,
+            "represented-by": lambda item: item["bank-account"] in accounts,
+            "transaction": lambda item: item["account-of-creator"] in accounts,
+            "contract": lambda item: item["offer"] in accounts,
+        }
+
+        partitions[shard] = []
+        for name, (input, items) in data.items():
+            if name not in keep:
+                continue
+            partitions[shard].append(
+                dict(input, items=[item for item in items if keep[name](item)])
+            )
+
+            if name == "account":
+                receivers = {
+                    t["account-of-receiver"]
+                    for t in data["transaction"][1]
+                    if t["account-of-creator"] in accounts
+                }
+                partitions[shard].append(
+                    {
+                        "data_path": input["data_path"] + " (stubs)",
+                        "template": account_stub_template,
+                        "items": [
+                            {"account-number": a} for a in sorted(receivers - accounts)
+                        ],
+                    }
+                )
+
+    return partitions
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the csv files into Grakn.")
+    parser.add_argument(
+        "--data-path",
+        default="./knowledge_base/data",
+        help="directory containing the csv files",
+    )
+    parser.add_argument(
+        "--uri",
+        default=os.environ.get("GRAKN_URI", "localhost:48555").split(",")[0],
+        help="uri of the primary grakn server",
+    )
+    parser.add_argument("--keyspace", default="banking")
+    parser.add_argument(
+        "--shards",
+        help="json file of the shards (see sharding.py), partitions the data by "
+        "customer",
+    )
+    parser.add_argument(
+        "--search-index",
+        help="write the transaction search index (see search_index.py) to this file",
+    )
+    args = parser.parse_args()
+
     inputs = [
-        {"data_path": "./knowledge_base/data/person", "template": person_template},
-        {"data_path": "./knowledge_base/data/account", "template": account_template},
-        {"data_path": "./knowledge_base/data/bank", "template": bank_template},
-        {"data_path": "./knowledge_base/data/card", "template": card_template},
+        {"data_path": args.data_path + "/person", "template": person_template},
+        {"data_path": args.data_path + "/account", "template": account_template},
+        {"data_path": args.data_path + "/bank", "template": bank_template},
+        {"data_path": args.data_path + "/card", "template": card_template},
         {
-            "data_path": "./knowledge_base/data/attribute_mapping",
+            "data_path": args.data_path + "/attribute_mapping",
             "template": attribute_mapping_template,
         },
         {
-            "data_path": "./knowledge_base/data/mention_mapping",
+            "data_path": args.data_path + "/mention_mapping",
             "template": mention_mapping_template,
         },
         {
-            "data_path": "./knowledge_base/data/entity_type_mapping",
+            "data_path": args.data_path + "/entity_type_mapping",
             "template": entity_type_mapping_template,
         },
         {
-            "data_path": "./knowledge_base/data/represented-by",
+            "data_path": args.data_path + "/represented-by",
             "template": represented_by_template,
         },
         {
-            "data_path": "./knowledge_base/data/transaction",
+            "data_path": args.data_path + "/transaction",
             "template": transaction_template,
         },
-        {"data_path": "./knowledge_base/data/contract", "template": contract_template},
+        {"data_path": args.data_path + "/contract", "template": contract_template},
     ]
 
-    build_banking_graph(inputs)
+    if args.shards:
+        from sharding import ShardRouter
+
+        partitions = partition_inputs(inputs, ShardRouter.from_config(args.shards))
+        for shard, shard_inputs in partitions.items():
+            # writes go to the primary of the shard
+            uri = shard.uri if isinstance(shard.uri, str) else shard.uri[0]
+            print(f"Loading shard [{uri}/{shard.keyspace}] ...")
+            build_banking_graph(shard_inputs, uri, shard.keyspace)
+    else:
+        build_banking_graph(inputs, args.uri, args.keyspace)
+
+    if args.search_index:
+        write_search_index(inputs, args.search_index)
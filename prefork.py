@@ -0,0 +1,189 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import tempfile
+import time
+from typing import Callable, Dict, Optional, Text
+
+import startup
+from profiling import get_profiler
+
+logger = logging.getLogger(__name__)
+
+
+def load_knowledge_base(
+    snapshot_path: Optional[Text] = None, data_path: Optional[Text] = None
+):
+    """
+    Loads the knowledge base shared by the workers. The knowledge base is served
+    from a snapshot (see snapshot.py): its columns are memory-mapped files, so
+    their pages are shared by all processes instead of being copied into every
+    worker. The csv files are converted into a temporary snapshot first.
+
+    :param snapshot_path: directory of the snapshot
+    :param data_path: directory of the csv files, used if no snapshot is given
+
+    :return: the knowledge base
+    """
+    from snapshot import SnapshotGraph, read_csv_tables, write_snapshot
+
+    if snapshot_path is None:
+        if data_path is None:
+            raise ValueError("Either a snapshot or the csv files are required.")
+        snapshot_path = tempfile.mkdtemp(prefix="knowledge-base-")
+        tables, mappings = read_csv_tables(data_path)
+        write_snapshot(tables, mappings, snapshot_path)
+        logger.info(f"Converted [{data_path}] to the snapshot [{snapshot_path}].")
+
+    return SnapshotGraph(snapshot_path)
+
+
+def listen(port: int, backlog: int = 1024) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket):
+    """
+    Serves the actions on the shared socket, the kernel distributes the
+    connections among the workers.
+    """
+    from rasa_sdk.endpoint import create_app
+
+    app = create_app("actions")
+    app.run(sock=sock, workers=1, access_log=False)
+
+
+def supervise(
+    sock: socket.socket,
+    workers: int,
+    worker: Callable[[socket.socket], None] = run_worker,
+    min_uptime: float = 1.0,
+):
+    """
+    Forks the workers and restarts the ones that exit, until the parent receives
+    SIGTERM or SIGINT, which is passed on to the workers.
+
+    :param sock: listening socket shared by the workers
+    :param workers: number of worker processes
+    :param worker: function serving requests in a worker
+    :param min_uptime: seconds a worker has to run before it is restarted right
+                       away, workers failing on startup are restarted after a pause
+    """
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            status = 0
+            try:
+                worker(sock)
+            except BaseException:
+                logger.exception("Worker failed.")
+                status = 1
+            finally:
+                os._exit(status)
+        children[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}.")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+
+        logger.warning(f"Worker {pid} exited with status {status}, restarting it.")
+        if time.monotonic() - started < min_uptime:
+            time.sleep(min_uptime)
+        spawn()
+
+
+def main(
+    port: int,
+    workers: int,
+    snapshot_path: Optional[Text] = None,
+    data_path: Optional[Text] = None,
+):
+    """
+    Runs the action server in pre-fork mode: the parent loads the knowledge base,
+    builds the indexes and warms up once, then forks the workers. The workers share
+    the memory of the parent copy-on-write; the snapshot columns are file-backed
+    and the python objects built during the warm-up are frozen (gc.freeze), so
+    that the garbage collector does not touch, and thereby copy, their pages.
+    """
+    readiness_port = os.environ.pop(startup.READINESS_PORT_ENV, None)
+    # the parent warms up before forking, importing the actions must not start it
+    os.environ.pop(startup.WARM_UP_ENV, None)
+
+    import actions
+
+    actions.set_knowledge_base(load_knowledge_base(snapshot_path, data_path))
+    startup.warm_up(actions._warm_up_tasks())
+
+    sock = listen(port)
+
+    # the admin endpoint of the parent changes the profiling rate of the workers
+    get_profiler().share()
+
+    gc.collect()
+    gc.freeze()
+
+    if readiness_port:
+        # the health endpoints are served by the parent, which is ready now
+        startup.serve_health(int(readiness_port))
+
+    logger.info(f"Serving the actions on port {port} with {workers} workers.")
+    supervise(sock, workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the action server with pre-forked workers sharing the "
+        "knowledge base."
+    )
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="number of workers"
+    )
+    parser.add_argument(
+        "--snapshot",
+        default=os.environ.get("KNOWLEDGE_BASE_SNAPSHOT"),
+        help="directory of the snapshot (see snapshot.py)",
+    )
+    parser.add_argument(
+        "--data-path",
+        default="./knowledge_base/data",
+        help="directory of the csv files, used if no snapshot is given",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    main(args.port, args.workers, args.snapshot, args.data_path)
@@ -0,0 +1,302 @@
+import argparse
+import atexit
+import functools
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Text
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the action runs that are profiled, e.g. 0.05 (default: none).
+PROFILING_RATE_ENV = "ACTION_PROFILING_RATE"
+# Directory the profiles are written to (default: ./profiles).
+PROFILING_DIR_ENV = "ACTION_PROFILING_DIR"
+
+
+def _frame_name(frame) -> Text:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class Profiler(object):
+    """
+    Sampling profiler of action runs. While a sampled run is active, a background
+    thread reads the stack of the thread executing the run every interval (see
+    sys._current_frames) and counts the stacks per action. Runs that are not
+    sampled, and the action server while no sampled run is active, pay nothing
+    but a random number.
+
+    The counts are written to <directory>/<action>.<pid>.folded in the collapsed
+    stack format of flamegraph.pl and speedscope, one 'frame;frame;frame count'
+    line per stack, outermost frame first.
+
+    The rate can be shared with forked processes (see share), e.g. with the
+    workers of a pre-forked action server, so that the admin endpoint served by
+    the parent changes the rate of the workers.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        directory: Text = "profiles",
+        interval: float = 0.005,
+        flush_interval: float = 10.0,
+    ):
+        """
+        :param rate: fraction of the runs that are profiled
+        :param directory: directory the profiles are written to
+        :param interval: seconds between two samples
+        :param flush_interval: seconds between two writes of the profiles
+        """
+        self._rate = rate
+        self._shared_rate = None
+        self.directory = directory
+        self.interval = interval
+        self.flush_interval = flush_interval
+
+        # action -> stack -> number of samples
+        self.stacks = defaultdict(Counter)
+        self.runs = Counter()
+
+        self._active = {}
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler = None
+        # threads do not survive a fork, a child samples its own runs
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.stacks = defaultdict(Counter)
+        self.runs = Counter()
+        self._active = {}
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler = None
+
+    @property
+    def rate(self) -> float:
+        if self._shared_rate is not None:
+            return self._shared_rate.value
+        return self._rate
+
+    def share(self):
+        """
+        Shares the rate with the processes forked from now on: a change of the rate
+        in any of them changes it in all of them.
+        """
+        if self._shared_rate is None:
+            self._shared_rate = multiprocessing.RawValue("d", self._rate)
+
+    def set_rate(self, rate: float):
+        """
+        Changes the fraction of the profiled runs, 0 disables profiling and writes
+        the profiles collected so far. Processes sharing the rate write theirs
+        within the flush interval.
+        """
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError(f"Invalid profiling rate {rate}.")
+        self._rate = rate
+        if self._shared_rate is not None:
+            self._shared_rate.value = rate
+        logger.info(f"Profiling {rate:.1%} of the action runs.")
+        if rate == 0.0:
+            self.flush()
+
+    def sampled(self) -> bool:
+        return self.rate > 0.0 and random.random() < self.rate
+
+    def _start_sampler(self):
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._sample_loop, name="profiler", daemon=True
+                )
+                self._sampler.start()
+
+    def _sample_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            if not self._active:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+            else:
+                time.sleep(self.interval)
+                self._sample()
+
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for thread_id, (action, root) in self._active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                # the frames above the run belong to the action server
+                while frame is not None and frame is not root:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if frame is root:
+                    stack.append(action)
+                    self.stacks[action][";".join(reversed(stack))] += 1
+                    self._changed.add(action)
+
+    def profile(self, action: Text, run: Callable, *args: Any) -> Any:
+        """
+        Executes the run, profiles it if it is sampled.
+
+        :param action: name of the action
+        :param run: the run
+        :param args: arguments of the run
+        """
+        if not self.sampled():
+            return run(*args)
+
+        self._start_sampler()
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = (action, sys._getframe())
+            self.runs[action] += 1
+        self._wake.set()
+        try:
+            return run(*args)
+        finally:
+            with self._lock:
+                del self._active[thread_id]
+
+    def flush(self):
+        """
+        Writes the profiles of the actions that were sampled since the last write.
+        """
+        with self._lock:
+            changed = {a: dict(self.stacks[a]) for a in self._changed}
+            self._changed = set()
+
+        if not changed:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        for action, stacks in changed.items():
+            path = os.path.join(self.directory, f"{action}.{os.getpid()}.folded")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            os.replace(path + ".tmp", path)
+
+    def written_samples(self) -> Dict[Text, int]:
+        """
+        Get the number of samples per action in the profiles of the directory, i.e.
+        of all processes writing to it, as of their last write.
+        """
+        samples = Counter()
+        if not os.path.isdir(self.directory):
+            return {}
+
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".folded"):
+                continue
+            action = file_name.rsplit(".", 2)[0]
+            with open(os.path.join(self.directory, file_name), encoding="utf-8") as f:
+                for line in f:
+                    samples[action] += int(line.rstrip("\n").rpartition(" ")[2])
+        return dict(samples)
+
+    def status(self) -> Dict[Text, Any]:
+        """
+        Get the rate, the runs and samples of this process and the samples written
+        by all processes, e.g. by the workers of a pre-forked action server.
+        """
+        with self._lock:
+            status = {
+                "rate": self.rate,
+                "directory": self.directory,
+                "runs": dict(self.runs),
+                "samples": {a: sum(s.values()) for a, s in self.stacks.items()},
+            }
+        status["written"] = self.written_samples()
+        return status
+
+
+_profiler = None
+
+
+def get_profiler() -> Profiler:
+    """
+    Get the profiler of the action server. It is configured by the environment
+    variables ACTION_PROFILING_RATE and ACTION_PROFILING_DIR, the rate can be
+    changed at runtime by the admin endpoint (see startup.py).
+    """
+    global _profiler
+
+    if _profiler is None:
+        _profiler = Profiler(
+            float(os.environ.get(PROFILING_RATE_ENV, 0.0)),
+            os.environ.get(PROFILING_DIR_ENV, "profiles"),
+        )
+        atexit.register(_profiler.flush)
+    return _profiler
+
+
+def profile_action(run: Callable) -> Callable:
+    """
+    Decorator for the run method of an action. A sampled fraction of the runs is
+    profiled (see Profiler).
+    """
+
+    @functools.wraps(run)
+    def wrapper(self, dispatcher, tracker, domain):
+        return get_profiler().profile(
+            self.name(), run, self, dispatcher, tracker, domain
+        )
+
+    return wrapper
+
+
+def top_functions(path: Text, limit: int = 20):
+    """
+    Prints the functions with the most samples of a profile written by the
+    Profiler, once including the functions they call (total) and once
+    excluding them (self).
+
+    :param path: file of the profile
+    :param limit: number of functions to print
+    """
+    total = Counter()
+    own = Counter()
+    samples = 0
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            frames = stack.split(";")
+            count = int(count)
+            samples += count
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+
+    print(f"{samples} samples")
+    print(f"{'function':<64}{'total':>8}{'self':>8}")
+    for function, count in total.most_common(limit):
+        print(f"{function:<64}{count / samples:>8.1%}{own[function] / samples:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print the functions with the most samples of a profile."
+    )
+    parser.add_argument("file", help="profile written with ACTION_PROFILING_RATE")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    top_functions(args.file, args.limit)
@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Hashable, Iterable, Optional, Text, Tuple
+
+from change_events import ChangeEvent
+
+# a tag names the things a cached result depends on: (type, key) for a single
+# thing, (type, None) for any thing of the type
+Tag = Tuple[Text, Optional[Text]]
+
+
+class QueryCache(object):
+    """
+    LRU cache of query results. Every result is tagged with the things it depends
+    on, a change event only invalidates the results depending on the changed thing.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+
+        self._results = OrderedDict()
+        self._tags = {}
+        self._keys_by_tag = defaultdict(set)
+        self._lock = threading.Lock()
+
+        # incremented by every invalidation, results computed before an
+        # invalidation are not cached
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        :return: whether the key is cached and the cached result
+        """
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return True, self._results[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, result: Any, tags: Iterable[Tag], generation: int):
+        """
+        Caches the result, unless the cache was invalidated since the generation
+        the result was computed in.
+
+        :param key: key of the query
+        :param result: result of the query
+        :param tags: things the result depends on
+        :param generation: generation of the cache before the query was executed
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._remove(key)
+            self._results[key] = result
+            self._tags[key] = set(tags)
+            for tag in self._tags[key]:
+                self._keys_by_tag[tag].add(key)
+
+            while len(self._results) > self.max_size:
+                self._remove(next(iter(self._results)))
+
+    def _remove(self, key: Hashable):
+        if key not in self._results:
+            return
+        del self._results[key]
+        for tag in self._tags.pop(key):
+            self._keys_by_tag[tag].discard(key)
+            if not self._keys_by_tag[tag]:
+                del self._keys_by_tag[tag]
+
+    def invalidate(self, event: ChangeEvent) -> int:
+        """
+        Removes the results depending on the changed thing: a change of a single
+        thing invalidates the results tagged with that thing or its whole type,
+        a change of several things of a type invalidates all results tagged with the
+        type, a change of an unknown type invalidates everything.
+
+        :param event: the change event
+        :return: number of removed results
+        """
+        with self._lock:
+            self.generation += 1
+            if event.thing_type is None:
+                removed = len(self._results)
+                self._results.clear()
+                self._tags.clear()
+                self._keys_by_tag.clear()
+                return removed
+
+            if event.key is None:
+                tags = [t for t in self._keys_by_tag if t[0] == event.thing_type]
+            else:
+                tags = [(event.thing_type, str(event.key)), (event.thing_type, None)]
+
+            keys = set()
+            for tag in tags:
+                keys |= self._keys_by_tag.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def __len__(self):
+        return len(self._results)
@@ -0,0 +1,296 @@
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Text, Union
+
+from change_events import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+# length of the period of a bucket in an iso date, e.g. '2019-12' for a month
+GRANULARITIES = {"day": 10, "month": 7}
+
+DateLike = Union[Text, datetime.date, datetime.datetime]
+
+
+def period_of(date: DateLike, granularity: Text) -> Text:
+    """
+    Get the period of the given granularity containing the date.
+
+    :param date: date, datetime or iso string
+    :param granularity: 'day' or 'month'
+
+    :return: the period as iso string, e.g. '2019-12-16' or '2019-12'
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'.")
+    if not isinstance(date, str):
+        date = date.isoformat()
+    return date[: GRANULARITIES[granularity]]
+
+
+def _account_number(account: Any) -> Text:
+    # role players are rows, the csv files reference them by their key
+    if isinstance(account, Mapping):
+        return str(account["account-number"])
+    return str(account)
+
+
+class RollupTable(object):
+    """
+    Sum, count, minimum and maximum of the amounts of transactions per creating
+    account, category and day or month. The buckets are stored per account, so a
+    summary of an account reads its buckets only, not its transactions.
+    """
+
+    def __init__(self):
+        # account -> (granularity, category, period) -> [sum, count, min, max]
+        self.buckets = defaultdict(dict)
+
+    @classmethod
+    def from_transactions(
+        cls, transactions: Iterable[Dict[Text, Any]]
+    ) -> "RollupTable":
+        table = cls()
+        for transaction in transactions:
+            table.add(transaction)
+        return table
+
+    def add(self, transaction: Dict[Text, Any]):
+        """
+        Adds the amount of the transaction to its buckets.
+
+        :param transaction: the transaction as returned by a knowledge base or read
+                            from the csv file
+        """
+        account = _account_number(transaction["account-of-creator"])
+        category = str(transaction.get("category"))
+        amount = float(transaction["amount"])
+
+        for granularity in GRANULARITIES:
+            key = (
+                granularity,
+                category,
+                period_of(transaction["execution-date"], granularity),
+            )
+            bucket = self.buckets[account].get(key)
+            if bucket is None:
+                self.buckets[account][key] = [amount, 1, amount, amount]
+            else:
+                bucket[0] += amount
+                bucket[1] += 1
+                bucket[2] = min(bucket[2], amount)
+                bucket[3] = max(bucket[3], amount)
+
+    def query(
+        self,
+        accounts: Optional[Set[Text]] = None,
+        granularity: Text = "month",
+        category: Optional[Text] = None,
+        start: Optional[DateLike] = None,
+        end: Optional[DateLike] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Get the buckets of the given accounts.
+
+        :param accounts: account numbers (default: all accounts)
+        :param granularity: 'day' or 'month'
+        :param category: only buckets of this category (default: all categories)
+        :param start: first day or month (default: no limit)
+        :param end: last day or month, inclusive (default: no limit)
+
+        :return: the buckets ordered by period, account and category
+        """
+        start = period_of(start, granularity) if start is not None else None
+        end = period_of(end, granularity) if end is not None else None
+        if accounts is None:
+            accounts = self.buckets.keys()
+
+        rows = []
+        for account in accounts:
+            for (g, c, period), (total, count, low, high) in self.buckets.get(
+                account, {}
+            ).items():
+                if g != granularity or (category is not None and c != category):
+                    continue
+                if (start is not None and period < start) or (
+                    end is not None and period > end
+                ):
+                    continue
+                rows.append(
+                    {
+                        "account-number": account,
+                        "category": c,
+                        "period": period,
+                        "sum": round(total, 2),
+                        "count": count,
+                        "min": low,
+                        "max": high,
+                    }
+                )
+
+        return sorted(
+            rows, key=lambda r: (r["period"], r["account-number"], r["category"])
+        )
+
+    def save(self, path: Text):
+        """
+        Writes the buckets as json lines to the given file.
+        """
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for account, buckets in self.buckets.items():
+                for key, bucket in buckets.items():
+                    f.write(json.dumps([account, *key, *bucket]) + "\n")
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: Text) -> "RollupTable":
+        table = cls()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                account, granularity, category, period, *bucket = json.loads(line)
+                table.buckets[account][(granularity, category, period)] = bucket
+        return table
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self.buckets.values())
+
+
+class TransactionRollups(object):
+    """
+    Rollup table of a graph database. The table is loaded from the file written by
+    the batch job (see the main block) or, without a file, built from the
+    transactions of the user on first use. Inserted transactions are added by their
+    change events. Other changes of transactions, i.e. updates, deletions or
+    changes of several transactions, cannot be applied to the sums, they rebuild
+    the table from the graph database. The changes are applied before the next
+    query, they are recorded under a lock of their own, so the event bus and the
+    writer are not blocked by a query.
+    """
+
+    def __init__(
+        self,
+        get_transactions: Callable[[Optional[Any]], List[Dict[Text, Any]]],
+        path: Optional[Text] = None,
+    ):
+        """
+        :param get_transactions: function querying the transaction with the given
+                                 identifier, or the transactions of the user if
+                                 the identifier is None
+        :param path: file of the rollup table (see RollupTable.save)
+        """
+        self.get_transactions = get_transactions
+        self.path = path
+
+        self._table = None
+        self._counted = set()
+        self._lock = threading.Lock()
+
+        # changes since the last query, they are tracked once the table is loaded
+        self._pending = []
+        self._stale = False
+        self._tracking = False
+        self._pending_lock = threading.Lock()
+
+    def on_change(self, event: ChangeEvent):
+        """
+        Records the change, it is applied before the next query.
+        """
+        if event.thing_type not in [None, "transaction"]:
+            return
+
+        with self._pending_lock:
+            if not self._tracking:
+                return
+            # an insert names the key attribute, it cannot be changed by an update
+            if event.key is not None and "identifier" in event.attributes:
+                self._pending.append(event.key)
+            else:
+                self._stale = True
+                self._pending = []
+
+    def _load(self):
+        if self.path is not None and os.path.exists(self.path):
+            self._table = RollupTable.load(self.path)
+            self._counted = set()
+        else:
+            transactions = self.get_transactions(None)
+            self._table = RollupTable.from_transactions(transactions)
+            self._counted = {str(t["identifier"]) for t in transactions}
+        logger.debug(f"Loaded the rollup table of {len(self._table)} buckets.")
+
+    def query(self, accounts: Optional[Set[Text]] = None, **kwargs: Any):
+        """
+        Query the rollup table after applying the pending changes (see
+        RollupTable.query).
+        """
+        with self._lock:
+            with self._pending_lock:
+                self._tracking = True
+                pending, stale = self._pending, self._stale
+                self._pending, self._stale = [], False
+
+            if stale:
+                # the rollup file is outdated as well
+                self._table = None
+                self.path = None
+
+            try:
+                if self._table is None:
+                    self._load()
+
+                for identifier in pending:
+                    # the same insert is only counted once
+                    if str(identifier) in self._counted:
+                        continue
+                    for transaction in self.get_transactions(identifier):
+                        self._table.add(transaction)
+                    self._counted.add(str(identifier))
+            except Exception:
+                # the changes are applied by the next query
+                with self._pending_lock:
+                    self._pending = pending + self._pending
+                raise
+
+            return self._table.query(accounts, **kwargs)
+
+
+def read_csv_transactions(data_path: Text) -> List[Dict[Text, Any]]:
+    with open(os.path.join(data_path, "transaction.csv"), encoding="utf-8") as f:
+        return list(csv.DictReader(f, skipinitialspace=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute the transaction rollups of all accounts."
+    )
+    parser.add_argument("output", help="file of the rollup table")
+    parser.add_argument(
+        "--data-path", help="read the csv files in this directory instead of Grakn"
+    )
+    parser.add_argument("--uri", default="localhost:48555")
+    parser.add_argument("--keyspace", default="banking")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.data_path:
+        transactions = read_csv_transactions(args.data_path)
+    else:
+        from graph_database import GraphDatabase
+
+        transactions = GraphDatabase(
+            args.uri, args.keyspace
+        )._execute_transaction_query("")
+    table = RollupTable.from_transactions(transactions)
+    table.save(args.output)
+    print(
+        f"Rolled up {len(transactions)} transactions into {len(table)} buckets "
+        f"in [{args.output}] in {time.time() - start:.1f}s."
+    )
@@ -0,0 +1,150 @@
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional, Text, Type
+
+from schema import relations, schema
+
+# accounts are listed together with the provider and the customer of their contract
+LISTED_ROLES = {"account": ["provider", "customer"]}
+
+
+class Row(MutableMapping):
+    """
+    Compact representation of an entity or relation returned by a knowledge base.
+    A row class is generated per type (see row_class): the attributes known from
+    schema.py are stored in __slots__, the type is shared by all rows of the class.
+    Unknown keys are kept in a dict that is only created when needed.
+
+    Rows behave like the dicts returned before, including dotted keys such as
+    'provider.name' that access the attributes of role players.
+    """
+
+    __slots__ = ()
+
+    _type = None
+    _keys = ()
+    _slot_of = {}
+
+    def __init__(self, values: Optional[Dict[Text, Any]] = None, **kwargs: Any):
+        self._extra = None
+        if values:
+            for key, value in values.items():
+                self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __getitem__(self, key: Text) -> Any:
+        slot = self._slot_of.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key) from None
+
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        if key == "type":
+            return self._type
+        if "." in key:
+            value = self
+            for k in key.split("."):
+                value = value[k]
+            return value
+        raise KeyError(key)
+
+    def __setitem__(self, key: Text, value: Any):
+        slot = self._slot_of.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+        elif key == "type" and value == self._type and not self._extra:
+            pass
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: Text):
+        slot = self._slot_of.get(key)
+        try:
+            if slot is not None:
+                delattr(self, slot)
+            else:
+                del self._extra[key]
+        except (AttributeError, KeyError, TypeError):
+            raise KeyError(key) from None
+
+    def __iter__(self) -> Iterator[Text]:
+        if self._type is not None and not (self._extra and "type" in self._extra):
+            yield "type"
+        for key in self._keys:
+            if hasattr(self, self._slot_of[key]):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __reduce__(self):
+        return to_row, (self._type, dict(self))
+
+    def __repr__(self) -> Text:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+_row_classes = {}
+
+
+def _fields(entity_type: Text):
+    if entity_type in schema:
+        fields = [schema[entity_type]["key"]] + schema[entity_type]["attributes"]
+        fields += [a for a in schema[entity_type]["representation"] if "." not in a]
+    else:
+        fields = []
+    fields += list(relations.get(entity_type, {}).keys())
+    fields += LISTED_ROLES.get(entity_type, [])
+
+    return ["id"] + list(dict.fromkeys(fields))
+
+
+def row_class(entity_type: Text) -> Type[Row]:
+    """
+    Get the row class of the given type. The class is generated on first use from
+    the key, the attributes and the roles of the type (see schema.py).
+
+    :param entity_type: entity or relation type
+    :return: the row class
+    """
+    if entity_type not in _row_classes:
+        keys = _fields(entity_type)
+        slot_of = {key: key.replace("-", "_") for key in keys}
+        name = "".join(part.capitalize() for part in entity_type.split("-")) + "Row"
+        _row_classes[entity_type] = type(
+            name,
+            (Row,),
+            {
+                "__slots__": tuple(slot_of.values()) + ("_extra",),
+                "_type": entity_type,
+                "_keys": tuple(keys),
+                "_slot_of": slot_of,
+            },
+        )
+    return _row_classes[entity_type]
+
+
+def to_row(entity_type: Text, values: Dict[Text, Any]) -> Row:
+    """
+    Converts the attributes of an entity or relation to a row of its type.
+
+    :param entity_type: entity or relation type
+    :param values: attributes (and role players) by name
+
+    :return: the row
+    """
+    return row_class(entity_type)(values)
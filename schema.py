@@ -8,12 +8,21 @@ schema = {
             "account-of-receiver.account-number",
             "amount",
         ],
+        # latest transactions first
+        "sort_by": "execution-date",
+        "sort_descending": True,
+    },
+    "contract": {
+        "attributes": ["sign-date"],
+        "key": "identifier",
+        "representation": ["identifier"],
+        "sort_by": "identifier",
     },
-    "contract": {"attributes": ["sign-date"], "key": "identifier", "representation": ["identifier"]},
     "account": {
         "attributes": ["balance", "account-type", "opening-date", "account-number"],
         "key": "account-number",
         "representation": ["provider.name", "account-number", "account-type"],
+        "sort_by": "provider.name",
     },
     "bank": {
         "attributes": [
@@ -29,6 +38,7 @@ schema = {
         ],
         "key": "name",
         "representation": ["name"],
+        "sort_by": "name",
     },
     "person": {
         "attributes": [
@@ -41,10 +51,60 @@ schema = {
         ],
         "key": "email",
         "representation": ["first-name", "last-name"],
+        "sort_by": "first-name",
     },
     "card": {
         "attributes": ["name-on-card", "expiry-date", "created-date", "card-number"],
         "key": "card-number",
         "representation": ["name-on-card", "card-number"],
+        "sort_by": "name-on-card",
+    },
+}
+
+# datatypes of the attributes as defined in knowledge_base/schema.gql
+attribute_types = {
+    "mapping-key": "string",
+    "mapping-value": "string",
+    "execution-date": "date",
+    "created-date": "date",
+    "expiry-date": "date",
+    "sign-date": "date",
+    "opening-date": "date",
+    "email": "string",
+    "name": "string",
+    "first-name": "string",
+    "last-name": "string",
+    "city": "string",
+    "headquarters": "string",
+    "balance": "double",
+    "account-number": "string",
+    "account-type": "string",
+    "card-number": "long",
+    "amount": "double",
+    "reference": "string",
+    "category": "string",
+    "phone-number": "string",
+    "gender": "string",
+    "country": "string",
+    "allowed-residents": "string",
+    "free-accounts": "boolean",
+    "english-customer-service": "boolean",
+    "english-website": "boolean",
+    "english-mobile-app": "boolean",
+    "free-worldwide-withdrawals": "boolean",
+    "identifier": "long",
+    "name-on-card": "string",
+}
+
+# role players of the relations as defined in knowledge_base/schema.gql
+relations = {
+    "contract": {"provider": "bank", "customer": "person", "offer": "account"},
+    "represented-by": {"bank-account": "account", "bank-card": "card"},
+    "transaction": {
+        "account-of-receiver": "account",
+        "account-of-creator": "account",
     },
 }
+
+# mapping tables as defined in knowledge_base/schema.gql
+mapping_types = ["attribute-mapping", "entity-type-mapping", "mention-mapping"]
@@ -0,0 +1,286 @@
+import bisect
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Text
+
+from change_events import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+# the attributes of a transaction that are searched
+SEARCH_FIELDS = ["reference", "category"]
+
+
+def tokenize(text: Text) -> List[Text]:
+    return re.findall(r"\w+", str(text).casefold())
+
+
+class InvertedIndex(object):
+    """
+    Maps the tokens of the indexed texts to the documents containing them. Every
+    token of a search matches the tokens starting with it, e.g. 'past' matches
+    'pasta', all tokens of a search have to match.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.tokens = {}
+
+        # sorted tokens for prefix lookups, built on the first lookup after a change
+        self._vocabulary = None
+
+    def add(self, document: Hashable, texts: Iterable[Text]):
+        """
+        Indexes the texts of the document, replacing the texts indexed before.
+
+        :param document: id of the document
+        :param texts: the texts of the document
+        """
+        self.remove(document)
+
+        tokens = {token for text in texts if text for token in tokenize(text)}
+        self.tokens[document] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                self._vocabulary = None
+            self.postings[token].add(document)
+
+    def remove(self, document: Hashable):
+        for token in self.tokens.pop(document, ()):
+            self.postings[token].discard(document)
+            if not self.postings[token]:
+                del self.postings[token]
+                self._vocabulary = None
+
+    def lookup(self, term: Text) -> Set[Hashable]:
+        """
+        Get the documents containing a token starting with the term.
+        """
+        vocabulary = self._vocabulary
+        if vocabulary is None:
+            vocabulary = self._vocabulary = sorted(self.postings)
+
+        documents = set()
+        i = bisect.bisect_left(vocabulary, term)
+        while i < len(vocabulary) and vocabulary[i].startswith(term):
+            documents |= self.postings.get(vocabulary[i], set())
+            i += 1
+        return documents
+
+    def search(self, text: Text) -> Set[Hashable]:
+        """
+        Get the documents matching all tokens of the text.
+        """
+        terms = tokenize(text)
+        if not terms:
+            return set()
+
+        # start with the rarest term, the candidates only shrink
+        matches = sorted((self.lookup(term) for term in terms), key=len)
+        documents = set(matches[0])
+        for other in matches[1:]:
+            documents &= other
+        return documents
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def _account_number(account: Any) -> Text:
+    # role players are rows, the csv files reference them by their key
+    if isinstance(account, Mapping):
+        return str(account["account-number"])
+    return str(account)
+
+
+def _date(value: Any) -> Text:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class TransactionIndex(object):
+    """
+    Inverted index over the reference and the category of transactions (see
+    SEARCH_FIELDS). Besides the tokens, the index keeps the execution date and the
+    creating account of every transaction, so that a search is filtered by account
+    and ordered without reading the transactions.
+    """
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self.documents = {}
+
+    @classmethod
+    def from_transactions(
+        cls, transactions: Iterable[Dict[Text, Any]]
+    ) -> "TransactionIndex":
+        index = cls()
+        for transaction in transactions:
+            index.add(transaction)
+        return index
+
+    def add(self, transaction: Dict[Text, Any]):
+        """
+        Indexes the transaction, replacing its previous version.
+
+        :param transaction: the transaction as returned by a knowledge base or read
+                            from the csv file
+        """
+        identifier = str(transaction["identifier"])
+        self.documents[identifier] = (
+            _date(transaction.get("execution-date")),
+            _account_number(transaction["account-of-creator"]),
+            tuple(transaction.get(f) for f in SEARCH_FIELDS),
+        )
+        self.index.add(identifier, self.documents[identifier][2])
+
+    def remove(self, identifier: Any):
+        self.documents.pop(str(identifier), None)
+        self.index.remove(str(identifier))
+
+    def search(
+        self, text: Text, accounts: Optional[Set[Text]] = None, limit: int = 10
+    ) -> List[Text]:
+        """
+        Search the transactions by their reference and category.
+
+        :param text: the search text, e.g. 'pasta bar'
+        :param accounts: account numbers, only transactions created by these
+                         accounts are returned (default: all accounts)
+        :param limit: maximum number of transactions to return
+
+        :return: identifiers of the matching transactions, latest first
+        """
+        identifiers = self.index.search(text)
+        if accounts is not None:
+            identifiers = [i for i in identifiers if self.documents[i][1] in accounts]
+
+        return sorted(identifiers, key=lambda i: self.documents[i][0], reverse=True)[
+            :limit
+        ]
+
+    def save(self, path: Text):
+        """
+        Writes the indexed transactions as json lines to the given file.
+        """
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for identifier, (date, creator, texts) in self.documents.items():
+                line = dict(
+                    zip(SEARCH_FIELDS, texts),
+                    identifier=identifier,
+                    **{"execution-date": date, "account-of-creator": creator},
+                )
+                f.write(json.dumps(line, default=str) + "\n")
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: Text) -> "TransactionIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_transactions(json.loads(line) for line in f)
+
+    def __len__(self):
+        return len(self.documents)
+
+
+class TransactionSearch(object):
+    """
+    Transaction index of a graph database. The index is loaded from the file
+    written by knowledge_base/migrate.py or, without a file, built from the graph
+    database on first use. It is kept up to date by the change events: a changed
+    transaction is queried again, a change of several transactions rebuilds the
+    index. The changes are applied before the next search, they are recorded under
+    a lock of their own, so the event bus is not blocked by a search.
+    """
+
+    def __init__(
+        self,
+        execute_transaction_query: Callable[[Text], List[Dict[Text, Any]]],
+        path: Optional[Text] = None,
+    ):
+        """
+        :param execute_transaction_query: function executing a transaction query,
+                                          restricted by the given graql clause
+                                          (empty to get all transactions)
+        :param path: file of the index (see TransactionIndex.save)
+        """
+        self.execute_transaction_query = execute_transaction_query
+        self.path = path
+
+        self._index = None
+        self._lock = threading.Lock()
+
+        # changes since the last search, they are tracked once the index is loaded
+        self._pending = []
+        self._stale = False
+        self._tracking = False
+        self._pending_lock = threading.Lock()
+
+    def on_change(self, event: ChangeEvent):
+        """
+        Records the change, it is applied before the next search.
+        """
+        if event.thing_type not in [None, "transaction"]:
+            return
+
+        with self._pending_lock:
+            if not self._tracking:
+                return
+            if event.thing_type is None or event.key is None:
+                self._stale = True
+                self._pending = []
+            else:
+                self._pending.append(event.key)
+
+    def _build(self) -> TransactionIndex:
+        if self.path is not None and os.path.exists(self.path):
+            index = TransactionIndex.load(self.path)
+        else:
+            index = TransactionIndex.from_transactions(
+                self.execute_transaction_query("")
+            )
+        logger.debug(f"Loaded the search index of {len(index)} transactions.")
+        return index
+
+    def search(
+        self, text: Text, accounts: Optional[Set[Text]] = None, limit: int = 10
+    ) -> List[Text]:
+        """
+        Search the transactions after applying the pending changes (see
+        TransactionIndex.search).
+        """
+        with self._lock:
+            with self._pending_lock:
+                self._tracking = True
+                pending, stale = self._pending, self._stale
+                self._pending, self._stale = [], False
+
+            if stale:
+                # the index file is outdated as well
+                self._index = None
+                self.path = None
+
+            try:
+                if self._index is None:
+                    self._index = self._build()
+
+                for identifier in pending:
+                    transactions = self.execute_transaction_query(
+                        f"$transaction has identifier {int(identifier)};"
+                    )
+                    self._index.remove(identifier)
+                    for transaction in transactions:
+                        self._index.add(transaction)
+            except Exception:
+                # the changes are applied by the next search
+                with self._pending_lock:
+                    self._pending = pending + self._pending
+                raise
+
+            return self._index.search(text, accounts, limit)
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Text
+
+from graph_database import GraphDatabase, KnowledgeBase
+from writes import key_attribute_of
+
+Shard = namedtuple("Shard", ["uri", "keyspace"])
+
+# entity types that are not related to a customer, they are stored in the shared
+# keyspace (together with the mapping tables)
+SHARED_ENTITY_TYPES = ["bank", "person"]
+
+
+def _gather(futures: List[Future]) -> Future:
+    """
+    Get a future that is resolved once all futures are, it fails with the first
+    error of the futures.
+    """
+    if len(futures) == 1:
+        return futures[0]
+
+    gathered = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                gathered.set_exception(future.exception())
+                return
+        gathered.set_result(None)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return gathered
+
+
+class ShardRouter(object):
+    """
+    Maps customers, identified by their email, to the shard, i.e. the grakn server
+    and keyspace, that stores their accounts, cards, contracts and transactions.
+    Data that is independent of a customer, such as banks and the mapping tables,
+    lives in a shared keyspace.
+
+    Customers are assigned by rendezvous hashing: every customer belongs to the
+    shard with the highest hash of customer and shard. Adding a shard only moves
+    the customers that now belong to the new shard.
+    """
+
+    def __init__(self, shards: List[Shard], shared: Shard):
+        if not shards:
+            raise ValueError("At least one shard is required.")
+        if shared in shards:
+            raise ValueError("The shared keyspace must not be one of the shards.")
+
+        self.shards = list(shards)
+        self.shared = shared
+
+    @classmethod
+    def from_config(cls, config_file: Text) -> "ShardRouter":
+        """
+        Reads the shards from a json file, e.g.
+            {
+              "shared": {"uri": "localhost:48555", "keyspace": "banking_shared"},
+              "shards": [
+                {"uri": "localhost:48555", "keyspace": "banking_0"},
+                {"uri": ["grakn-1:48555", "grakn-2:48555"], "keyspace": "banking_1"}
+              ]
+            }
+
+        :param config_file: path to the json file
+        :return: the router
+        """
+        with open(config_file, encoding="utf-8") as f:
+            config = json.load(f)
+
+        def to_shard(shard):
+            # a list of uris are the primary and the read replicas of the shard
+            uri = shard["uri"]
+            return Shard(uri if isinstance(uri, str) else tuple(uri), shard["keyspace"])
+
+        return cls([to_shard(s) for s in config["shards"]], to_shard(config["shared"]))
+
+    @staticmethod
+    def _score(email: Text, shard: Shard) -> int:
+        # replicas of a shard do not change the assignment, only its primary counts
+        primary = shard.uri if isinstance(shard.uri, str) else shard.uri[0]
+        key = f"{email.lower()}|{primary}|{shard.keyspace}".encode("utf-8")
+        return int.from_bytes(hashlib.sha1(key).digest()[:8], "big")
+
+    def shard_of(self, email: Text) -> Shard:
+        """
+        Get the shard of the given customer.
+
+        :param email: email of the customer
+        :return: the shard
+        """
+        return max(self.shards, key=lambda shard: self._score(email, shard))
+
+
+class ShardedGraphDatabase(KnowledgeBase):
+    """
+    Knowledge base spread over several grakn keyspaces (see ShardRouter). Queries for
+    accounts, cards and transactions of the user go to the shard of the user, so
+    their cost depends on the data of that user only. Queries for banks, people and
+    the mapping tables go to the shared keyspace.
+
+    Writes follow the layout of knowledge_base/migrate.py: a bank is written to
+    the shared keyspace and to every shard, a person to the shared keyspace and
+    to the shard of the person, everything else to the shard of the user.
+    """
+
+    def __init__(
+        self,
+        router: ShardRouter,
+        me: Text = "mitchell.gillis@t-online.de",
+        **kwargs: Any,
+    ):
+        """
+        :param router: the router
+        :param me: email of the user
+        :param kwargs: arguments of the GraphDatabase of every shard, e.g. timeout
+        """
+        self.router = router
+        self.me = me
+        self.kwargs = kwargs
+
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def database(self, shard: Shard) -> GraphDatabase:
+        """
+        Get the graph database of the given shard.
+        """
+        if shard not in self._databases:
+            with self._lock:
+                if shard not in self._databases:
+                    self._databases[shard] = GraphDatabase(
+                        shard.uri, shard.keyspace, self.me, **self.kwargs
+                    )
+        return self._databases[shard]
+
+    def _route(self, entity_type: Text) -> GraphDatabase:
+        if entity_type in SHARED_ENTITY_TYPES:
+            return self.database(self.router.shared)
+        return self.database(self.router.shard_of(self.me))
+
+    def _route_write(self, thing_type: Text, key: Any) -> List[GraphDatabase]:
+        if thing_type == "bank":
+            shards = [self.router.shared] + self.router.shards
+        elif thing_type == "person":
+            shards = [self.router.shared, self.router.shard_of(str(key))]
+        else:
+            shards = [self.router.shard_of(self.me)]
+        return [self.database(shard) for shard in shards]
+
+    def get_entities(
+        self,
+        entity_type: Text,
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+        limit: int = 10,
+    ) -> List[Dict[Text, Any]]:
+        return self._route(entity_type).get_entities(entity_type, attributes, limit)
+
+    def get_attribute_of(
+        self, entity_type: Text, key_attribute: Text, entity: Text, attribute: Text
+    ) -> List[Any]:
+        return self._route(entity_type).get_attribute_of(
+            entity_type, key_attribute, entity, attribute
+        )
+
+    def validate_entity(
+        self, entity_type, entity, key_attribute, attributes
+    ) -> Optional[Dict[Text, Any]]:
+        return self._route(entity_type).validate_entity(
+            entity_type, entity, key_attribute, attributes
+        )
+
+    def map(self, mapping_type: Text, mapping_key: Text) -> Text:
+        return self.database(self.router.shared).map(mapping_type, mapping_key)
+
+    def search_transactions(
+        self, text: Text, account: Optional[Text] = None, limit: int = 10
+    ) -> List[Dict[Text, Any]]:
+        return self._route("transaction").search_transactions(text, account, limit)
+
+    def get_transaction_rollups(
+        self,
+        granularity: Text = "month",
+        account: Optional[Text] = None,
+        category: Optional[Text] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> List[Dict[Text, Any]]:
+        return self._route("transaction").get_transaction_rollups(
+            granularity, account, category, start, end
+        )
+
+    def traverse(
+        self,
+        start_type: Text,
+        key: Any,
+        path: List[Text],
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+    ) -> List[Dict[Text, Any]]:
+        # the relations of a customer are stored in the shard of the customer
+        return self.database(self.router.shard_of(self.me)).traverse(
+            start_type, key, path, attributes
+        )
+
+    def warm_up(self):
+        self.database(self.router.shared).warm_up()
+        self.database(self.router.shard_of(self.me)).warm_up()
+
+    def close(self):
+        for database in self._databases.values():
+            database.close()
+
+    def insert_entity(self, entity_type: Text, attributes: Dict[Text, Any]) -> Future:
+        key = attributes.get(key_attribute_of(entity_type))
+        return _gather(
+            [
+                database.insert_entity(entity_type, attributes)
+                for database in self._route_write(entity_type, key)
+            ]
+        )
+
+    def insert_relation(
+        self,
+        relation_type: Text,
+        role_players: Dict[Text, Any],
+        attributes: Dict[Text, Any],
+    ) -> Future:
+        # the relations of a customer are stored in the shard of the customer
+        return self.database(self.router.shard_of(self.me)).insert_relation(
+            relation_type, role_players, attributes
+        )
+
+    def update_attribute(
+        self, thing_type: Text, key: Any, attribute: Text, value: Any
+    ) -> Future:
+        return _gather(
+            [
+                database.update_attribute(thing_type, key, attribute, value)
+                for database in self._route_write(thing_type, key)
+            ]
+        )
+
+    def delete(self, thing_type: Text, key: Any) -> Future:
+        return _gather(
+            [
+                database.delete(thing_type, key)
+                for database in self._route_write(thing_type, key)
+            ]
+        )
@@ -0,0 +1,689 @@
+import argparse
+import bisect
+import csv
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Text
+
+import numpy as np
+
+from graph_database import GraphDatabase, KnowledgeBase, _parse_value
+from rows import row_class
+from schema import attribute_types, mapping_types, relations, schema
+from rollups import RollupTable
+from search_index import SEARCH_FIELDS, InvertedIndex, tokenize
+from traversal import parse_path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+ENTITY_TYPES = ["bank", "person", "account", "card"]
+
+
+class StringColumn(object):
+    """
+    Dictionary encoded string column. Every row holds the code of its value, the
+    distinct values are stored sorted in one utf-8 buffer, so that the code of a
+    value is found by binary search without decoding the whole column.
+    """
+
+    def __init__(self, codes: np.ndarray, offsets: np.ndarray, data: np.ndarray):
+        self.codes = codes
+        self.offsets = offsets
+        self.data = data
+
+    def value(self, code: int) -> Text:
+        start, end = self.offsets[code], self.offsets[code + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def code_of(self, value: Text) -> Optional[int]:
+        """
+        Get the code of the given value.
+
+        :param value: the value
+        :return: the code or None if no row has this value
+        """
+        encoded = value.encode("utf-8")
+        values = _EncodedValues(self)
+        code = bisect.bisect_left(values, encoded)
+        if code < len(values) and values[code] == encoded:
+            return code
+        return None
+
+    def __getitem__(self, row: int) -> Text:
+        return self.value(self.codes[row])
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class _EncodedValues(object):
+    """
+    Sequence view on the encoded values of a string column, used for bisect.
+    """
+
+    def __init__(self, column: StringColumn):
+        self.column = column
+
+    def __getitem__(self, code: int) -> bytes:
+        start, end = self.column.offsets[code], self.column.offsets[code + 1]
+        return self.column.data[start:end].tobytes()
+
+    def __len__(self):
+        return len(self.column.offsets) - 1
+
+
+def read_csv_tables(data_path: Text):
+    """
+    Reads the csv files used by knowledge_base/migrate.py.
+
+    :param data_path: directory containing the csv files
+    :return: columns per entity and relation type, mapping tables
+    """
+
+    def read(file_name):
+        with open(os.path.join(data_path, file_name + ".csv")) as data:
+            reader = csv.reader(data, skipinitialspace=True)
+            header = next(reader)
+            columns = list(zip(*reader))
+            return {h: list(c) for h, c in zip(header, columns)}
+
+    tables = {t: read(t) for t in ENTITY_TYPES + list(relations.keys())}
+
+    mappings = {}
+    for mapping_type in mapping_types:
+        columns = read(mapping_type.replace("-", "_"))
+        mappings[mapping_type] = dict(
+            zip(columns["mapping-key"], columns["mapping-value"])
+        )
+
+    return tables, mappings
+
+
+def read_grakn_tables(graph_database: GraphDatabase):
+    """
+    Reads all entities, relations and mapping tables of the keyspace.
+
+    :param graph_database: the graph database
+    :return: columns per entity and relation type, mapping tables
+    """
+
+    def to_columns(rows):
+        names = sorted({k for row in rows for k in row.keys()} - {"id", "type"})
+        return {name: [row.get(name) for row in rows] for name in names}
+
+    tables = {}
+    for entity_type in ENTITY_TYPES:
+        rows = graph_database._execute_entity_query(
+            f"match ${entity_type} isa {entity_type}; get;"
+        )
+        tables[entity_type] = to_columns(rows)
+
+    for relation, roles in relations.items():
+        rows = graph_database._execute_relation_query(
+            f"match ${relation} isa {relation}; get ${relation};", relation
+        )
+        # role players are referenced by their key
+        for row in rows:
+            for role, entity_type in roles.items():
+                row[role] = row[role][schema[entity_type]["key"]]
+        tables[relation] = to_columns(rows)
+
+    mappings = {}
+    for mapping_type in mapping_types:
+        mappings[mapping_type] = graph_database._load_mapping_table(mapping_type)
+
+    return tables, mappings
+
+
+def _to_array(attribute: Text, values: List[Any]) -> np.ndarray:
+    datatype = attribute_types.get(attribute, "string")
+
+    if datatype == "date":
+        return np.array(values, dtype="datetime64[us]")
+    if datatype == "double":
+        return np.asarray(values, dtype=np.float64)
+    if datatype == "long":
+        return np.asarray(values, dtype=np.int64)
+    if datatype == "boolean":
+        return np.array([v is True or v == "true" for v in values], dtype=bool)
+    return np.asarray(values, dtype=object)
+
+
+def write_snapshot(tables, mappings, path: Text):
+    """
+    Writes the tables as columnar arrays to the given directory. Strings are
+    dictionary encoded, role players of relations are stored as row numbers of
+    the entity tables.
+
+    :param tables: columns per entity and relation type
+    :param mappings: mapping tables
+    :param path: directory of the snapshot
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = {"version": SNAPSHOT_VERSION, "tables": {}, "mappings": mappings}
+
+    def save(name, array):
+        np.save(os.path.join(path, name + ".npy"), array, allow_pickle=False)
+
+    keys = {}
+    for table in ENTITY_TYPES + list(relations.keys()):
+        columns = tables[table]
+        roles = relations.get(table, {})
+        kinds = {}
+
+        for name, values in columns.items():
+            file_name = f"{table}.{name}"
+
+            if name in roles:
+                # resolve the keys of the role players to row numbers
+                sorted_keys, sorter = keys[roles[name]]
+                values = np.asarray(values)
+                if sorted_keys.dtype.kind in "iuf":
+                    values = values.astype(sorted_keys.dtype)
+                positions = np.minimum(
+                    np.searchsorted(sorted_keys, values), len(sorter) - 1
+                )
+                missing = np.count_nonzero(sorted_keys[positions] != values)
+                if missing:
+                    raise ValueError(
+                        f"{missing} role players '{name}' of '{table}' do not exist."
+                    )
+                save(file_name, sorter[positions].astype(np.int32))
+                kinds[name] = "role:" + roles[name]
+                continue
+
+            array = _to_array(name, values)
+
+            if array.dtype == object:
+                distinct, codes = np.unique(array.astype(str), return_inverse=True)
+                encoded = [v.encode("utf-8") for v in distinct]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(v) for v in encoded], out=offsets[1:])
+                save(file_name + ".codes", codes.astype(np.int32))
+                save(file_name + ".offsets", offsets)
+                save(file_name + ".data", np.frombuffer(b"".join(encoded), np.uint8))
+                kinds[name] = "string"
+            else:
+                save(file_name, array)
+                kinds[name] = attribute_types[name]
+
+            if table in schema and name == schema[table]["key"]:
+                key_values = array.astype(str) if array.dtype == object else array
+                sorter = np.argsort(key_values, kind="stable")
+                keys[table] = (key_values[sorter], sorter)
+
+        rows = len(next(iter(columns.values()))) if columns else 0
+        manifest["tables"][table] = {"rows": rows, "columns": kinds}
+
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+class SnapshotGraph(KnowledgeBase):
+    """
+    Read-only knowledge base serving from a snapshot written by write_snapshot.
+    The columns are memory-mapped, so that loading takes no time and the pages
+    are shared by all processes serving from the same snapshot. Only the rows
+    returned by a query are converted to python objects.
+    """
+
+    def __init__(self, path: Text, me: Optional[Text] = "mitchell.gillis@t-online.de"):
+        self.path = path
+        self.me = me
+
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {manifest['version']}.")
+
+        self.mappings = manifest["mappings"]
+        self.rows = {t: m["rows"] for t, m in manifest["tables"].items()}
+        self.kinds = {t: m["columns"] for t, m in manifest["tables"].items()}
+        self.columns = {
+            t: {name: self._load(t, name, kind) for name, kind in kinds.items()}
+            for t, kinds in self.kinds.items()
+        }
+
+        # every account has one contract, the contract holds its bank and owner
+        self._contract_of_account = np.full(self.rows["account"], -1, np.int64)
+        self._contract_of_account[self.columns["contract"]["offer"]] = np.arange(
+            self.rows["contract"]
+        )
+        self._my_accounts = None
+        self._my_cards = None
+        self._token_indexes = {}
+        self._my_transactions = None
+        self._rollup_table = None
+
+    def _load(self, table: Text, name: Text, kind: Text):
+        def load(file_name):
+            return np.load(
+                os.path.join(self.path, file_name + ".npy"),
+                mmap_mode="r",
+                allow_pickle=False,
+            )
+
+        if kind == "string":
+            return StringColumn(
+                load(f"{table}.{name}.codes"),
+                load(f"{table}.{name}.offsets"),
+                load(f"{table}.{name}.data"),
+            )
+        return load(f"{table}.{name}")
+
+    def _value(self, table: Text, name: Text, row: int) -> Any:
+        kind = self.kinds[table][name]
+        column = self.columns[table][name]
+
+        if kind == "string":
+            return column[row]
+        if kind.startswith("role:"):
+            return self._entity(kind[5:], int(column[row]), role_player=True)
+        if kind == "date":
+            return column[row].astype("datetime64[us]").item()
+        return column[row].item()
+
+    def _entity(
+        self, table: Text, row: int, role_player: bool = False
+    ) -> Dict[Text, Any]:
+        """
+        Converts a row of the table to a row (see rows.py), in the same shape as
+        the results of GraphDatabase. Listed accounts also hold their bank and owner.
+        """
+        entity = row_class(table)()
+        for name in self.kinds[table]:
+            entity[name] = self._value(table, name, row)
+
+        if table == "account" and not role_player:
+            contract = self._contract_of_account[row]
+            if contract >= 0:
+                for role in ["provider", "customer"]:
+                    entity[role] = self._value("contract", role, contract)
+
+        return entity
+
+    def _matches(self, table: Text, name: Text, value: Any) -> np.ndarray:
+        """
+        Get a boolean mask of the rows of the table having the given value.
+        """
+        kind = self.kinds[table].get(name)
+
+        if kind is None or kind.startswith("role:"):
+            return np.zeros(self.rows[table], dtype=bool)
+
+        column = self.columns[table][name]
+
+        if kind == "string":
+            code = column.code_of(str(value))
+            if code is None:
+                return np.zeros(self.rows[table], dtype=bool)
+            return column.codes == code
+
+        try:
+            if isinstance(value, str):
+                value = _parse_value(name, value)
+            if kind == "date":
+                value = np.datetime64(value, "us")
+        except ValueError:
+            return np.zeros(self.rows[table], dtype=bool)
+        return column == value
+
+    def _related_to_me(self, table: Text) -> Optional[np.ndarray]:
+        """
+        Get a boolean mask of the rows of the table related to me, or None if all
+        rows are.
+        """
+        if self.me is None or table in ["person", "bank"]:
+            return None
+
+        if self._my_accounts is None:
+            me = np.flatnonzero(self._matches("person", "email", self.me))
+            contracts = self.columns["contract"]
+            self._my_accounts = np.asarray(
+                contracts["offer"][np.isin(contracts["customer"], me)]
+            )
+            represented_by = self.columns["represented-by"]
+            self._my_cards = np.asarray(
+                represented_by["bank-card"][
+                    np.isin(represented_by["bank-account"], self._my_accounts)
+                ]
+            )
+
+        if table == "account":
+            mask = np.zeros(self.rows[table], dtype=bool)
+            mask[self._my_accounts] = True
+            return mask
+        if table == "card":
+            mask = np.zeros(self.rows[table], dtype=bool)
+            mask[self._my_cards] = True
+            return mask
+        if table == "transaction":
+            creators = self.columns[table]["account-of-creator"]
+            return np.isin(creators, self._my_accounts)
+        return None
+
+    def _select(
+        self,
+        table: Text,
+        attributes: Optional[List[Dict[Text, Any]]] = None,
+        key: Optional[Any] = None,
+        mine: bool = True,
+    ) -> np.ndarray:
+        """
+        Get the row numbers of the rows of the table that are related to me (unless
+        mine is False) and have all given attribute values (and the given key).
+        """
+        if table not in self.rows:
+            return np.zeros(0, dtype=np.int64)
+
+        mask = self._related_to_me(table) if mine else None
+        if mask is None:
+            mask = np.ones(self.rows[table], dtype=bool)
+
+        conditions = list(attributes or [])
+        if key is not None:
+            conditions.append({"key": schema[table]["key"], "value": key})
+
+        for condition in conditions:
+            mask &= self._matches(table, condition["key"], condition["value"])
+
+        return np.flatnonzero(mask)
+
+    def _sorted(self, table: Text, rows: np.ndarray) -> np.ndarray:
+        sort_by = schema.get(table, {}).get("sort_by")
+
+        if sort_by is None or sort_by not in self.columns[table]:
+            return rows
+
+        column = self.columns[table][sort_by]
+        # codes of strings are ordered like the strings themselves
+        values = column.codes if isinstance(column, StringColumn) else column
+        order = np.argsort(np.asarray(values[rows]), kind="stable")
+        if schema[table].get("sort_descending", False):
+            order = order[::-1]
+        return rows[order]
+
+    def get_entities(
+        self,
+        entity_type: Text,
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+        limit: int = 5,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Query the snapshot for entities of the given type. Restrict the entities
+        by the provided attributes, if any attributes are given.
+
+        :param entity_type: the entity type
+        :param attributes: list of attributes
+        :param limit: maximum number of entities to return
+
+        :return: list of entities
+        """
+        rows = self._select(entity_type, attributes)
+
+        sort_by = schema.get(entity_type, {}).get("sort_by", "")
+        if "." in sort_by:
+            # sorted by an attribute of a role player, e.g. provider.name
+            entities = [self._entity(entity_type, int(r)) for r in rows]
+            return self._sort_entities(entity_type, entities)[:limit]
+
+        rows = self._sorted(entity_type, rows)
+
+        # transactions are not limited, see GraphDatabase.get_entities
+        if entity_type != "transaction":
+            rows = rows[:limit]
+
+        return [self._entity(entity_type, int(r)) for r in rows]
+
+    def get_attribute_of(
+        self, entity_type: Text, key_attribute: Text, entity: Text, attribute: Text
+    ) -> List[Any]:
+        """
+        Get the value of the given attribute for the provided entity.
+
+        :param entity_type: entity type
+        :param key_attribute: key attribute of entity
+        :param entity: name of the entity
+        :param attribute: attribute of interest
+
+        :return: the value of the attribute
+        """
+        rows = self._select(entity_type, [{"key": key_attribute, "value": entity}])
+
+        if len(rows) != 1 or attribute not in self.kinds[entity_type]:
+            return []
+
+        return [self._value(entity_type, attribute, int(rows[0]))]
+
+    def validate_entity(
+        self, entity_type, entity, key_attribute, attributes
+    ) -> Optional[Dict[Text, Any]]:
+        """
+        Validates if the given entity has all provided attribute values.
+
+        :param entity_type: entity type
+        :param entity: name of the entity
+        :param key_attribute: key attribute of entity
+        :param attributes: attributes
+
+        :return: the found entity
+        """
+        # like the other knowledge bases, any entity is validated, not only mine
+        rows = self._select(
+            entity_type,
+            list(attributes or []) + [{"key": key_attribute, "value": entity}],
+            mine=False,
+        )
+
+        if len(rows) != 1:
+            return None
+
+        return self._entity(entity_type, int(rows[0]))
+
+    def _token_index(self, name: Text) -> InvertedIndex:
+        """
+        Get the inverted index of a string column of the transactions. The distinct
+        values are indexed, the documents are their codes.
+        """
+        if name not in self._token_indexes:
+            column = self.columns["transaction"][name]
+            index = InvertedIndex()
+            for code in range(len(column.offsets) - 1):
+                index.add(code, [column.value(code)])
+            self._token_indexes[name] = index
+        return self._token_indexes[name]
+
+    def _get_my_transactions(self) -> np.ndarray:
+        # the snapshot does not change, my transactions are selected once
+        if self._my_transactions is None:
+            mask = self._related_to_me("transaction")
+            self._my_transactions = (
+                np.arange(self.rows["transaction"])
+                if mask is None
+                else np.flatnonzero(mask)
+            )
+        return self._my_transactions
+
+    def search_transactions(
+        self, text: Text, account: Optional[Text] = None, limit: int = 10
+    ) -> List[Dict[Text, Any]]:
+        """
+        Search the transactions by their reference and category (see
+        search_index.py). The tokens are looked up in the index of the distinct
+        values, the matching rows are selected by their codes.
+
+        :param text: the search text
+        :param account: account number, only transactions created by this account
+                        are returned (default: all my accounts)
+        :param limit: maximum number of transactions to return
+
+        :return: the matching transactions, latest first
+        """
+        terms = tokenize(text)
+        if not terms or "transaction" not in self.rows:
+            return []
+
+        rows = self._get_my_transactions()
+        if account is not None:
+            accounts = np.flatnonzero(
+                self._matches("account", "account-number", account)
+            )
+            creators = self.columns["transaction"]["account-of-creator"]
+            rows = rows[np.isin(creators[rows], accounts)]
+
+        for term in terms:
+            matches = np.zeros(len(rows), dtype=bool)
+            for name in SEARCH_FIELDS:
+                if self.kinds["transaction"].get(name) != "string":
+                    continue
+                column = self.columns["transaction"][name]
+                hits = np.zeros(len(column.offsets) - 1, dtype=bool)
+                hits[list(self._token_index(name).lookup(term))] = True
+                matches |= hits[column.codes[rows]]
+            rows = rows[matches]
+
+        rows = self._sorted("transaction", rows)[:limit]
+        return [self._entity("transaction", int(r)) for r in rows]
+
+    def _get_rollup_table(self) -> RollupTable:
+        if self._rollup_table is None:
+            creators = self.columns["transaction"]["account-of-creator"]
+            self._rollup_table = RollupTable.from_transactions(
+                {
+                    "account-of-creator": self._value(
+                        "account", "account-number", int(creators[row])
+                    ),
+                    **{
+                        name: self._value("transaction", name, int(row))
+                        for name in ["category", "amount", "execution-date"]
+                    },
+                }
+                for row in self._get_my_transactions()
+            )
+        return self._rollup_table
+
+    def get_transaction_rollups(
+        self,
+        granularity: Text = "month",
+        account: Optional[Text] = None,
+        category: Optional[Text] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Get the sum, count, minimum and maximum of the amounts of my transactions
+        per account, category and day or month (see rollups.py). The rollups are
+        computed from the snapshot on first use.
+
+        :param granularity: 'day' or 'month'
+        :param account: account number, only the buckets of this account are
+                        returned (default: all my accounts)
+        :param category: only buckets of this category (default: all categories)
+        :param start: first day or month, e.g. '2019-11' (default: no limit)
+        :param end: last day or month, inclusive (default: no limit)
+
+        :return: the buckets ordered by period, account and category
+        """
+        if "transaction" not in self.rows:
+            return []
+
+        return self._get_rollup_table().query(
+            {str(account)} if account is not None else None,
+            granularity=granularity,
+            category=category,
+            start=start,
+            end=end,
+        )
+
+    def traverse(
+        self,
+        start_type: Text,
+        key: Any,
+        path: List[Text],
+        attributes: Optional[List[Dict[Text, Text]]] = None,
+    ) -> List[Dict[Text, Any]]:
+        """
+        Walks from a thing along a path of relation roles (see traversal.py). The
+        role players of the relations are stored as row numbers, every step
+        selects the rows of the next type at once.
+
+        :param start_type: type of the first thing, e.g. 'card'
+        :param key: value of the key attribute of the first thing
+        :param path: steps over relation roles (see traversal.py)
+        :param attributes: attributes the things at the end need to have
+
+        :return: the things at the end of the path
+        """
+        steps = parse_path(start_type, path)
+
+        rows = self._select(start_type, key=key)
+        table = start_type
+        for step in steps:
+            column = self.columns[step.relation][step.role]
+            if step.kind == "enter":
+                rows = np.flatnonzero(np.isin(column, rows))
+                table = step.relation
+            else:
+                rows = np.unique(np.asarray(column[rows]))
+                table = relations[step.relation][step.role]
+
+        mask = np.zeros(self.rows[table], dtype=bool)
+        mask[rows] = True
+        for condition in attributes or []:
+            mask &= self._matches(table, condition["key"], condition["value"])
+
+        things = [self._entity(table, int(r)) for r in np.flatnonzero(mask)]
+        return self._sort_entities(table, things)
+
+    def warm_up(self):
+        """
+        Selects my accounts, cards and transactions and builds the search indexes
+        and the rollup table, e.g. before the workers of a pre-forked action server
+        share them.
+        """
+        if all(t in self.rows for t in ["account", "contract", "represented-by"]):
+            self._related_to_me("account")
+
+        if "transaction" in self.rows:
+            self._get_my_transactions()
+            for name in SEARCH_FIELDS:
+                if self.kinds["transaction"].get(name) == "string":
+                    self._token_index(name)
+            self._get_rollup_table()
+
+    def map(self, mapping_type: Text, mapping_key: Text) -> Text:
+        """
+        Query the given mapping table for the provided key.
+
+        :param mapping_type: the name of the mapping table
+        :param mapping_key: the mapping key
+
+        :return: the mapping value
+        """
+        return self.mappings.get(mapping_type, {}).get(mapping_key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the knowledge base to a memory-mappable snapshot."
+    )
+    parser.add_argument("output", help="directory of the snapshot")
+    parser.add_argument(
+        "--data-path", help="export the csv files in this directory instead of Grakn"
+    )
+    parser.add_argument("--uri", default="localhost:48555")
+    parser.add_argument("--keyspace", default="banking")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.data_path:
+        tables, mappings = read_csv_tables(args.data_path)
+    else:
+        tables, mappings = read_grakn_tables(GraphDatabase(args.uri, args.keyspace))
+    write_snapshot(tables, mappings, args.output)
+    print(f"Exported the snapshot to [{args.output}] in {time.time() - start:.1f}s.")
@@ -0,0 +1,149 @@
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Text
+
+from profiling import get_profiler
+
+logger = logging.getLogger(__name__)
+
+# Enables the warm-up of the action server when set to 'true'.
+WARM_UP_ENV = "ACTION_WARM_UP"
+# Port of the health endpoints, setting it also enables the warm-up.
+READINESS_PORT_ENV = "ACTION_READINESS_PORT"
+
+ready = threading.Event()
+_status = {}
+
+
+def warm_up(
+    tasks: Dict[Text, Callable], max_backoff: float = 30.0, max_workers: int = 8
+):
+    """
+    Runs the warm-up tasks concurrently. Failed tasks, e.g. because the graph
+    database is not reachable yet, are retried with exponential backoff until all
+    of them succeeded. Afterwards the action server is reported as ready.
+
+    :param tasks: warm-up tasks by name
+    :param max_backoff: maximum seconds to wait between two attempts
+    :param max_workers: maximum number of tasks running at the same time
+    """
+    pending = dict(tasks)
+    backoff = 0.5
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending:
+            futures = {name: executor.submit(task) for name, task in pending.items()}
+            for name, future in futures.items():
+                try:
+                    future.result()
+                    _status[name] = "done"
+                    del pending[name]
+                except Exception as e:
+                    _status[name] = f"failed: {e}"
+                    logger.warning(f"Warm-up task '{name}' failed: {e}")
+
+            if pending:
+                time.sleep(backoff)
+                backoff = min(2 * backoff, max_backoff)
+
+    logger.info(f"Warmed up the action server in {time.perf_counter() - start:.2f}s.")
+    ready.set()
+
+
+class HealthHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the health of the action server:
+      /health/live     200 as soon as the process runs
+      /health/ready    200 once warmed up, 503 while warming up
+    and the admin endpoint of the profiler (see profiling.py):
+      GET /admin/profiling            rate and number of samples per action
+      POST /admin/profiling?rate=0.1  profile 10% of the action runs, rate=0
+                                      stops profiling and writes the profiles
+    """
+
+    def do_GET(self):
+        if self.path == "/health/live":
+            self._respond(200, {"status": "live"})
+        elif self.path == "/admin/profiling":
+            self._respond(200, get_profiler().status())
+        elif self.path == "/health/ready":
+            if ready.is_set():
+                self._respond(200, {"status": "ready", "tasks": _status})
+            else:
+                self._respond(503, {"status": "warming up", "tasks": _status})
+        else:
+            self._respond(404, {"status": "not found"})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/admin/profiling":
+            self._respond(404, {"status": "not found"})
+            return
+
+        rate = urllib.parse.parse_qs(url.query).get("rate", [""])[0]
+        try:
+            get_profiler().set_rate(float(rate))
+        except ValueError:
+            self._respond(400, {"status": f"invalid rate '{rate}'"})
+            return
+        self._respond(200, get_profiler().status())
+
+    def _respond(self, status: int, body: Dict):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve_health(port: int) -> http.server.HTTPServer:
+    """
+    Serves the health endpoints in a background thread.
+
+    :param port: port to listen on
+    :return: the server
+    """
+    server = http.server.ThreadingHTTPServer(("", port), HealthHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Serving health endpoints on port {port}.")
+    return server
+
+
+def start(
+    tasks_factory: Callable[[], Dict[Text, Callable]],
+) -> Optional[threading.Thread]:
+    """
+    Starts the warm-up in the background, if enabled by the environment variables
+    ACTION_WARM_UP or ACTION_READINESS_PORT. The action server itself accepts
+    requests right away, a load balancer should route traffic to the replica only
+    once /health/ready reports it as ready.
+
+    :param tasks_factory: function returning the warm-up tasks by name
+    :return: the warm-up thread or None if the warm-up is disabled
+    """
+    port = os.environ.get(READINESS_PORT_ENV)
+    enabled = os.environ.get(WARM_UP_ENV, "false").lower() == "true"
+    if not port and not enabled:
+        ready.set()
+        return None
+
+    if port:
+        serve_health(int(port))
+
+    thread = threading.Thread(
+        target=warm_up, args=(tasks_factory(),), name="warm-up", daemon=True
+    )
+    thread.start()
+    return thread
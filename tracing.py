@@ -0,0 +1,369 @@
+import argparse
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Text
+
+logger = logging.getLogger(__name__)
+
+# Enables tracing of the action server. Supported values:
+#   file:<path>          append finished traces as json lines to <path>
+#   collector:<url>      post finished traces in the OTLP/JSON format to <url>,
+#                        e.g. collector:http://localhost:4318/v1/traces
+TRACING_ENV = "ACTION_TRACING"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span(object):
+    """
+    A timed operation within a trace. Spans are nested: every span knows the span
+    it was started in and all spans of one action run share the same trace id.
+    """
+
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "start_time",
+        "duration",
+        "_start_counter",
+        "_spans",
+    )
+
+    def __init__(
+        self,
+        trace_id: Text,
+        parent_id: Optional[Text],
+        name: Text,
+        attributes: Dict[Text, Any],
+        spans: List["Span"],
+    ):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_time = time.time_ns()
+        self.duration = None
+        self._start_counter = time.perf_counter_ns()
+        self._spans = spans
+
+    def set_attribute(self, key: Text, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.duration = time.perf_counter_ns() - self._start_counter
+        self._spans.append(self)
+
+    def as_dict(self) -> Dict[Text, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration / 1e6,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter(object):
+    def export(self, spans: List[Span]):
+        raise NotImplementedError("Method is not implemented.")
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends every finished span as a json line to a local file.
+    """
+
+    def __init__(self, file_name: Text):
+        self.file_name = file_name
+
+    def export(self, spans: List[Span]):
+        with open(self.file_name, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.as_dict(), default=str) + "\n")
+
+
+class CollectorSpanExporter(SpanExporter):
+    """
+    Posts finished spans in the OTLP/JSON format to an OpenTelemetry compatible
+    collector (or anything that accepts the same payload).
+    """
+
+    def __init__(self, url: Text, service_name: Text = "action-server"):
+        self.url = url
+        self.service_name = service_name
+
+    def _to_otlp(self, span: Span) -> Dict[Text, Any]:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_time),
+            "endTimeUnixNano": str(span.start_time + span.duration),
+            "attributes": [
+                {"key": k, "value": {"stringValue": str(v)}}
+                for k, v in span.attributes.items()
+            ],
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        return otlp_span
+
+    def export(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [self._to_otlp(s) for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+
+class Tracer(object):
+    """
+    Creates spans and hands finished traces over to the exporter. Exporting happens
+    on a background thread, so that the action run does not wait for the exporter.
+    If no exporter is configured, tracing is a no-op.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+        self._queue = queue.Queue()
+        self._worker = None
+
+        if exporter is not None:
+            self._worker = threading.Thread(target=self._export_loop, daemon=True)
+            self._worker.start()
+
+    def _export_loop(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                logger.warning(f"Failed to export trace: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Blocks until all finished traces are exported.
+        """
+        if self._worker is not None:
+            self._queue.join()
+
+    def start_trace(self, name: Text, **attributes: Any) -> "_SpanContext":
+        """
+        Starts a new trace, e.g. for one action run. All spans created within the
+        trace are exported together once the trace is finished.
+
+        :param name: name of the root span
+        :param attributes: attributes of the root span
+        """
+        return _SpanContext(self, name, attributes, new_trace=True)
+
+    def span(self, name: Text, **attributes: Any) -> "_SpanContext":
+        """
+        Starts a span nested in the currently active span. Outside of a trace no
+        span is recorded.
+
+        :param name: name of the span
+        :param attributes: attributes of the span
+        """
+        return _SpanContext(self, name, attributes, new_trace=False)
+
+
+class _SpanContext(object):
+    def __init__(
+        self, tracer: Tracer, name: Text, attributes: Dict[Text, Any], new_trace: bool
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.new_trace = new_trace
+        self.span = None
+        self._token = None
+
+    def __enter__(self) -> Optional[Span]:
+        if self.tracer.exporter is None:
+            return None
+
+        parent = _current_span.get()
+
+        if self.new_trace:
+            self.span = Span(uuid.uuid4().hex, None, self.name, self.attributes, [])
+        elif parent is not None:
+            self.span = Span(
+                parent.trace_id,
+                parent.span_id,
+                self.name,
+                self.attributes,
+                parent._spans,
+            )
+        else:
+            return None
+
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.span is None:
+            return
+
+        if exc_type is not None:
+            self.span.set_attribute("error", exc_type.__name__)
+
+        self.span.finish()
+        _current_span.reset(self._token)
+
+        if self.new_trace:
+            self.tracer._queue.put(self.span._spans)
+
+
+def _create_exporter(config: Optional[Text]) -> Optional[SpanExporter]:
+    if not config:
+        return None
+
+    kind, _, target = config.partition(":")
+
+    if kind == "file":
+        return FileSpanExporter(target or "traces.jsonl")
+    if kind == "collector":
+        return CollectorSpanExporter(target)
+
+    logger.warning(f"Unknown value '{config}' for {TRACING_ENV}. Tracing is disabled.")
+    return None
+
+
+_tracer = None
+
+
+def get_tracer() -> Tracer:
+    """
+    Get the tracer of the action server. The exporter is configured by the
+    environment variable ACTION_TRACING.
+    """
+    global _tracer
+
+    if _tracer is None:
+        _tracer = Tracer(_create_exporter(os.environ.get(TRACING_ENV)))
+    return _tracer
+
+
+def traced(name: Optional[Text] = None) -> Callable:
+    """
+    Decorator that records every call of the decorated function as a span.
+
+    :param name: name of the span, defaults to the name of the function
+    """
+
+    def decorator(f: Callable) -> Callable:
+        span_name = name or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_action(run: Callable) -> Callable:
+    """
+    Decorator for the run method of an action. Every run gets its own trace id.
+    """
+
+    @functools.wraps(run)
+    def wrapper(self, dispatcher, tracker, domain):
+        with get_tracer().start_trace(
+            self.name(), sender_id=tracker.sender_id
+        ) as span:
+            if span is not None:
+                span.set_attribute("trace_id", span.trace_id)
+            return run(self, dispatcher, tracker, domain)
+
+    return wrapper
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+def report(file_name: Text):
+    """
+    Prints latency percentiles per action and per span of a trace file written by
+    the FileSpanExporter.
+
+    :param file_name: trace file
+    """
+    actions = {}
+    durations = defaultdict(list)
+
+    with open(file_name, encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+
+    for span in spans:
+        if span["parent_id"] is None:
+            actions[span["trace_id"]] = span["name"]
+
+    for span in spans:
+        action = actions.get(span["trace_id"], "unknown")
+        durations[(action, span["name"])].append(span["duration_ms"])
+
+    print(f"{'action':<28}{'span':<36}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for (action, name), values in sorted(durations.items()):
+        print(
+            f"{action:<28}{name:<36}{len(values):>8}"
+            f"{_percentile(values, 50):>10.2f}"
+            f"{_percentile(values, 95):>10.2f}"
+            f"{_percentile(values, 99):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print latency percentiles (in ms) of a trace file."
+    )
+    parser.add_argument("file", help="trace file written with ACTION_TRACING=file:...")
+    args = parser.parse_args()
+
+    report(args.file)
@@ -0,0 +1,130 @@
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Text
+
+from schema import relations
+from writes import format_value, key_attribute_of
+
+# A step of a traversal: 'enter' goes from a thing to the relations of the given
+# type in which it plays the role, 'leave' goes from a relation to the thing
+# playing the role.
+Step = namedtuple("Step", ["kind", "relation", "role"])
+
+
+def parse_path(start_type: Text, path: List[Text]) -> List[Step]:
+    """
+    Parses a path over relation roles. Every element of the path is one of
+      '<relation>.<role>.<other role>'  from a thing playing the role in a relation
+                                        to the thing playing the other role, e.g.
+                                        'contract.offer.provider' from an account
+                                        to its bank
+      '<relation>.<role>'               from a thing to the relations in which it
+                                        plays the role, e.g.
+                                        'transaction.account-of-creator' from an
+                                        account to the transactions it created
+      '<role>'                          from a relation to the thing playing the
+                                        role, e.g. 'account-of-receiver' from a
+                                        transaction to the receiving account
+
+    :param start_type: type of the first thing
+    :param path: the path
+
+    :return: the steps
+    """
+    steps = []
+    current = start_type
+
+    for element in path:
+        parts = element.split(".")
+        if len(parts) == 1:
+            parts = [current] + parts
+        else:
+            steps.append(_enter(current, parts[0], parts[1]))
+            current = parts[0]
+            parts = parts[:1] + parts[2:]
+
+        if len(parts) == 2:
+            steps.append(_leave(current, parts[1]))
+            current = relations[current][parts[1]]
+        elif len(parts) != 1:
+            raise ValueError(f"Invalid step '{element}'.")
+
+    return steps
+
+
+def _enter(current: Text, relation: Text, role: Text) -> Step:
+    if relation not in relations or role not in relations[relation]:
+        raise ValueError(f"Unknown role '{role}' of '{relation}'.")
+    if relations[relation][role] != current:
+        raise ValueError(f"A {current} does not play '{role}' in '{relation}'.")
+    return Step("enter", relation, role)
+
+
+def _leave(current: Text, role: Text) -> Step:
+    if current not in relations or role not in relations[current]:
+        raise ValueError(f"A {current} has no role '{role}'.")
+    return Step("leave", current, role)
+
+
+def end_type(start_type: Text, steps: List[Step]) -> Text:
+    """
+    Get the type of the things the steps end at.
+    """
+    if not steps:
+        return start_type
+    step = steps[-1]
+    return (
+        step.relation if step.kind == "enter" else relations[step.relation][step.role]
+    )
+
+
+def traversal_query(
+    start_type: Text,
+    key: Any,
+    steps: List[Step],
+    attributes: Optional[List[Dict[Text, Text]]] = None,
+    start_clause: Text = "",
+) -> Text:
+    """
+    Compiles the traversal to a single graql query. The first thing is bound to
+    ${start_type}, the things reached by the steps to $hop1, $hop2, ..., the query
+    gets the last of them.
+
+    :param start_type: type of the first thing
+    :param key: value of the key attribute of the first thing
+    :param steps: the steps (see parse_path)
+    :param attributes: attributes the things at the end need to have
+    :param start_clause: graql clause restricting the first thing, e.g. to the
+                         things related to the user
+
+    :return: the graql query
+    """
+    key_attribute = key_attribute_of(start_type)
+    variable = f"${start_type}"
+    clauses = [
+        start_clause,
+        f"{variable} isa {start_type}, "
+        f"has {key_attribute} {format_value(key_attribute, key)};",
+    ]
+
+    for i, step in enumerate(steps, 1):
+        hop = f"$hop{i}"
+        following = steps[i] if i < len(steps) else None
+        if step.kind == "enter":
+            players = f"{step.role}: {variable}"
+            if following and following.kind == "leave":
+                # a step through the relation is matched by one relation pattern
+                players += f", {following.role}: $hop{i + 1}"
+            clauses.append(f"{hop}({players}) isa {step.relation};")
+        elif i == 1 or steps[i - 2].kind != "enter":
+            clauses.append(f"{variable}({step.role}: {hop}) isa {step.relation};")
+        variable = hop
+
+    if attributes:
+        clauses.append(
+            variable
+            + " "
+            + ", ".join(f"has {a['key']} '{a['value']}'" for a in attributes)
+            + ";"
+        )
+
+    return f"match {' '.join(c for c in clauses if c)} get {variable};"
@@ -1,24 +1,19 @@
-from grakn.client import GraknClient
+import os
 
+from graph_database import GraphDatabase
 
-def execute(graql_query):
-    print(graql_query)
-
-    with GraknClient(uri="localhost:48555") as client:
-        with client.session(keyspace="banking") as session:
-            with session.transaction().write() as transaction:
-                transaction.query(graql_query)
-                transaction.commit()
+# writes go to the primary, i.e. the first of the comma separated uris
+URI = os.environ.get("GRAKN_URI", "localhost:48555").split(",")[0]
 
 
 if __name__ == "__main__":
-    graql_insert_query = """
-    insert $b isa bank, has name 'KfW', has country 'Germany', has headquarters 'Frankfurt am Main';
-    """
-    execute(graql_insert_query)
+    graph_database = GraphDatabase(URI)
 
-    graql_delete_query = """
-    match $b isa bank, has name 'KfW'; delete $b;
-    """
-    #execute(graql_delete_query)
+    # typed writes (see writes.py), group-committed by a background writer; the
+    # change events are published once the writes are committed
+    graph_database.insert_entity(
+        "bank",
+        {"name": "KfW", "country": "Germany", "headquarters": "Frankfurt am Main"},
+    ).result()
 
+    graph_database.close()
@@ -0,0 +1,298 @@
+import datetime
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Text
+
+from schema import attribute_types, relations, schema
+
+logger = logging.getLogger(__name__)
+
+
+def format_value(attribute: Text, value: Any) -> Text:
+    """
+    Formats the value as graql literal of the datatype of the attribute (see
+    attribute_types in schema.py).
+
+    :param attribute: the attribute
+    :param value: the value, either of the datatype or its string representation
+
+    :return: the graql literal
+    """
+    datatype = attribute_types.get(attribute, "string")
+
+    if datatype == "date":
+        if isinstance(value, str):
+            value = datetime.datetime.fromisoformat(value)
+        return value.isoformat(timespec="milliseconds")
+    if datatype == "long":
+        return str(int(value))
+    if datatype == "double":
+        return repr(float(value))
+    if datatype == "boolean":
+        if isinstance(value, str):
+            value = value == "true"
+        return "true" if value else "false"
+
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{value}"'
+
+
+def key_attribute_of(thing_type: Text) -> Text:
+    if thing_type in schema:
+        return schema[thing_type]["key"]
+    if thing_type in relations:
+        return "identifier"
+    raise ValueError(f"Unknown type '{thing_type}'.")
+
+
+def _has_clause(attributes: Dict[Text, Any]) -> Text:
+    return "".join(
+        f", has {a} {format_value(a, v)}"
+        for a, v in attributes.items()
+        if v is not None
+    )
+
+
+def _match_clause(variable: Text, thing_type: Text, key: Any) -> Text:
+    key_attribute = key_attribute_of(thing_type)
+    return (
+        f"${variable} isa {thing_type}, "
+        f"has {key_attribute} {format_value(key_attribute, key)};"
+    )
+
+
+def insert_entity_query(entity_type: Text, attributes: Dict[Text, Any]) -> Text:
+    """
+    Graql query inserting an entity.
+
+    :param entity_type: entity type
+    :param attributes: attributes of the entity, including its key attribute
+    """
+    if entity_type not in schema or entity_type in relations:
+        raise ValueError(f"Unknown entity type '{entity_type}'.")
+    if attributes.get(key_attribute_of(entity_type)) is None:
+        raise ValueError(f"The key of the {entity_type} is missing.")
+
+    return f"insert $x isa {entity_type}{_has_clause(attributes)};"
+
+
+def insert_relation_query(
+    relation_type: Text, role_players: Dict[Text, Any], attributes: Dict[Text, Any]
+) -> Text:
+    """
+    Graql query inserting a relation between existing entities.
+
+    :param relation_type: relation type, e.g. 'transaction'
+    :param role_players: key of the entity playing the role by role, e.g.
+                         {'account-of-creator': 'DE89...', ...}
+    :param attributes: attributes of the relation, including its identifier
+    """
+    if relation_type not in relations:
+        raise ValueError(f"Unknown relation type '{relation_type}'.")
+    roles = relations[relation_type]
+    if set(role_players.keys()) != set(roles.keys()):
+        raise ValueError(
+            f"A {relation_type} requires the role players {sorted(roles.keys())}."
+        )
+
+    match = " ".join(
+        _match_clause(role, roles[role], key) for role, key in role_players.items()
+    )
+    players = ", ".join(f"{role}: ${role}" for role in role_players)
+
+    return (
+        f"match {match} "
+        f"insert $x({players}) isa {relation_type}{_has_clause(attributes)};"
+    )
+
+
+def update_attribute_queries(
+    thing_type: Text, key: Any, attribute: Text, value: Any
+) -> List[Text]:
+    """
+    Graql queries replacing the value of an attribute: the old value is detached
+    from the entity (the attribute itself might be owned by other entities), then
+    the new value is attached.
+
+    :param thing_type: entity or relation type
+    :param key: value of the key attribute of the entity
+    :param attribute: the attribute to update
+    :param value: the new value
+    """
+    if attribute == key_attribute_of(thing_type):
+        raise ValueError("The key attribute cannot be updated.")
+
+    match = _match_clause("x", thing_type, key)
+    return [
+        f"match {match} $x has {attribute} $a via $r; delete $r;",
+        f"match {match} insert $x has {attribute} {format_value(attribute, value)};",
+    ]
+
+
+def delete_query(thing_type: Text, key: Any) -> Text:
+    """
+    Graql query deleting an entity or relation.
+
+    :param thing_type: entity or relation type
+    :param key: value of the key attribute
+    """
+    return f"match {_match_clause('x', thing_type, key)} delete $x;"
+
+
+class NothingInserted(ValueError):
+    """
+    A match-insert query did not insert anything, e.g. because the role players
+    of a new relation do not exist.
+    """
+
+
+class Write(object):
+    """
+    Queries that are committed together, e.g. both queries of an attribute update.
+    The future is resolved once they are committed.
+    """
+
+    __slots__ = ("queries", "must_insert", "on_commit", "future")
+
+    def __init__(
+        self,
+        queries: List[Text],
+        must_insert: bool = False,
+        on_commit: Optional[Callable[[], None]] = None,
+    ):
+        self.queries = queries
+        self.must_insert = must_insert
+        self.on_commit = on_commit
+        self.future = Future()
+
+
+class GroupCommitWriter(object):
+    """
+    Background writer that commits queued writes in shared transactions. A batch
+    is committed once it holds max_batch writes or its first write waited for
+    max_delay seconds, whatever comes first. If a batch fails, its writes are
+    retried in separate transactions, so that one invalid write does not fail the
+    others.
+    """
+
+    def __init__(
+        self,
+        write_transaction: Callable,
+        max_batch: int = 100,
+        max_delay: float = 0.05,
+    ):
+        """
+        :param write_transaction: function returning a new write transaction as
+                                  context manager
+        :param max_batch: maximum number of writes per transaction
+        :param max_delay: maximum seconds a write waits for its batch to fill
+        """
+        self.write_transaction = write_transaction
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        queries: List[Text],
+        must_insert: bool = False,
+        on_commit: Optional[Callable[[], None]] = None,
+    ) -> Future:
+        """
+        Queues the queries to be committed together.
+
+        :param queries: graql queries
+        :param must_insert: the queries are match-inserts, the write fails with
+                            NothingInserted if one of them matches nothing
+        :param on_commit: called by the writer once the queries are committed,
+                          before the future is resolved
+        :return: future resolved once the queries are committed
+        """
+        write = Write(queries, must_insert, on_commit)
+        self._queue.put(write)
+        return write.future
+
+    def _next_batch(self) -> List[Optional[Write]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _commit(self, writes: List[Write]):
+        with self.write_transaction() as tx:
+            for write in writes:
+                for query in write.queries:
+                    logger.debug("Executing Graql Query: " + query)
+                    answers = list(tx.query(query))
+                    if write.must_insert and not answers:
+                        raise NothingInserted(f"Nothing matched by query: {query}")
+            tx.commit()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # cancelled writes are dropped, the others cannot be cancelled anymore
+            writes = [
+                w
+                for w in batch
+                if w is not None and w.future.set_running_or_notify_cancel()
+            ]
+
+            if len(writes) == 1:
+                self._commit_one_by_one(writes)
+            elif writes:
+                try:
+                    self._commit(writes)
+                except Exception as e:
+                    logger.warning(
+                        f"Failed to commit {len(writes)} writes ({e!r}), "
+                        f"retrying them one by one."
+                    )
+                    self._commit_one_by_one(writes)
+                else:
+                    for write in writes:
+                        self._resolve(write)
+
+            if batch[-1] is None:
+                return
+
+    def _commit_one_by_one(self, writes: List[Write]):
+        for write in writes:
+            try:
+                self._commit([write])
+            except Exception as e:
+                write.future.set_exception(e)
+            else:
+                self._resolve(write)
+
+    def _resolve(self, write: Write):
+        if write.on_commit is not None:
+            try:
+                write.on_commit()
+            except Exception as e:
+                logger.exception(f"Failed to handle the commit of {write.queries}: {e}")
+        write.future.set_result(None)
+
+    def close(self):
+        """
+        Commits the queued writes and stops the writer.
+        """
+        self._queue.put(None)
+        self._thread.join()